@@ -18,20 +18,27 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'inventory.middleware.MetricsMiddleware',  # Первым: замер всего запроса (inventory.metrics)
+    'inventory.middleware.SlowQueryMiddleware',  # Журнал медленных запросов, если включён INVENTORY_SLOW_QUERIES
+    'inventory.middleware.MemoryDiagnosticsMiddleware',  # Память по представлениям, если включена INVENTORY_MEMORY_DIAGNOSTICS
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',  # Для сессий
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',  # Для CSRF
     'django.contrib.auth.middleware.AuthenticationMiddleware',  # Для аутентификации
+    'inventory.middleware.ReplicaRoutingMiddleware',  # Отчёты с реплики, если включена INVENTORY_REPLICA
+    'inventory.middleware.ProfilingMiddleware',  # ?_profile=1 от суперпользователя — запрос под cProfile
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'inventory.middleware.LogBufferMiddleware',  # Журнал действий пишется одной пачкой в конце запроса
 ]
 
 ROOT_URLCONF = 'crm_system.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Обычный DjangoTemplates, который дополнительно меряет время рендера для метрик запроса
+        'BACKEND': 'inventory.template_backend.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -52,9 +59,27 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # Соединение живёт между запросами воркера: PRAGMA и разбор схемы не повторяются на каждый запрос
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Транзакции сразу берут блокировку на запись и ждут её (busy_timeout), а не падают при повышении
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    # Реплика для отчётов (inventory.replicas): копия default, обновляется командой sync_replica.
+    # Используется, только если включена INVENTORY_REPLICA; в тестах — то же, что default
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['inventory.replicas.ReplicaRouter']
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -102,3 +127,81 @@ LOGOUT_REDIRECT_URL = '/login/'   # Перенаправление после в
 SESSION_COOKIE_AGE = 1209600  # 2 недели в секундах
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 SESSION_SAVE_EVERY_REQUEST = True
+
+# Журнал действий (inventory.logsink): 'request' — пачкой в конце запроса,
+# 'queue' — фоновым потоком из ограниченной очереди, 'sync' — сразу при вызове
+INVENTORY_LOG_SINK = {
+    'MODE': 'request',
+    'QUEUE_SIZE': 10000,
+    'FLUSH_INTERVAL': 2.0,
+    'BATCH_SIZE': 500,
+}
+
+# Хранение журнала действий (inventory.logarchive, команды archive_logs и search_log_archive):
+# записи старше DAYS дней переносятся в помесячные gzip-архивы в ARCHIVE_DIR
+INVENTORY_LOG_RETENTION = {
+    'DAYS': 180,
+    'ARCHIVE_DIR': BASE_DIR / 'log_archive',
+    'CHUNK_SIZE': 1000,
+}
+
+# Метрики запросов (inventory.metrics): гистограммы задержки по имени URL, SQL и рендер шаблонов.
+# Отдаются администратору в формате Prometheus на /metrics/ и в заголовке Server-Timing
+INVENTORY_METRICS = {
+    'ENABLED': True,
+    'SERVER_TIMING': True,
+    'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+}
+
+# Журнал медленных запросов (inventory.slowqueries): запросы дольше THRESHOLD_MS с планом EXPLAIN
+# в кольцевом буфере на BUFFER_SIZE записей, просмотр — в админ-панели
+INVENTORY_SLOW_QUERIES = {
+    'ENABLED': False,
+    'THRESHOLD_MS': 100,
+    'BUFFER_SIZE': 200,
+    'EXPLAIN': True,
+}
+
+# Профилирование по запросу (inventory.profiling): суперпользователь добавляет ?_profile=1 (или заголовок
+# X-Profile: 1) — профиль сохраняется в DIR и доступен в админ-панели; ?_profile=summary возвращает сводку
+INVENTORY_PROFILING = {
+    'ENABLED': True,
+    'QUERY_PARAM': '_profile',
+    'HEADER': 'X-Profile',
+    'DIR': BASE_DIR / 'profiles',
+    'KEEP': 20,
+    'TOP': 40,
+}
+
+# Диагностика памяти (inventory.memory): пик tracemalloc по представлениям и строки кода, память которых
+# осталась занятой после запроса. Сильно замедляет процесс — включать только на время разбора
+INVENTORY_MEMORY_DIAGNOSTICS = {
+    'ENABLED': False,
+    'FRAMES': 10,
+    'SNAPSHOTS': True,
+    'TOP': 15,
+}
+
+# Рабочий профиль SQLite (inventory.sqlite): PRAGMA для каждого соединения и повтор записи с паузой
+# при «database is locked» для оформления продажи и пакетного добавления в корзину
+INVENTORY_SQLITE = {
+    'PRAGMAS': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,
+        'temp_store': 'MEMORY',
+    },
+    'RETRY_ATTEMPTS': 4,
+    'RETRY_BASE_DELAY': 0.05,
+    'RETRY_MAX_DELAY': 1.0,
+}
+
+# Чтение отчётов (статистика, журнал, список продаж) с реплики ALIAS (inventory.replicas). Реплику
+# обновляет sync_replica; после своей записи пользователь STICKY_SECONDS читает из default
+INVENTORY_REPLICA = {
+    'ENABLED': False,
+    'ALIAS': 'replica',
+    'STICKY_SECONDS': 30,
+}
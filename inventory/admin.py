@@ -1,6 +1,13 @@
 # inventory/admin.py
 from django.contrib import admin
-from .models import Category, Subcategory, Product, Warehouse, Sale, SaleItem, Cart, CartItem, UserSettings
+from django.db.models import Prefetch
+from .models import Category, Subcategory, Product, Warehouse, Sale, SaleItem, Cart, CartItem, UserSettings, LogEntry
+
+def items_prefetch(model, parent_field):
+    """Позиции для колонки «Товары»: одним запросом на страницу и только нужные поля."""
+    return Prefetch('items', queryset=model.objects.select_related('product').only(
+        'id', parent_field, 'quantity', 'product__id', 'product__name'
+    ).order_by('id'))
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -10,55 +17,105 @@ class CategoryAdmin(admin.ModelAdmin):
 class SubcategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'owner']
     list_filter = []
+    list_select_related = ['owner']
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = ['name', 'owner', 'quantity', 'warehouse', 'category', 'subcategory']
+    list_select_related = ['owner', 'warehouse', 'category', 'subcategory']
+    list_filter = ['is_archived']
+    search_fields = ['name', 'unique_id']
+    raw_id_fields = ['owner', 'warehouse', 'category', 'subcategory']
+    show_full_result_count = False
 
 @admin.register(Warehouse)
 class WarehouseAdmin(admin.ModelAdmin):
     list_display = ['name', 'owner']
+    list_select_related = ['owner']
 
 @admin.register(Sale)
 class SaleAdmin(admin.ModelAdmin):
-    list_display = ['id', 'date', 'owner', 'get_items', 'get_total']
-    list_filter = ['date', 'owner']
+    list_display = ['id', 'number', 'date', 'owner', 'get_items', 'get_total']
+    list_filter = ['date']
+    list_select_related = ['owner']
+    search_fields = ['owner__username']
+    date_hierarchy = 'date'
+    raw_id_fields = ['owner']
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(items_prefetch(SaleItem, 'sale'))
 
     def get_items(self, obj):
         items = obj.items.all()
         return ", ".join([f"{item.product.name} ({item.quantity} шт.)" for item in items])
     get_items.short_description = 'Товары'
 
+    @admin.display(description='Итого', ordering='actual_total')
     def get_total(self, obj):
-        base_total, actual_total = obj.calculate_totals()
-        return f"{actual_total} ₽"
-    get_total.short_description = 'Итого'
+        return f"{obj.actual_total} ₽"
 
 @admin.register(SaleItem)
 class SaleItemAdmin(admin.ModelAdmin):
     list_display = ['sale', 'product', 'quantity', 'base_price_total', 'actual_price_total']
-    list_filter = ['sale', 'product']
+    list_select_related = ['sale', 'product']
+    raw_id_fields = ['sale']
+    autocomplete_fields = ['product']
+    show_full_result_count = False
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-    list_display = ['id', 'owner', 'created_at', 'get_items', 'get_total']
-    list_filter = ['created_at', 'owner']
+    list_display = ['id', 'number', 'owner', 'created_at', 'get_items', 'get_total']
+    list_filter = ['created_at']
+    list_select_related = ['owner']
+    search_fields = ['owner__username']
+    date_hierarchy = 'created_at'
+    raw_id_fields = ['owner']
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(items_prefetch(CartItem, 'cart'))
 
     def get_items(self, obj):
         items = obj.items.all()
         return ", ".join([f"{item.product.name} ({item.quantity} шт.)" for item in items])
     get_items.short_description = 'Товары'
 
+    @admin.display(description='Итого', ordering='actual_total')
     def get_total(self, obj):
-        base_total, actual_total = obj.calculate_totals()
-        return f"{actual_total} ₽"
-    get_total.short_description = 'Итого'
+        return f"{obj.actual_total} ₽"
 
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
     list_display = ['cart', 'product', 'quantity', 'base_price_total', 'actual_price_total']
-    list_filter = ['cart', 'product']
+    list_select_related = ['cart__owner', 'product']
+    raw_id_fields = ['cart']
+    autocomplete_fields = ['product']
+    show_full_result_count = False
 
 @admin.register(UserSettings)
 class UserSettingsAdmin(admin.ModelAdmin):
-    list_display = ['user', 'hide_cost_price']
\ No newline at end of file
+    list_display = ['user', 'hide_cost_price']
+    list_select_related = ['user']
+
+@admin.register(LogEntry)
+class LogEntryAdmin(admin.ModelAdmin):
+    list_display = ['timestamp', 'user', 'action_type', 'text']
+    list_filter = ['action_type', 'object_type']
+    list_select_related = ['user']
+    search_fields = ['user__username']
+    # Навигация по датам и сортировка идут по индексу logentry_timestamp_id_idx
+    date_hierarchy = 'timestamp'
+    ordering = ['-timestamp', '-id']
+    raw_id_fields = ['user']
+    show_full_result_count = False
+
+    @admin.display(description='Сообщение')
+    def text(self, obj):
+        return obj.text
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
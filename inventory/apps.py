@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class InventoryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'inventory'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from . import metrics, replicas, slowqueries, sqlite
+
+        connection_created.connect(sqlite.apply_pragmas, dispatch_uid='inventory_sqlite_pragmas')
+        connection_created.connect(metrics.install_execute_wrapper, dispatch_uid='inventory_metrics_execute_wrapper')
+        connection_created.connect(slowqueries.install_execute_wrapper, dispatch_uid='inventory_slow_query_wrapper')
+        connection_created.connect(replicas.install_execute_wrapper, dispatch_uid='inventory_replica_write_wrapper')
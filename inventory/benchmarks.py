@@ -0,0 +1,198 @@
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from .models import Cart, CartItem, Category, Product, Subcategory, Warehouse
+
+# Замер горячих страниц на большом наборе данных (команда benchmark_views, данные — generate_dataset).
+# Каждый прогон идёт в транзакции, которая откатывается: изменяющие запросы (cart_confirm, добавление
+# в корзину) не меняют базу, и прогоны сравнимы между собой.
+DEFAULTS = {
+    'repeat': 5,
+    'warmup': 1,
+    'tolerance': 0.25,
+    'min_delta_ms': 5,
+    'memory_tolerance': 0.5,
+    'query_tolerance': 0,
+}
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class Case:
+    """Один замер: prepare() выполняется в транзакции прогона до запроса и возвращает аргументы запроса."""
+
+    def __init__(self, name, prepare):
+        self.name = name
+        self.prepare = prepare
+
+
+def get(url, params=None):
+    return lambda: {'method': 'get', 'path': url, 'data': params or {}}
+
+
+def post_json(url, payload):
+    return {'method': 'post', 'path': url, 'data': json.dumps(payload), 'content_type': 'application/json'}
+
+
+def build_cases(user):
+    """Набор замеров по данным пользователя: фильтры берутся из его же каталога."""
+    products = Product.objects.filter(owner=user, is_archived=False)
+    product = products.filter(quantity__gte=2).order_by('id').first()
+    if product is None:
+        raise BenchmarkError(f'У пользователя {user.username} нет товаров в наличии — сначала generate_dataset')
+    category = Category.objects.filter(owner=user).order_by('id').first()
+    subcategory = Subcategory.objects.filter(owner=user).order_by('id').first()
+    warehouse = Warehouse.objects.filter(owner=user).order_by('id').first()
+    products_url = reverse('products')
+    search_term = product.name.split()[0].lower()
+
+    def new_cart(lines=3):
+        cart = Cart.objects.create(owner=user)
+        for line in products.filter(quantity__gte=2).order_by('id')[:lines]:
+            CartItem.objects.create(cart=cart, product=line, quantity=1, base_price_total=line.selling_price,
+                                    actual_price_total=line.selling_price)
+        return cart
+
+    def cart_confirm():
+        return {'method': 'post', 'path': reverse('cart_confirm', args=[new_cart().id]), 'data': {}}
+
+    def cart_add_item_json():
+        cart = new_cart(lines=0)
+        return post_json(reverse('cart_add_item_json', args=[cart.id]),
+                         {'product': product.id, 'quantity': 1, 'actual_price': str(product.selling_price)})
+
+    def cart_add_items():
+        cart = new_cart(lines=0)
+        lines = products.filter(quantity__gte=2).order_by('id')[:5]
+        return post_json(reverse('cart_add_items', args=[cart.id]),
+                         {'items': [{'product': line.id, 'quantity': 1, 'actual_price': '0'} for line in lines]})
+
+    cases = [
+        Case('product_list', get(products_url)),
+        Case('product_list:q', get(products_url, {'q': search_term})),
+        Case('product_list:uuid', get(products_url, {'q': product.unique_id})),
+        Case('product_list:category', get(products_url, {'category': category.name})),
+        Case('product_list:subcategory', get(products_url, {'subcategory': subcategory.name})),
+        Case('product_list:warehouse', get(products_url, {'warehouse': warehouse.name})),
+        Case('product_list:min_quantity', get(products_url, {'min_quantity': 10})),
+        # Номер за концом списка — view отдаёт последнюю страницу, т.е. самый большой OFFSET
+        Case('product_list:last_page', get(products_url, {'page': 10 ** 6})),
+    ]
+    for sort in ('name', '-name', 'category__name', 'subcategory__name', 'selling_price', '-selling_price',
+                 'quantity', '-quantity', 'warehouse__name'):
+        cases.append(Case(f'product_list:sort={sort}', get(products_url, {'sort_by': sort})))
+    cases += [
+        Case('sales_list', get(reverse('sales_list'))),
+        Case('sales_list:sort=-actual_total', get(reverse('sales_list'), {'sort_by': '-actual_total'})),
+        Case('sales_list:product_name', get(reverse('sales_list'), {'product_name': search_term})),
+        Case('cart_list', get(reverse('cart_list'))),
+        Case('stats', get(reverse('stats'))),
+        Case('logs', get(reverse('user_logs'))),
+        Case('product_search', get(reverse('product_search'), {'q': search_term})),
+        Case('get_product_by_uuid', get(reverse('get_product_by_uuid'), {'unique_id': product.unique_id})),
+        Case('get_product_by_id', get(reverse('get_product_by_id'), {'product_id': product.id})),
+        Case('get_product_price', get(reverse('get_product_price'), {'product_id': product.id})),
+        Case('cart_add_item_json', cart_add_item_json),
+        Case('cart_add_items', cart_add_items),
+        Case('cart_confirm', cart_confirm),
+    ]
+    return cases
+
+
+def run_once(client, case, measure_memory=False):
+    """Один запрос в откатываемой транзакции. Возвращает (секунды, запросов к БД, пик памяти в байтах)."""
+    with transaction.atomic():
+        request = case.prepare()
+        method = getattr(client, request.pop('method'))
+        queries = peak = None
+        if measure_memory:
+            # Трассировка могла быть уже включена диагностикой памяти — тогда её не выключаем
+            was_tracing = tracemalloc.is_tracing()
+            if not was_tracing:
+                tracemalloc.start()
+            try:
+                before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = method(**request)
+                    elapsed = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1] - before
+            finally:
+                if not was_tracing:
+                    tracemalloc.stop()
+            queries = len(captured)
+        else:
+            start = time.perf_counter()
+            response = method(**request)
+            elapsed = time.perf_counter() - start
+        transaction.set_rollback(True)
+    if response.status_code >= 400:
+        raise BenchmarkError(f'{case.name}: ответ {response.status_code}')
+    return elapsed, queries, peak
+
+
+def run_case(client, case, repeat, warmup):
+    for _ in range(warmup):
+        run_once(client, case)
+    timings = [run_once(client, case)[0] for _ in range(repeat)]
+    # Запросы и память — отдельным прогоном: трассировка искажает время
+    _, queries, peak = run_once(client, case, measure_memory=True)
+    return {
+        'median_ms': round(statistics.median(timings) * 1000, 2),
+        'min_ms': round(min(timings) * 1000, 2),
+        'max_ms': round(max(timings) * 1000, 2),
+        'queries': queries,
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(user, repeat=None, warmup=None, only=None, log=None):
+    """Прогоняет замеры от имени user. DEBUG выключен, как в продакшене (иначе запросы копятся в connection.queries)."""
+    repeat = DEFAULTS['repeat'] if repeat is None else repeat
+    warmup = DEFAULTS['warmup'] if warmup is None else warmup
+    log = log or (lambda message: None)
+    results = {}
+    with override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver']):
+        client = Client()
+        client.force_login(user)
+        for case in build_cases(user):
+            if only and not any(pattern in case.name for pattern in only):
+                continue
+            results[case.name] = result = run_case(client, case, repeat, warmup)
+            log(f"{case.name:<36} {result['median_ms']:>9.2f} мс  {result['queries']:>4} запр.  {result['peak_kb']:>9.1f} КБ")
+    return results
+
+
+def compare(results, baseline, tolerance=None, memory_tolerance=None, query_tolerance=None, min_delta_ms=None):
+    """Регрессии относительно базовых замеров: время и память — в долях, запросы — в штуках.
+
+    Время считается регрессией, только если медиана выросла и больше чем на tolerance, и больше чем на
+    min_delta_ms: у быстрых страниц разброс в пару миллисекунд — это шум, а не замедление.
+    """
+    tolerance = DEFAULTS['tolerance'] if tolerance is None else tolerance
+    memory_tolerance = DEFAULTS['memory_tolerance'] if memory_tolerance is None else memory_tolerance
+    query_tolerance = DEFAULTS['query_tolerance'] if query_tolerance is None else query_tolerance
+    min_delta_ms = DEFAULTS['min_delta_ms'] if min_delta_ms is None else min_delta_ms
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if (result['median_ms'] > base['median_ms'] * (1 + tolerance)
+                and result['median_ms'] - base['median_ms'] > min_delta_ms):
+            regressions.append(f"{name}: время {result['median_ms']} мс против {base['median_ms']} мс")
+        if result['queries'] > base['queries'] + query_tolerance:
+            regressions.append(f"{name}: запросов {result['queries']} против {base['queries']}")
+        if result['peak_kb'] > base['peak_kb'] * (1 + memory_tolerance):
+            regressions.append(f"{name}: память {result['peak_kb']} КБ против {base['peak_kb']} КБ")
+    return regressions
@@ -0,0 +1,295 @@
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    Cart, CartComment, CartItem, Category, LogEntry, NumberSequence, Product, Return, Sale, SaleComment, SaleItem,
+    Subcategory, User, UserSettings, Warehouse, search_key,
+)
+
+# Синтетический набор данных для проверок производительности (команда generate_dataset).
+# Всё пишется bulk_create пачками, без save(): QR-коды не рисуются, номера, итоги и ключи сортировки
+# считаются здесь же. При одинаковых seed и end набор получается одинаковым.
+BRANDS = ('iPhone', 'Galaxy', 'Redmi', 'Pixel', 'Honor', 'Realme', 'Poco', 'Nothing Phone', 'OnePlus', 'Vivo')
+COLORS = (
+    'Чёрный', 'Белый', 'Синий', 'Красный', 'Зелёный', 'Золотой', 'Серебристый', 'Фиолетовый',
+    'Розовый', 'Серый', 'Графитовый', 'Голубой', 'Жёлтый', 'Бирюзовый', 'Бежевый', 'Титановый',
+)
+WAREHOUSES = ('Основной', 'Витрина', 'Резерв', 'Пункт выдачи', 'Сервис', 'Транзит')
+COMMENTS = (
+    'Покупатель просил упаковать как подарок',
+    'Оплата переводом',
+    'Доставка курьером завтра',
+    'Скидка постоянному клиенту',
+    'Проверить комплектацию перед выдачей',
+    'Клиент вернётся за чехлом',
+)
+
+DEFAULTS = {
+    'owners': 3,
+    'warehouses': 3,
+    'categories': 40,
+    'colors': 10,
+    'products': 1000,
+    'carts': 200,
+    'sales': 5000,
+    'max_items': 4,
+    'returns': 0.03,
+    'comments': 0.1,
+    'log_entries': 10000,
+    'years': 3,
+    'seed': 1,
+    'batch_size': 5000,
+    'prefix': 'demo',
+    'password': 'demo',
+}
+
+
+@contextmanager
+def explicit_timestamps():
+    """auto_now/auto_now_add на время генерации выключены — даты задаются явно и лежат в прошлом."""
+    fields = [
+        Cart._meta.get_field('created_at'), Sale._meta.get_field('date'), LogEntry._meta.get_field('timestamp'),
+        CartComment._meta.get_field('created_at'), CartComment._meta.get_field('updated_at'),
+        SaleComment._meta.get_field('created_at'), SaleComment._meta.get_field('updated_at'),
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def money(value):
+    return Decimal(value).quantize(Decimal('0.01'))
+
+
+class DatasetGenerator:
+    """Генерирует данные для options['owners'] пользователей; остальные размеры — на одного пользователя."""
+
+    def __init__(self, end=None, log=None, **options):
+        self.options = {**DEFAULTS, **options}
+        self.rng = random.Random(self.options['seed'])
+        self.end = end or timezone.now()
+        self.start = self.end - timedelta(days=365 * self.options['years'])
+        self.log = log or (lambda message: None)
+        self.counts = {}
+
+    def random_time(self, start=None):
+        start = start or self.start
+        return start + timedelta(seconds=self.rng.uniform(0, (self.end - start).total_seconds()))
+
+    def sorted_times(self, count):
+        return sorted(self.random_time() for _ in range(count))
+
+    def random_uuid(self):
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def bulk(self, model, objects):
+        """bulk_create пачками batch_size; возвращает объекты с id."""
+        batch_size = self.options['batch_size']
+        created = []
+        for start in range(0, len(objects), batch_size):
+            created.extend(model.objects.bulk_create(objects[start:start + batch_size]))
+        self.counts[model.__name__] = self.counts.get(model.__name__, 0) + len(objects)
+        return created
+
+    def generate(self):
+        started = time.monotonic()
+        with explicit_timestamps():
+            owners = self.create_owners()
+            for index, owner in enumerate(owners, 1):
+                self.log(f'Пользователь {owner.username} ({index}/{len(owners)})')
+                self.generate_owner(owner)
+        self.log(f'Готово за {time.monotonic() - started:.1f} с')
+        return self.counts
+
+    def create_owners(self):
+        prefix, count = self.options['prefix'], self.options['owners']
+        password = make_password(self.options['password'])  # Хэш один на всех: PBKDF2 на каждого — минуты
+        with transaction.atomic():
+            owners = self.bulk(User, [
+                User(username=f'{prefix}{number}', password=password, email=f'{prefix}{number}@example.com',
+                     first_name=f'Demo {number}', date_joined=self.start, is_active=True)
+                for number in range(1, count + 1)
+            ])
+            self.bulk(UserSettings, [UserSettings(user=owner, is_pending=False) for owner in owners])
+        return owners
+
+    def generate_owner(self, owner):
+        with transaction.atomic():
+            products = self.create_catalog(owner)
+        self.log(f'  товаров: {len(products)}')
+        carts = self.create_carts(owner, products)
+        self.log(f'  корзин: {carts}')
+        sales = self.create_sales(owner, products)
+        self.log(f'  продаж: {sales}')
+        NumberSequence.objects.bulk_create([
+            NumberSequence(owner=owner, sequence_type='cart', last_value=carts),
+            NumberSequence(owner=owner, sequence_type='sale', last_value=sales),
+        ])
+
+    def create_catalog(self, owner):
+        rng, options = self.rng, self.options
+        categories = self.bulk(Category, [
+            Category(name=f'{BRANDS[index % len(BRANDS)]} {index // len(BRANDS) + 1}', owner=owner)
+            for index in range(options['categories'])
+        ])
+        colors = self.bulk(Subcategory, [
+            Subcategory(name=COLORS[index] if index < len(COLORS) else f'Цвет {index + 1}', owner=owner)
+            for index in range(options['colors'])
+        ])
+        warehouses = self.bulk(Warehouse, [
+            Warehouse(name=WAREHOUSES[index] if index < len(WAREHOUSES) else f'Склад {index + 1}', owner=owner)
+            for index in range(options['warehouses'])
+        ])
+
+        # Товар уникален по (модель, цвет, склад) — берём случайные сочетания без повторов
+        combinations = len(categories) * len(colors) * len(warehouses)
+        count = min(options['products'], combinations)
+        if count < options['products']:
+            self.log(f'  товаров не больше {combinations}: столько сочетаний модели, цвета и склада')
+        products = []
+        for code in rng.sample(range(combinations), count):
+            code, warehouse_index = divmod(code, len(warehouses))
+            category_index, color_index = divmod(code, len(colors))
+            category, color = categories[category_index], colors[color_index]
+            name = f'{category.name} - {color.name}'
+            price = Decimal(rng.randrange(50, 15000) * 10)
+            products.append(Product(
+                name=name, search_name=search_key(name), unique_id=self.random_uuid(),
+                category=category, subcategory=color, warehouse=warehouses[warehouse_index], owner=owner,
+                quantity=rng.randint(0, 50), selling_price=price, cost_price=money(price * Decimal(rng.uniform(0.6, 0.85))),
+                is_archived=rng.random() < 0.05,
+            ))
+        return self.bulk(Product, products)
+
+    def build_items(self, item_model, parent_field, parent, products):
+        """Позиции строки и её итоги; товары различны, как требует unique_cart_product."""
+        rng = self.rng
+        items = []
+        for product in rng.sample(products, min(rng.randint(1, self.options['max_items']), len(products))):
+            quantity = rng.choices((1, 2, 3, 5), weights=(70, 20, 7, 3))[0]
+            unit_price = product.selling_price
+            if rng.random() < 0.2:
+                unit_price = money(unit_price * Decimal(1 - rng.uniform(0.03, 0.15)))
+            items.append(item_model(**{parent_field: parent}, product=product, quantity=quantity,
+                                    base_price_total=product.selling_price * quantity,
+                                    actual_price_total=unit_price * quantity))
+        return items
+
+    def apply_totals(self, parent, items):
+        parent.items_count = len(items)
+        parent.total_quantity = sum(item.quantity for item in items)
+        parent.base_total = sum(item.base_price_total for item in items)
+        parent.actual_total = sum(item.actual_price_total for item in items)
+
+    def create_carts(self, owner, products):
+        count = self.options['carts']
+        if not products:
+            return 0
+        times = self.sorted_times(count)
+        with transaction.atomic():
+            carts = [Cart(owner=owner, number=number, created_at=created_at) for number, created_at in enumerate(times, 1)]
+            items_by_cart = []
+            for cart in carts:
+                items = self.build_items(CartItem, 'cart', cart, products)
+                self.apply_totals(cart, items)
+                items_by_cart.append(items)
+            self.bulk(Cart, carts)
+            self.bulk(CartItem, [item for items in items_by_cart for item in items])
+            self.bulk(CartComment, [
+                CartComment(cart=cart, text=self.rng.choice(COMMENTS), created_at=cart.created_at, updated_at=cart.created_at)
+                for cart in carts if self.rng.random() < self.options['comments']
+            ])
+            self.create_log_entries(owner, products, carts, [], self.options['log_entries'] * 0.1)
+        return count
+
+    def create_sales(self, owner, products):
+        count = self.options['sales']
+        if not products:
+            return 0
+        times = self.sorted_times(count)
+        batch_size = self.options['batch_size']
+        # Доля журнала на продажи: остальное — товары и корзины (см. create_carts)
+        logs_per_sale = self.options['log_entries'] * 0.9 / count if count else 0
+        for start in range(0, count, batch_size):
+            with transaction.atomic():
+                self.create_sales_batch(owner, products, times[start:start + batch_size], start + 1, logs_per_sale)
+            self.log(f'  продаж: {min(start + batch_size, count)}/{count}')
+        return count
+
+    def create_sales_batch(self, owner, products, times, first_number, logs_per_sale):
+        rng, options = self.rng, self.options
+        sales, items_by_sale, returns = [], [], []
+        for number, date in enumerate(times, first_number):
+            sale = Sale(owner=owner, number=number, date=date)
+            items = self.build_items(SaleItem, 'sale', sale, products)
+            for item in items:
+                # Возврат уже учтён в позиции, как это делает return_item
+                if item.quantity > 1 and rng.random() < options['returns']:
+                    returned = rng.randint(1, item.quantity - 1)
+                    unit_actual = item.actual_price_total / item.quantity
+                    item.quantity -= returned
+                    item.base_price_total = item.product.selling_price * item.quantity
+                    item.actual_price_total = money(unit_actual * item.quantity)
+                    returns.append((item, returned, min(date + timedelta(days=rng.uniform(0, 14)), self.end)))
+            self.apply_totals(sale, items)
+            sale.sort_product_name = min(item.product.name for item in items)
+            sale.sort_warehouse_name = min(item.product.warehouse.name for item in items)
+            sales.append(sale)
+            items_by_sale.append(items)
+
+        self.bulk(Sale, sales)
+        self.bulk(SaleItem, [item for items in items_by_sale for item in items])
+        self.bulk(Return, [
+            Return(sale=item.sale, sale_item=item, quantity=returned, returned_at=returned_at, owner=owner)
+            for item, returned, returned_at in returns
+        ])
+        self.bulk(SaleComment, [
+            SaleComment(sale=sale, text=rng.choice(COMMENTS), created_at=sale.date, updated_at=sale.date)
+            for sale in sales if rng.random() < options['comments']
+        ])
+        self.create_log_entries(owner, products, [], sales, logs_per_sale * len(sales))
+
+    def create_log_entries(self, owner, products, carts, sales, count):
+        """Записи журнала о созданных объектах: события и параметры как у create_log_entry."""
+        rng = self.rng
+        entries = []
+        for _ in range(round(count)):
+            if sales and rng.random() < 0.7:
+                sale = rng.choice(sales)
+                entries.append(LogEntry(
+                    user=owner, action_type='SALE', event='sale.completed', object_type='sale', object_id=sale.id,
+                    params={'number': sale.number, 'cart_number': sale.number, 'username': owner.username}, timestamp=sale.date,
+                ))
+            elif carts and rng.random() < 0.6:
+                cart = rng.choice(carts)
+                product = rng.choice(products)
+                entries.append(LogEntry(
+                    user=owner, action_type='ADD', event='cart.item_added', object_type='cart', object_id=cart.id,
+                    related_product_id=product.id, timestamp=cart.created_at,
+                    params={'product_name': product.name, 'quantity': rng.randint(1, 3), 'number': cart.number, 'username': owner.username},
+                ))
+            elif rng.random() < 0.5:
+                product = rng.choice(products)
+                entries.append(LogEntry(
+                    user=owner, action_type='UPDATE', event='product.updated', object_type='product', object_id=product.id,
+                    params={'name': product.name, 'username': owner.username}, timestamp=self.random_time(),
+                ))
+            else:
+                entries.append(LogEntry(
+                    user=owner, action_type='LOGIN', event='user.login', object_type='user', object_id=owner.id,
+                    params={'username': owner.username}, timestamp=self.random_time(),
+                ))
+        self.bulk(LogEntry, entries)
@@ -2,8 +2,49 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils.html import format_html
 from .models import Product, Warehouse, Category, Subcategory, UserSettings, CartItem, SaleItem
 
+class ProductSearchWidget(forms.HiddenInput):
+    """Выбор товара поиском по названию вместо <select> со всем каталогом.
+
+    В форму уходит id товара из скрытого поля, подсказки приходят из product_search
+    (static/js/product_search.js). При выборе на скрытом поле срабатывает событие product:selected.
+    """
+
+    class Media:
+        js = ('js/product_search.js',)
+
+    @property
+    def is_hidden(self):
+        # Поле видно пользователю (строка поиска), поэтому шаблоны выводят для него подпись
+        return False
+
+    def id_for_label(self, id_):
+        return f'{id_}_search' if id_ else id_
+
+    def render(self, name, value, attrs=None, renderer=None):
+        hidden = super().render(name, value, attrs, renderer)
+        label = ''
+        # Подпись ищется только среди товаров поля (queryset владельца): чужой id из неверной формы
+        # не должен показать название чужого товара
+        queryset = getattr(getattr(self, 'choices', None), 'queryset', None)
+        if value and queryset is not None:
+            try:
+                label = queryset.filter(pk=value).values_list('name', flat=True).first() or ''
+            except (TypeError, ValueError):
+                pass
+        input_id = self.id_for_label((attrs or {}).get('id') or self.attrs.get('id'))
+        return format_html(
+            '<div class="product-search position-relative" data-url="{}">{}'
+            '<input type="text" id="{}" class="form-control product-search-input" value="{}" '
+            'placeholder="Начните вводить название товара" autocomplete="off">'
+            '<div class="list-group position-absolute w-100 product-search-results" style="z-index: 1000;"></div>'
+            '</div>',
+            reverse('product_search'), hidden, input_id or '', label
+        )
+
 class RegisterForm(forms.ModelForm):
     password = forms.CharField(widget=forms.PasswordInput, label="Пароль")
     email = forms.EmailField(label="Электронная почта", required=True)
@@ -137,7 +178,7 @@ class CartItemForm(forms.ModelForm):
             'quantity': 'Количество',
         }
         widgets = {
-            'product': forms.Select(attrs={'class': 'form-control'}),
+            'product': ProductSearchWidget(),
             'quantity': forms.NumberInput(attrs={'class': 'form-control'}),
             'actual_price': forms.NumberInput(attrs={'class': 'form-control'}),
         }
@@ -214,6 +255,9 @@ class SaleItemForm(forms.ModelForm):
             'product': 'Товар',
             'quantity': 'Количество',
         }
+        widgets = {
+            'product': ProductSearchWidget(),
+        }
 
 class ReturnForm(forms.Form):
     quantity = forms.IntegerField(min_value=1, label="Количество для возврата")
\ No newline at end of file
@@ -0,0 +1,382 @@
+import http.client
+import json
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from django.db import connections
+from django.db.models import Sum
+from django.urls import reverse
+
+from .models import Product, Sale, SaleItem
+
+# Нагрузочный прогон основного сценария кассы (команда loadtest_checkout): скан товара по UUID →
+# новая корзина → добавление позиций через JSON → оформление. Каждая касса — поток со своим
+# keep-alive соединением и сессией; сервер — уже запущенный или поднятый здесь же gunicorn/uvicorn.
+DEFAULTS = {
+    'tills': 8,
+    'duration': 30,
+    'iterations': 0,
+    'lines': 3,
+    'think': 0.0,
+    'timeout': 30,
+    'seed': 1,
+    'workers': 2,
+    'threads': 4,
+}
+
+STEPS = ('scan', 'cart_create', 'add_item', 'confirm', 'checkout')
+
+SERVER_COMMANDS = {
+    # Как в Procfile: синхронные воркеры WSGI
+    'gunicorn': ['-m', 'gunicorn', 'crm_system.wsgi', '--workers', '{workers}', '--threads', '{threads}', '--bind', '{bind}'],
+    # Как в README: ASGI с воркерами uvicorn
+    'gunicorn-asgi': ['-m', 'gunicorn', 'crm_system.asgi:application', '-k', 'uvicorn_worker.UvicornWorker',
+                      '--workers', '{workers}', '--bind', '{bind}'],
+    'uvicorn': ['-m', 'uvicorn', 'crm_system.asgi:application', '--workers', '{workers}', '--host', '{host}', '--port', '{port}'],
+}
+
+
+class LoadTestError(Exception):
+    pass
+
+
+class TillClient:
+    """HTTP-клиент одной кассы: постоянное соединение, cookies сессии и CSRF."""
+
+    def __init__(self, host, port, timeout):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.cookies = {}
+        self.connection = None
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        if method != 'GET' and 'csrftoken' in self.cookies:
+            headers['X-CSRFToken'] = self.cookies['csrftoken']
+            headers['Referer'] = f'http://{self.host}:{self.port}/'
+        for attempt in (1, 2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # Сервер закрыл keep-alive соединение между запросами — переподключаемся один раз
+                self.connection.close()
+                self.connection = None
+                if attempt == 2:
+                    raise
+        for header in response.msg.get_all('Set-Cookie') or []:
+            cookie = SimpleCookie()
+            cookie.load(header)
+            for name, morsel in cookie.items():
+                self.cookies[name] = morsel.value
+        if response.getheader('Connection', '').lower() == 'close':
+            self.connection.close()
+            self.connection = None
+        return response.status, response.getheader('Location', ''), data
+
+    def get(self, path, params=None):
+        return self.request('GET', f'{path}?{urlencode(params)}' if params else path)
+
+    def post_form(self, path, fields=None, headers=None):
+        return self.request('POST', path, urlencode(fields or {}),
+                            {'Content-Type': 'application/x-www-form-urlencoded', **(headers or {})})
+
+    def post_json(self, path, payload):
+        return self.request('POST', path, json.dumps(payload), {'Content-Type': 'application/json'})
+
+    def login(self, username, password):
+        self.get(reverse('login'))
+        status, location, _ = self.post_form(reverse('login'), {'username': username, 'password': password})
+        if status != 302 or not location.endswith(reverse('products')):
+            raise LoadTestError(f'Не удалось войти как {username} (ответ {status})')
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+class LoadStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+        self.outcomes = defaultdict(int)
+        self.attempts = defaultdict(int)
+        self.rejected_lines = 0
+
+    def attempt(self, step):
+        with self.lock:
+            self.attempts[step] += 1
+
+    def timing(self, step, seconds):
+        with self.lock:
+            self.latencies[step].append(seconds)
+
+    def error(self, step, kind):
+        with self.lock:
+            self.errors[step][kind] += 1
+
+    def rejected_line(self):
+        with self.lock:
+            self.rejected_lines += 1
+
+    def outcome(self, name):
+        with self.lock:
+            self.outcomes[name] += 1
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+
+class RunClock:
+    """Общий старт касс: время прогона идёт с момента, когда все кассы вошли (вход — дорогой хэш пароля)."""
+
+    def __init__(self, tills, duration, timeout):
+        self.duration = duration
+        # Вход — два запроса с таймаутом timeout и одним переподключением на каждый
+        self.timeout = 4 * timeout
+        self.started = self.deadline = None
+        self.barrier = threading.Barrier(tills, action=self.start)
+
+    def start(self):
+        self.started = time.monotonic()
+        self.deadline = self.started + self.duration
+
+    def wait(self):
+        """Ждёт остальные кассы. False — старт не состоялся: какая-то касса не дошла до барьера за timeout."""
+        try:
+            self.barrier.wait(self.timeout)
+        except threading.BrokenBarrierError:
+            return False
+        return True
+
+
+class Till(threading.Thread):
+    def __init__(self, number, base, options, catalog, stats, clock):
+        super().__init__(name=f'till-{number}', daemon=True)
+        self.client = TillClient(base.hostname, base.port or 80, options['timeout'])
+        self.options = options
+        self.catalog = catalog
+        self.stats = stats
+        self.clock = clock
+        self.rng = random.Random(options['seed'] + number)
+
+    def timed(self, step, call):
+        self.stats.attempt(step)
+        start = time.perf_counter()
+        try:
+            result = call()
+        except (OSError, http.client.HTTPException) as exc:
+            self.stats.error(step, type(exc).__name__)
+            return None
+        self.stats.timing(step, time.perf_counter() - start)
+        status = result[0]
+        if status >= 500:
+            self.stats.error(step, f'HTTP {status}')
+        return result
+
+    def run(self):
+        logged_in = started = False
+        try:
+            self.client.login(self.options['username'], self.options['password'])
+            logged_in = True
+        except (LoadTestError, OSError, http.client.HTTPException) as exc:
+            self.stats.error('login', str(exc))
+        finally:
+            # До барьера доходит и касса, упавшая на входе, иначе остальные ждали бы её вечно
+            started = self.clock.wait()
+        if not (logged_in and started):
+            self.client.close()
+            return
+        iterations = 0
+        try:
+            while time.monotonic() < self.clock.deadline and (not self.options['iterations'] or iterations < self.options['iterations']):
+                iterations += 1
+                self.checkout()
+                if self.options['think']:
+                    time.sleep(self.rng.uniform(0, 2 * self.options['think']))
+        finally:
+            self.client.close()
+
+    def checkout(self):
+        start = time.perf_counter()
+        result = self.timed('cart_create', lambda: self.client.post_form(
+            reverse('cart_create'), headers={'X-Requested-With': 'XMLHttpRequest'}))
+        if result is None or result[0] != 200:
+            self.stats.outcome('failed')
+            return
+        cart_id = json.loads(result[2])['cart_id']
+
+        added = 0
+        for unique_id in self.rng.sample(self.catalog, self.rng.randint(1, self.options['lines'])):
+            scan = self.timed('scan', lambda: self.client.get(reverse('get_product_by_uuid'), {'unique_id': unique_id}))
+            if scan is None or scan[0] != 200:
+                if scan is not None and scan[0] < 500:
+                    self.stats.error('scan', f'HTTP {scan[0]}')
+                continue
+            product = json.loads(scan[2])
+            add = self.timed('add_item', lambda: self.client.post_json(
+                reverse('cart_add_item_json', args=[cart_id]),
+                {'product': product['id'], 'quantity': self.rng.choice((1, 1, 1, 2)), 'actual_price': 0},
+            ))
+            if add is not None and add[0] == 200:
+                added += 1
+            elif add is not None and add[0] == 400:
+                self.stats.rejected_line()
+            elif add is not None and add[0] < 500:
+                self.stats.error('add_item', f'HTTP {add[0]}')
+
+        if not added:
+            self.client.post_form(reverse('cart_cancel', args=[cart_id]))
+            self.stats.outcome('empty_cart')
+            return
+
+        confirm = self.timed('confirm', lambda: self.client.post_form(reverse('cart_confirm', args=[cart_id])))
+        if confirm is None or confirm[0] >= 500:
+            self.stats.outcome('failed')
+        elif confirm[0] == 302 and confirm[1].endswith(reverse('sales_list')):
+            self.stats.timing('checkout', time.perf_counter() - start)
+            self.stats.outcome('completed')
+        elif confirm[0] == 302 and confirm[1].endswith(reverse('cart_add_item', args=[cart_id])):
+            # Пока касса собирала корзину, товар раскупили — штатный отказ, а не ошибка
+            self.stats.outcome('rejected_out_of_stock')
+            self.client.post_form(reverse('cart_cancel', args=[cart_id]))
+        else:
+            self.stats.error('confirm', f'HTTP {confirm[0]}')
+            self.stats.outcome('failed')
+
+
+def wait_for_port(host, port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise LoadTestError(f'Сервер не поднялся на {host}:{port} за {timeout} с')
+
+
+def start_server(kind, base, workers, threads):
+    """Поднимает сервер на адресе base. Вывод сервера — во временный файл: канал переполнился бы и остановил его."""
+    host, port = base.hostname, base.port or 80
+    arguments = [
+        part.format(workers=workers, threads=threads, bind=f'{host}:{port}', host=host, port=port)
+        for part in SERVER_COMMANDS[kind]
+    ]
+    output = tempfile.TemporaryFile()
+    process = subprocess.Popen([sys.executable, *arguments], stdout=output, stderr=subprocess.STDOUT)
+    process.output = output
+    try:
+        wait_for_port(host, port, 30)
+    except LoadTestError:
+        stop_server(process)
+        raise LoadTestError(f'Сервер не поднялся: {process.log[-2000:]}')
+    return process
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    process.output.seek(0)
+    process.log = process.output.read().decode(errors='replace')
+    process.output.close()
+
+
+def stock_snapshot(owner):
+    return dict(Product.objects.filter(owner=owner).values_list('id', 'quantity'))
+
+
+def check_stock(owner, before, last_sale_id, completed):
+    """Остатки после прогона = остатки до минус проданное в новых продажах; продаж столько, сколько увидели кассы."""
+    sold = dict(
+        SaleItem.objects.filter(sale__owner=owner, sale__id__gt=last_sale_id)
+        .values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total')
+    )
+    after = stock_snapshot(owner)
+    mismatched = {
+        product_id: (quantity, sold.get(product_id, 0), after.get(product_id))
+        for product_id, quantity in before.items()
+        if quantity - sold.get(product_id, 0) != after.get(product_id)
+    }
+    new_sales = Sale.objects.filter(owner=owner, id__gt=last_sale_id).count()
+    return {
+        'consistent': not mismatched and new_sales == completed,
+        'new_sales': new_sales,
+        'mismatched_products': mismatched,
+        'units_sold': sum(sold.values()),
+    }
+
+
+def run_load_test(owner, url, options, log=None):
+    """Прогон от имени owner: options — ключи DEFAULTS и password. Возвращает отчёт (dict)."""
+    options = {**DEFAULTS, **options}
+    log = log or (lambda message: None)
+    base = urlsplit(url)
+    catalog = list(Product.objects.filter(owner=owner, is_archived=False).values_list('unique_id', flat=True))
+    if not catalog:
+        raise LoadTestError(f'У пользователя {owner.username} нет товаров — сначала generate_dataset')
+    before = stock_snapshot(owner)
+    last_sale = Sale.objects.filter(owner=owner).order_by('-id').values_list('id', flat=True).first() or 0
+    # Соединение команды не должно держать блокировок SQLite во время прогона
+    connections.close_all()
+
+    stats = LoadStats()
+    clock = RunClock(options['tills'], options['duration'], options['timeout'])
+    tills = [Till(number, base, {**options, 'username': owner.username}, catalog, stats, clock)
+             for number in range(options['tills'])]
+    log(f"Касс: {len(tills)}, длительность до {options['duration']} с, сервер {url}")
+    for till in tills:
+        till.start()
+    for till in tills:
+        till.join()
+    if clock.started is None:
+        errors = ', '.join(stats.errors['login']) or 'кассы не дождались друг друга'
+        raise LoadTestError(f'Прогон не начался: {errors}')
+    elapsed = time.monotonic() - clock.started
+
+    report = {
+        'elapsed_s': round(elapsed, 2),
+        'tills': len(tills),
+        'outcomes': dict(stats.outcomes),
+        'rejected_lines': stats.rejected_lines,
+        'steps': {},
+    }
+    report['throughput_per_s'] = round(stats.outcomes['completed'] / elapsed, 2) if elapsed else 0
+    for step in STEPS:
+        values = sorted(stats.latencies.get(step, []))
+        errors = sum(stats.errors[step].values())
+        total = stats.attempts[step]
+        report['steps'][step] = {
+            'count': len(values),
+            'p50_ms': round(percentile(values, 0.5) * 1000, 1),
+            'p90_ms': round(percentile(values, 0.9) * 1000, 1),
+            'p99_ms': round(percentile(values, 0.99) * 1000, 1),
+            'max_ms': round((values[-1] if values else 0) * 1000, 1),
+            'errors': dict(stats.errors[step]),
+            'error_rate': round(errors / total, 4) if total else 0,
+        }
+    if stats.errors['login']:
+        report['login_errors'] = dict(stats.errors['login'])
+    report['stock'] = check_stock(owner, before, last_sale, stats.outcomes['completed'])
+    return report
@@ -0,0 +1,128 @@
+import gzip
+import json
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import LogEntry, render_log_message
+
+# Хранение журнала (settings.INVENTORY_LOG_RETENTION): записи старше DAYS дней переносятся
+# из таблицы в помесячные архивы ARCHIVE_DIR/logs-ГГГГ-ММ.ndjson.gz пачками по CHUNK_SIZE строк
+DEFAULTS = {
+    'DAYS': 180,
+    'ARCHIVE_DIR': Path(settings.BASE_DIR) / 'log_archive',
+    'CHUNK_SIZE': 1000,
+}
+
+ARCHIVE_FIELDS = (
+    'id', 'timestamp', 'user_id', 'user__username', 'action_type', 'message',
+    'event', 'params', 'object_type', 'object_id', 'related_product_id',
+)
+
+
+def retention_settings():
+    return {**DEFAULTS, **getattr(settings, 'INVENTORY_LOG_RETENTION', {})}
+
+
+def archive_path(archive_dir, month):
+    """month — строка 'ГГГГ-ММ'."""
+    return Path(archive_dir) / f'logs-{month}.ndjson.gz'
+
+
+def archive_months(archive_dir):
+    return sorted(path.name[len('logs-'):-len('.ndjson.gz')] for path in Path(archive_dir).glob('logs-*.ndjson.gz'))
+
+
+def entry_record(row):
+    """Строка архива: готовый текст (по нему ищет search_log_archive) и структурные поля события."""
+    return {
+        'id': row['id'],
+        'timestamp': row['timestamp'].isoformat(),
+        'user_id': row['user_id'],
+        'username': row['user__username'],
+        'action_type': row['action_type'],
+        'message': render_log_message(row['event'], row['params'], row['user__username'], row['message']),
+        'event': row['event'],
+        'params': row['params'],
+        'object_type': row['object_type'],
+        'object_id': row['object_id'],
+        'related_product_id': row['related_product_id'],
+    }
+
+
+def write_chunk(archive_dir, rows):
+    """Дописывает строки в архивы их месяцев. Каждая дозапись — отдельный gzip-член, файл остаётся читаемым целиком."""
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(row['timestamp'].strftime('%Y-%m'), []).append(entry_record(row))
+    for month, records in by_month.items():
+        path = archive_path(archive_dir, month)
+        with gzip.open(path, 'at', encoding='utf-8') as archive:
+            for record in records:
+                archive.write(json.dumps(record, ensure_ascii=False) + '\n')
+    return sorted(by_month)
+
+
+def archive_old_entries(days=None, archive_dir=None, chunk_size=None, pause=0, dry_run=False):
+    """Переносит записи старше days дней в архивы и удаляет их из таблицы пачками.
+
+    Каждая пачка — короткая выборка по индексу timestamp и DELETE по списку id, так что
+    запись в журнал и продажи не ждут одной длинной транзакции. Пачка сначала дописывается
+    в архив, потом удаляется: при обрыве посередине строка может попасть в архив дважды,
+    но не потеряется (при чтении дубли по id отбрасываются).
+    Возвращает (количество перенесённых записей, затронутые месяцы).
+    """
+    options = retention_settings()
+    days = options['DAYS'] if days is None else days
+    archive_dir = Path(archive_dir or options['ARCHIVE_DIR'])
+    chunk_size = chunk_size or options['CHUNK_SIZE']
+    cutoff = timezone.now() - timedelta(days=days)
+
+    old_entries = LogEntry.objects.filter(timestamp__lt=cutoff)
+    if dry_run:
+        return old_entries.count(), []
+
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    moved, months = 0, set()
+    while True:
+        rows = list(old_entries.order_by('timestamp', 'id').values(*ARCHIVE_FIELDS)[:chunk_size])
+        if not rows:
+            break
+        months.update(write_chunk(archive_dir, rows))
+        LogEntry.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        moved += len(rows)
+        if pause:
+            time.sleep(pause)
+    return moved, sorted(months)
+
+
+def iter_archive(month, archive_dir=None, user=None, action_type=None, contains=None, date_from=None, date_to=None):
+    """Потоково читает архив месяца и отдаёт подходящие записи (dict) без загрузки файла в память."""
+    path = archive_path(archive_dir or retention_settings()['ARCHIVE_DIR'], month)
+    if not path.exists():
+        return
+    seen = set()
+    contains = contains.casefold() if contains else None
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        for line in archive:
+            record = json.loads(line)
+            if record['id'] in seen:
+                continue
+            seen.add(record['id'])
+            if user and record['username'] != user:
+                continue
+            if action_type and record['action_type'] != action_type:
+                continue
+            if contains and contains not in record['message'].casefold():
+                continue
+            if date_from or date_to:
+                timestamp = parse_datetime(record['timestamp'])
+                if date_from and timestamp < date_from:
+                    continue
+                if date_to and timestamp >= date_to:
+                    continue
+            yield record
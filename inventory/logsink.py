@@ -0,0 +1,164 @@
+import atexit
+import contextvars
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Режимы записи журнала действий (settings.INVENTORY_LOG_SINK['MODE']):
+#   'request' — записи копятся в течение запроса и пишутся одним bulk_create в конце;
+#   'queue'   — записи уходят в ограниченную очередь, фоновый поток пишет их пачками по таймеру;
+#   'sync'    — каждая запись сразу отдельным INSERT (как раньше, удобно в тестах).
+DEFAULTS = {
+    'MODE': 'request',
+    'QUEUE_SIZE': 10000,
+    'FLUSH_INTERVAL': 2.0,
+    'BATCH_SIZE': 500,
+}
+
+_request_entries = contextvars.ContextVar('inventory_log_entries', default=None)
+
+
+def sink_settings():
+    return {**DEFAULTS, **getattr(settings, 'INVENTORY_LOG_SINK', {})}
+
+
+def write_entries(entries):
+    """Пишет пачку записей одним INSERT. Если пользователь записи успел удалиться, запись сохраняется без него."""
+    if not entries:
+        return
+    from .models import LogEntry
+
+    for entry in entries:
+        # Пользователь удалён в том же запросе уже после записи в журнал
+        user = LogEntry.user.field.get_cached_value(entry, default=None)
+        if user is not None and user.pk is None:
+            entry.user = None
+    try:
+        with transaction.atomic():
+            LogEntry.objects.bulk_create(entries)
+    except IntegrityError:
+        for entry in entries:
+            try:
+                with transaction.atomic():
+                    LogEntry.objects.bulk_create([entry])
+            except IntegrityError:
+                entry.user = None
+                LogEntry.objects.bulk_create([entry])
+
+
+class QueueLogSink:
+    """Ограниченная очередь записей и фоновый поток, который сбрасывает её пачками.
+
+    Когда очередь заполнена, запись пишется сразу в вызывающем потоке — записи не теряются.
+    При завершении процесса (atexit) очередь дописывается до конца.
+    """
+
+    def __init__(self, queue_size, flush_interval, batch_size):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.pending = []
+        self.thread = threading.Thread(target=self._run, name='inventory-log-sink', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def submit(self, entries):
+        for index, entry in enumerate(entries):
+            try:
+                self.queue.put_nowait(entry)
+            except queue.Full:
+                write_entries(entries[index:])
+                return
+
+    def _drain(self):
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self):
+        """Дописывает очередь. Пачка, которую не удалось записать (например, БД занята), повторяется на следующем такте."""
+        # Один сбрасывающий поток за раз: фоновый по таймеру или вызванный из close()/тестов
+        with self.lock:
+            while True:
+                batch = self.pending or self._drain()
+                if not batch:
+                    return True
+                try:
+                    write_entries(batch)
+                except Exception:
+                    logger.exception('Не удалось записать %s записей журнала', len(batch))
+                    for entry in batch:
+                        entry.pk = None
+                    self.pending = batch
+                    return False
+                self.pending = []
+
+    def _run(self):
+        while not self.stopped.wait(self.flush_interval):
+            self.flush()
+            close_old_connections()
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join(timeout=self.flush_interval + 1)
+        self.flush()
+
+
+_queue_sink = None
+_queue_sink_lock = threading.Lock()
+
+
+def get_queue_sink():
+    global _queue_sink
+    with _queue_sink_lock:
+        if _queue_sink is None:
+            options = sink_settings()
+            _queue_sink = QueueLogSink(options['QUEUE_SIZE'], options['FLUSH_INTERVAL'], options['BATCH_SIZE'])
+        return _queue_sink
+
+
+def deliver(entries):
+    """Передаёт готовые записи в хранилище согласно настроенному режиму."""
+    if sink_settings()['MODE'] == 'queue':
+        get_queue_sink().submit(entries)
+    else:
+        write_entries(entries)
+
+
+def record(entry):
+    """Принимает несохранённый LogEntry: копит его в буфере запроса, ставит в очередь или пишет сразу."""
+    mode = sink_settings()['MODE']
+    if mode == 'sync':
+        write_entries([entry])
+        return
+    buffer = _request_entries.get()
+    if buffer is not None:
+        buffer.append(entry)
+    else:
+        # Вне запроса (команды, тесты, фоновые задачи) буфера нет
+        deliver([entry])
+
+
+def start_request():
+    return _request_entries.set([])
+
+
+def take_request_entries(token):
+    entries = _request_entries.get() or []
+    _request_entries.reset(token)
+    return entries
+
+
+def finish_request(token):
+    deliver(take_request_entries(token))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from inventory.logarchive import archive_old_entries, retention_settings
+
+
+class Command(BaseCommand):
+    help = 'Переносит старые записи журнала действий в сжатые помесячные архивы (gzip NDJSON) и удаляет их из базы'
+
+    def add_arguments(self, parser):
+        options = retention_settings()
+        parser.add_argument('--days', type=int, default=options['DAYS'], help='Хранить в базе записи за последние N дней')
+        parser.add_argument('--archive-dir', default=str(options['ARCHIVE_DIR']), help='Каталог архивов')
+        parser.add_argument('--chunk-size', type=int, default=options['CHUNK_SIZE'], help='Записей в одной пачке')
+        parser.add_argument('--pause', type=float, default=0, help='Пауза между пачками в секундах')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать записи для переноса')
+
+    def handle(self, *args, **options):
+        moved, months = archive_old_entries(
+            days=options['days'],
+            archive_dir=options['archive_dir'],
+            chunk_size=options['chunk_size'],
+            pause=options['pause'],
+            dry_run=options['dry_run'],
+        )
+        if options['dry_run']:
+            self.stdout.write(f'Будет перенесено записей: {moved}')
+        elif moved:
+            self.stdout.write(self.style.SUCCESS(f'Перенесено записей: {moved} (месяцы: {", ".join(months)})'))
+        else:
+            self.stdout.write('Нет записей для переноса.')
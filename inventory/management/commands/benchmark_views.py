@@ -0,0 +1,65 @@
+import json
+import platform
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from inventory.benchmarks import DEFAULTS, BenchmarkError, compare, run_benchmarks
+from inventory.models import User
+
+
+class Command(BaseCommand):
+    help = 'Замеряет горячие страницы (время, запросы к БД, пик памяти) и сравнивает с базовыми замерами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', default='demo1', help='От чьего имени открывать страницы (данные generate_dataset)')
+        parser.add_argument('--repeat', type=int, default=DEFAULTS['repeat'], help='Замеров на страницу (берётся медиана)')
+        parser.add_argument('--warmup', type=int, default=DEFAULTS['warmup'], help='Прогревочных запросов на страницу')
+        parser.add_argument('--only', action='append', help='Только замеры, в имени которых есть подстрока (можно несколько)')
+        parser.add_argument('--output', default='bench_results.json', help='Куда записать результаты (JSON)')
+        parser.add_argument('--baseline', help='Файл базовых замеров для сравнения')
+        parser.add_argument('--save-baseline', action='store_true', help='Записать результаты в --baseline вместо сравнения')
+        parser.add_argument('--tolerance', type=float, default=DEFAULTS['tolerance'], help='Допустимый рост медианы времени (0.25 = 25%%)')
+        parser.add_argument('--min-delta-ms', type=float, default=DEFAULTS['min_delta_ms'], help='Рост времени меньше этого — шум, не регрессия')
+        parser.add_argument('--memory-tolerance', type=float, default=DEFAULTS['memory_tolerance'], help='Допустимый рост пика памяти')
+        parser.add_argument('--query-tolerance', type=int, default=DEFAULTS['query_tolerance'], help='Допустимый рост числа запросов')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {options['user']} не найден. Сначала выполните generate_dataset.")
+
+        try:
+            results = run_benchmarks(user, options['repeat'], options['warmup'], options['only'], log=self.stdout.write)
+        except BenchmarkError as error:
+            raise CommandError(str(error))
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'user': user.username,
+            'repeat': options['repeat'],
+            'results': results,
+        }
+        Path(options['output']).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+        self.stdout.write(f"Результаты: {options['output']}")
+
+        if not options['baseline']:
+            return
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+            self.stdout.write(self.style.SUCCESS(f'Базовые замеры сохранены: {baseline_path}'))
+            return
+        if not baseline_path.exists():
+            raise CommandError(f'Нет файла базовых замеров {baseline_path}. Запустите с --save-baseline.')
+
+        baseline = json.loads(baseline_path.read_text(encoding='utf-8'))['results']
+        regressions = compare(
+            results, baseline, options['tolerance'], options['memory_tolerance'], options['query_tolerance'], options['min_delta_ms']
+        )
+        if regressions:
+            raise CommandError('Регрессии:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет.'))
@@ -0,0 +1,56 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from inventory.dataset import DEFAULTS, DatasetGenerator
+from inventory.models import User
+
+
+class Command(BaseCommand):
+    help = 'Генерирует воспроизводимый синтетический набор данных (пользователи, склады, товары, корзины, продажи, журнал)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owners', type=int, default=DEFAULTS['owners'], help='Количество пользователей')
+        parser.add_argument('--warehouses', type=int, default=DEFAULTS['warehouses'], help='Складов на пользователя')
+        parser.add_argument('--categories', type=int, default=DEFAULTS['categories'], help='Моделей на пользователя')
+        parser.add_argument('--colors', type=int, default=DEFAULTS['colors'], help='Цветов на пользователя')
+        parser.add_argument('--products', type=int, default=DEFAULTS['products'], help='Товаров на пользователя')
+        parser.add_argument('--carts', type=int, default=DEFAULTS['carts'], help='Открытых корзин на пользователя')
+        parser.add_argument('--sales', type=int, default=DEFAULTS['sales'], help='Продаж на пользователя')
+        parser.add_argument('--max-items', type=int, default=DEFAULTS['max_items'], help='Максимум позиций в продаже или корзине')
+        parser.add_argument('--returns', type=float, default=DEFAULTS['returns'], help='Доля позиций с возвратом')
+        parser.add_argument('--comments', type=float, default=DEFAULTS['comments'], help='Доля продаж и корзин с комментарием')
+        parser.add_argument('--log-entries', type=int, default=DEFAULTS['log_entries'], help='Записей журнала на пользователя')
+        parser.add_argument('--years', type=int, default=DEFAULTS['years'], help='За сколько лет распределить даты')
+        parser.add_argument('--end-date', help='Последняя дата ГГГГ-ММ-ДД (по умолчанию сейчас); вместе с --seed даёт тот же набор')
+        parser.add_argument('--seed', type=int, default=DEFAULTS['seed'], help='Зерно генератора случайных чисел')
+        parser.add_argument('--batch-size', type=int, default=DEFAULTS['batch_size'], help='Строк в одном INSERT')
+        parser.add_argument('--prefix', default=DEFAULTS['prefix'], help='Префикс имён пользователей (demo1, demo2, ...)')
+        parser.add_argument('--password', default=DEFAULTS['password'], help='Пароль всех созданных пользователей')
+        parser.add_argument('--clear', action='store_true', help='Сначала удалить пользователей с этим префиксом и их данные')
+
+    def handle(self, *args, **options):
+        end = None
+        if options['end_date']:
+            try:
+                end = timezone.make_aware(datetime.combine(datetime.strptime(options['end_date'], '%Y-%m-%d'), time.max))
+            except ValueError:
+                raise CommandError('Неверный формат --end-date. Используйте YYYY-MM-DD.')
+
+        prefix = options['prefix']
+        usernames = [f'{prefix}{number}' for number in range(1, options['owners'] + 1)]
+        existing = User.objects.filter(username__in=usernames)
+        if existing.exists():
+            if not options['clear']:
+                raise CommandError(f'Пользователи {prefix}1… уже есть. Добавьте --clear или задайте другой --prefix.')
+            self.stdout.write('Удаление прежних данных…')
+            existing.delete()
+
+        generator = DatasetGenerator(
+            end=end,
+            log=self.stdout.write,
+            **{name: options[name] for name in DEFAULTS},
+        )
+        counts = generator.generate()
+        self.stdout.write(self.style.SUCCESS(', '.join(f'{model}: {count}' for model, count in counts.items())))
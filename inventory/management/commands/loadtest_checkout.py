@@ -0,0 +1,89 @@
+import json
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.loadtest import DEFAULTS, SERVER_COMMANDS, LoadTestError, run_load_test, start_server, stop_server
+from inventory.models import User
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный прогон сценария кассы: скан → корзина → позиции → оформление, параллельно с нескольких касс'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Адрес сервера')
+        parser.add_argument('--server', choices=['none', *SERVER_COMMANDS], default='none',
+                            help='Поднять сервер на --url на время прогона (none — сервер уже запущен)')
+        parser.add_argument('--workers', type=int, default=DEFAULTS['workers'], help='Воркеров поднимаемого сервера')
+        parser.add_argument('--threads', type=int, default=DEFAULTS['threads'], help='Потоков на воркер (--server gunicorn)')
+        parser.add_argument('--tills', type=int, default=DEFAULTS['tills'], help='Одновременно работающих касс')
+        parser.add_argument('--duration', type=float, default=DEFAULTS['duration'], help='Длительность прогона, с')
+        parser.add_argument('--iterations', type=int, default=DEFAULTS['iterations'], help='Продаж на кассу (0 — до конца --duration)')
+        parser.add_argument('--lines', type=int, default=DEFAULTS['lines'], help='Максимум позиций в чеке')
+        parser.add_argument('--think', type=float, default=DEFAULTS['think'], help='Средняя пауза кассира между чеками, с')
+        parser.add_argument('--timeout', type=float, default=DEFAULTS['timeout'], help='Таймаут HTTP-запроса, с')
+        parser.add_argument('--seed', type=int, default=DEFAULTS['seed'])
+        parser.add_argument('--user', default='demo1', help='Кассир (данные generate_dataset)')
+        parser.add_argument('--password', default='demo')
+        parser.add_argument('--output', help='Записать отчёт в файл (JSON)')
+        parser.add_argument('--fail-on-errors', action='store_true',
+                            help='Завершиться с ошибкой при ошибках 5xx/сети или расхождении остатков')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {options['user']} не найден. Сначала выполните generate_dataset.")
+
+        server = None
+        try:
+            if options['server'] != 'none':
+                self.stdout.write(f"Запуск {options['server']} на {options['url']}…")
+                server = start_server(options['server'], urlsplit(options['url']), options['workers'], options['threads'])
+            report = run_load_test(user, options['url'], {key: options[key] for key in (*DEFAULTS, 'password')},
+                                   log=self.stdout.write)
+        except LoadTestError as error:
+            raise CommandError(str(error))
+        finally:
+            if server is not None:
+                stop_server(server)
+        report['server'] = options['server']
+
+        self.print_report(report)
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, ensure_ascii=False, indent=2, default=str), encoding='utf-8')
+            self.stdout.write(f"Отчёт: {options['output']}")
+        if options['fail_on_errors']:
+            failed = sum(sum(step['errors'].values()) for step in report['steps'].values())
+            if failed or report.get('login_errors') or not report['stock']['consistent']:
+                raise CommandError('Прогон завершился с ошибками или расхождением остатков')
+
+    def print_report(self, report):
+        outcomes = report['outcomes']
+        self.stdout.write(
+            f"\nЗа {report['elapsed_s']} с: продаж {outcomes.get('completed', 0)} "
+            f"({report['throughput_per_s']}/с), отказов по остатку {outcomes.get('rejected_out_of_stock', 0)} "
+            f"(позиций {report['rejected_lines']}), "
+            f"сбоев {outcomes.get('failed', 0)}"
+        )
+        self.stdout.write(f"{'шаг':<12} {'кол-во':>7} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8} {'ошибки':>7}")
+        for step, data in report['steps'].items():
+            self.stdout.write(
+                f"{step:<12} {data['count']:>7} {data['p50_ms']:>8} {data['p90_ms']:>8} {data['p99_ms']:>8} "
+                f"{data['max_ms']:>8} {data['error_rate']:>7.2%}"
+            )
+            for kind, count in data['errors'].items():
+                self.stdout.write(f'    {kind}: {count}')
+        for message, count in report.get('login_errors', {}).items():
+            self.stdout.write(self.style.ERROR(f'Вход: {message} ×{count}'))
+        stock = report['stock']
+        if stock['consistent']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Остатки сходятся: продаж в базе {stock['new_sales']}, продано единиц {stock['units_sold']}"
+            ))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f"Остатки НЕ сходятся: продаж в базе {stock['new_sales']}, товаров с расхождением "
+                f"{len(stock['mismatched_products'])}"
+            ))
@@ -0,0 +1,52 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from inventory.logarchive import archive_months, iter_archive, retention_settings
+
+
+class Command(BaseCommand):
+    help = 'Ищет записи в архивах журнала действий и выводит их построчно (NDJSON)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('months', nargs='*', help='Месяцы ГГГГ-ММ; без аргументов — все архивы')
+        parser.add_argument('--archive-dir', default=str(retention_settings()['ARCHIVE_DIR']), help='Каталог архивов')
+        parser.add_argument('--user', help='Имя пользователя')
+        parser.add_argument('--action-type', help='Тип действия, например SALE')
+        parser.add_argument('--contains', help='Подстрока в сообщении (без учёта регистра)')
+        parser.add_argument('--date-from', help='С даты ГГГГ-ММ-ДД')
+        parser.add_argument('--date-to', help='По дату ГГГГ-ММ-ДД включительно')
+        parser.add_argument('--limit', type=int, help='Не больше N записей')
+
+    def parse_date(self, value, name):
+        if not value:
+            return None
+        try:
+            return timezone.make_aware(timezone.datetime.strptime(value, '%Y-%m-%d'))
+        except ValueError:
+            raise CommandError(f'Неверный формат {name}. Используйте YYYY-MM-DD.')
+
+    def handle(self, *args, **options):
+        date_from = self.parse_date(options['date_from'], '--date-from')
+        date_to = self.parse_date(options['date_to'], '--date-to')
+        if date_to:
+            date_to += timedelta(days=1)
+        months = options['months'] or archive_months(options['archive_dir'])
+
+        found = 0
+        for month in months:
+            for record in iter_archive(
+                month,
+                archive_dir=options['archive_dir'],
+                user=options['user'],
+                action_type=options['action_type'],
+                contains=options['contains'],
+                date_from=date_from,
+                date_to=date_to,
+            ):
+                self.stdout.write(json.dumps(record, ensure_ascii=False))
+                found += 1
+                if options['limit'] and found >= options['limit']:
+                    return
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.replicas import replica_settings, sync
+
+
+class Command(BaseCommand):
+    help = 'Копирует основную базу SQLite в файл реплики (INVENTORY_REPLICA) — разово или с интервалом'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default='default', help='Откуда копировать')
+        parser.add_argument('--replica', default=None, help='Куда копировать (по умолчанию INVENTORY_REPLICA ALIAS)')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять каждые N секунд (0 — один раз); задержка реплики не больше N плюс время копии')
+
+    def handle(self, *args, **options):
+        replica = options['replica'] or replica_settings()['ALIAS']
+        while True:
+            try:
+                elapsed = sync(options['source'], replica)
+            except (ValueError, KeyError) as error:
+                raise CommandError(str(error))
+            self.stdout.write(f"{options['source']} -> {replica}: {elapsed * 1000:.0f} мс")
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
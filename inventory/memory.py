@@ -0,0 +1,125 @@
+import linecache
+import threading
+import tracemalloc
+
+from django.conf import settings
+
+# Диагностика памяти по представлениям (settings.INVENTORY_MEMORY_DIAGNOSTICS, по умолчанию выключена):
+# пик выделений tracemalloc за запрос и, если включены SNAPSHOTS, разница снимков до и после запроса —
+# строки кода, память которых осталась занятой. tracemalloc замедляет процесс в разы, поэтому включать
+# только на время разбора. Пики считаются на весь процесс: точны для синхронных воркеров (по запросу за раз).
+DEFAULTS = {
+    'ENABLED': False,
+    'FRAMES': 10,
+    'SNAPSHOTS': True,
+    'TOP': 15,
+}
+
+# Выделения самого tracemalloc и импорта не интересны
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, linecache.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def memory_settings():
+    return {**DEFAULTS, **getattr(settings, 'INVENTORY_MEMORY_DIAGNOSTICS', {})}
+
+
+def start_tracing(frames):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def take_snapshot():
+    return tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+
+
+def top_lines(before, after, top):
+    """Строки с наибольшим приростом занятой памяти между снимками."""
+    lines = []
+    for stat in after.compare_to(before, 'lineno'):
+        if stat.size_diff <= 0:
+            continue
+        frame = stat.traceback[0]
+        lines.append({
+            'location': f'{frame.filename}:{frame.lineno}',
+            'code': linecache.getline(frame.filename, frame.lineno).strip(),
+            'size_diff': stat.size_diff,
+            'count_diff': stat.count_diff,
+        })
+        if len(lines) >= top:
+            break
+    return lines
+
+
+class ViewMemory:
+    __slots__ = ('count', 'peak_max', 'peak_total', 'retained_total', 'top_lines')
+
+    def __init__(self):
+        self.count = 0
+        self.peak_max = 0
+        self.peak_total = 0
+        self.retained_total = 0
+        self.top_lines = []
+
+    @property
+    def peak_avg(self):
+        return self.peak_total // self.count if self.count else 0
+
+    @property
+    def retained_avg(self):
+        return self.retained_total // self.count if self.count else 0
+
+
+class MemoryRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def observe(self, view, peak, retained, lines):
+        with self.lock:
+            data = self.views.get(view)
+            if data is None:
+                data = self.views[view] = ViewMemory()
+            data.count += 1
+            data.peak_max = max(data.peak_max, peak)
+            data.peak_total += peak
+            data.retained_total += retained
+            if lines is not None:
+                data.top_lines = lines
+
+    def rows(self):
+        """Представления по убыванию максимального пика."""
+        with self.lock:
+            return sorted(self.views.items(), key=lambda item: item[1].peak_max, reverse=True)
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+
+registry = MemoryRegistry()
+
+
+class RequestMeasurement:
+    """Замер одного запроса: start() до представления, finish() после."""
+
+    def __init__(self, snapshots):
+        self.snapshots = snapshots
+        self.before = None
+        self.current_before = 0
+
+    def start(self):
+        if self.snapshots:
+            self.before = take_snapshot()
+        self.current_before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+
+    def finish(self, view, top):
+        current_after, peak = tracemalloc.get_traced_memory()
+        lines = top_lines(self.before, take_snapshot(), top) if self.snapshots else None
+        registry.observe(view, max(peak - self.current_before, 0), current_after - self.current_before, lines)
@@ -0,0 +1,177 @@
+import bisect
+import contextvars
+import threading
+import time
+
+from django.conf import settings
+
+# Метрики запросов (settings.INVENTORY_METRICS): задержка по представлениям, число и время SQL-запросов,
+# время рендера шаблонов и размер ответа. Счётчики живут в памяти процесса — у каждого воркера свои.
+DEFAULTS = {
+    'ENABLED': True,
+    'SERVER_TIMING': True,
+    'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+}
+
+_request_stats = contextvars.ContextVar('inventory_request_stats', default=None)
+
+
+def metrics_settings():
+    return {**DEFAULTS, **getattr(settings, 'INVENTORY_METRICS', {})}
+
+
+class RequestStats:
+    __slots__ = ('queries', 'sql_time', 'render_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+
+
+def start_request():
+    return _request_stats.set(RequestStats())
+
+
+def finish_request(token):
+    stats = _request_stats.get()
+    _request_stats.reset(token)
+    return stats
+
+
+def current_stats():
+    return _request_stats.get()
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """Считает запросы текущего запроса. Вне запроса (команды, фоновые потоки) ничего не делает."""
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.sql_time += time.perf_counter() - start
+
+
+def install_execute_wrapper(sender, connection, **kwargs):
+    """Обработчик connection_created: обёртка ставится на соединение один раз.
+
+    Соединение, а не middleware: запросы асинхронных представлений идут в потоках sync_to_async,
+    у которых свои соединения, а контекст запроса (contextvar) переходит туда вместе с вызовом.
+    Обёртка встаёт первой, чтобы connection.execute_wrapper() снимал со списка свою, а не нашу.
+    """
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, execute_wrapper)
+
+
+class ViewMetrics:
+    __slots__ = ('bucket_counts', 'count', 'duration', 'queries', 'sql_time', 'render_time', 'response_bytes')
+
+    def __init__(self, buckets_count):
+        # Последняя ячейка — всё, что длиннее самой большой границы (+Inf)
+        self.bucket_counts = [0] * (buckets_count + 1)
+        self.count = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+        self.response_bytes = 0
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """Агрегаты по имени URL; обновление — один короткий захват блокировки на запрос."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def observe(self, view, duration, stats, response_bytes):
+        with self.lock:
+            data = self.views.get(view)
+            if data is None:
+                data = self.views[view] = ViewMetrics(len(self.buckets))
+            data.bucket_counts[bisect.bisect_left(self.buckets, duration)] += 1
+            data.count += 1
+            data.duration += duration
+            data.queries += stats.queries
+            data.sql_time += stats.sql_time
+            data.render_time += stats.render_time
+            data.response_bytes += response_bytes
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+    def render_prometheus(self):
+        """Текстовый формат Prometheus (exposition format 0.0.4)."""
+        with self.lock:
+            views = sorted(self.views.items())
+            snapshot = [(view, list(data.bucket_counts), data.count, data.duration, data.queries,
+                         data.sql_time, data.render_time, data.response_bytes) for view, data in views]
+
+        lines = [
+            '# HELP inventory_request_duration_seconds Время обработки запроса по имени URL.',
+            '# TYPE inventory_request_duration_seconds histogram',
+        ]
+        for view, bucket_counts, count, duration, *_ in snapshot:
+            label = _label(view)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'inventory_request_duration_seconds_bucket{{view="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'inventory_request_duration_seconds_bucket{{view="{label}",le="+Inf"}} {count}')
+            lines.append(f'inventory_request_duration_seconds_sum{{view="{label}"}} {duration:.6f}')
+            lines.append(f'inventory_request_duration_seconds_count{{view="{label}"}} {count}')
+
+        counters = (
+            ('inventory_db_queries_total', 'Количество SQL-запросов.', 4, '{}'),
+            ('inventory_db_seconds_total', 'Суммарное время SQL-запросов.', 5, '{:.6f}'),
+            ('inventory_template_render_seconds_total', 'Суммарное время рендера шаблонов.', 6, '{:.6f}'),
+            ('inventory_response_bytes_total', 'Суммарный размер ответов (без потоковых).', 7, '{}'),
+        )
+        for name, help_text, index, value_format in counters:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for row in snapshot:
+                lines.append(f'{name}{{view="{_label(row[0])}"}} {value_format.format(row[index])}')
+        return '\n'.join(lines) + '\n'
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry(metrics_settings()['BUCKETS'])
+        return _registry
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None and match.view_name else '<unresolved>'
+
+
+def server_timing(duration, stats):
+    return (
+        f'app;dur={duration * 1000:.1f}, '
+        f'db;dur={stats.sql_time * 1000:.1f};desc="{stats.queries} queries", '
+        f'tpl;dur={stats.render_time * 1000:.1f}'
+    )
+
+
+def record_response(request, response, duration, stats, add_header):
+    response_bytes = 0 if response.streaming else len(response.content)
+    get_registry().observe(view_name(request), duration, stats, response_bytes)
+    if add_header:
+        response['Server-Timing'] = server_timing(duration, stats)
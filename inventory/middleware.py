@@ -0,0 +1,254 @@
+# inventory/middleware.py
+import cProfile
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.urls import reverse
+
+from . import logsink, memory, metrics, profiling, replicas, slowqueries
+
+
+class LogBufferMiddleware:
+    """Собирает записи журнала за время запроса и сохраняет их одной пачкой в конце (см. inventory.logsink)."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = logsink.start_request()
+        try:
+            return self.get_response(request)
+        finally:
+            logsink.finish_request(token)
+
+    async def __acall__(self, request):
+        token = logsink.start_request()
+        try:
+            return await self.get_response(request)
+        finally:
+            entries = logsink.take_request_entries(token)
+            await sync_to_async(logsink.deliver)(entries)
+
+
+class MetricsMiddleware:
+    """Замеряет запрос целиком (время, SQL, рендер шаблонов, размер ответа) и копит метрики по имени URL.
+
+    Стоит первым в MIDDLEWARE, чтобы в замер попали запросы сессий и аутентификации.
+    Метрики отдаёт представление prometheus_metrics, разбивку по запросу — заголовок Server-Timing.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        options = metrics.metrics_settings()
+        if not options['ENABLED']:
+            raise MiddlewareNotUsed
+        self.server_timing = options['SERVER_TIMING']
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        token = metrics.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            stats = metrics.finish_request(token)
+        metrics.record_response(request, response, time.perf_counter() - start, stats, self.server_timing)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        token = metrics.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stats = metrics.finish_request(token)
+        metrics.record_response(request, response, time.perf_counter() - start, stats, self.server_timing)
+        return response
+
+
+class SlowQueryMiddleware:
+    """Включает журнал медленных запросов (inventory.slowqueries) на время запроса; без ENABLED не подключается."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        options = slowqueries.slow_query_settings()
+        if not options['ENABLED']:
+            raise MiddlewareNotUsed
+        self.threshold = options['THRESHOLD_MS'] / 1000
+        self.explain = options['EXPLAIN']
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = slowqueries.start_request(self.threshold, self.explain)
+        try:
+            return self.get_response(request)
+        finally:
+            slowqueries.finish_request(token)
+
+    async def __acall__(self, request):
+        token = slowqueries.start_request(self.threshold, self.explain)
+        try:
+            return await self.get_response(request)
+        finally:
+            slowqueries.finish_request(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        slowqueries.set_view(request.resolver_match.view_name)
+
+
+class ProfilingMiddleware:
+    """Профилирует отдельный запрос суперпользователя под cProfile (inventory.profiling).
+
+    Обычный запрос только проверяет параметр и заголовок. Асинхронные представления профилируются
+    в потоке цикла событий: работа внутри sync_to_async в профиль не попадает.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.options = profiling.profiling_settings()
+        if not self.options['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        mode = profiling.requested_mode(request, self.options)
+        if mode is None or not request.user.is_superuser or not profiling.acquire():
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        finally:
+            profiling.release()
+        return self.profiled_response(request, response, profiler, mode)
+
+    async def __acall__(self, request):
+        mode = profiling.requested_mode(request, self.options)
+        if mode is None or not (await request.auser()).is_superuser or not profiling.acquire():
+            return await self.get_response(request)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                response = await self.get_response(request)
+            finally:
+                profiler.disable()
+        finally:
+            profiling.release()
+        return await sync_to_async(self.profiled_response)(request, response, profiler, mode)
+
+    def profiled_response(self, request, response, profiler, mode):
+        name = profiling.save_profile(profiler, metrics.view_name(request), self.options)
+        if mode == 'summary':
+            response = HttpResponse(
+                profiling.profile_file(name, '.txt').read_text(encoding='utf-8'), content_type='text/plain; charset=utf-8'
+            )
+        response['X-Profile-Id'] = name
+        response['X-Profile-Url'] = reverse('profile_download', args=[name])
+        return response
+
+
+class MemoryDiagnosticsMiddleware:
+    """Пик и прирост памяти (tracemalloc) по имени URL, см. inventory.memory; без ENABLED не подключается."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        options = memory.memory_settings()
+        if not options['ENABLED']:
+            raise MiddlewareNotUsed
+        memory.start_tracing(options['FRAMES'])
+        self.snapshots = options['SNAPSHOTS']
+        self.top = options['TOP']
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        measurement = memory.RequestMeasurement(self.snapshots)
+        measurement.start()
+        try:
+            return self.get_response(request)
+        finally:
+            measurement.finish(metrics.view_name(request), self.top)
+
+    async def __acall__(self, request):
+        measurement = memory.RequestMeasurement(self.snapshots)
+        measurement.start()
+        try:
+            return await self.get_response(request)
+        finally:
+            measurement.finish(metrics.view_name(request), self.top)
+
+
+class ReplicaRoutingMiddleware:
+    """Состояние маршрутизации на время запроса (inventory.replicas) и закрепление за default после записи.
+
+    Стоит после SessionMiddleware: отметка о записи хранится в сессии и сохраняется ею же.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.options = replicas.replica_settings()
+        if not self.options['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = replicas.start_request(self.options)
+        try:
+            response = self.get_response(request)
+        finally:
+            state = replicas.finish_request(token)
+        if state.wrote:
+            replicas.pin(request, self.options['STICKY_SECONDS'])
+        return response
+
+    async def __acall__(self, request):
+        token = replicas.start_request(self.options)
+        try:
+            response = await self.get_response(request)
+        finally:
+            state = replicas.finish_request(token)
+        if state.wrote:
+            await sync_to_async(replicas.pin)(request, self.options['STICKY_SECONDS'])
+        return response
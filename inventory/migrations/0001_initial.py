@@ -0,0 +1,240 @@
+# Generated by Django 5.1 on 2026-10-19 11:11
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Cart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(editable=False, verbose_name='Номер корзины')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Владелец')),
+            ],
+            options={
+                'verbose_name': 'Корзина',
+                'verbose_name_plural': 'Корзины',
+            },
+        ),
+        migrations.CreateModel(
+            name='CartComment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField(verbose_name='Комментарий')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='inventory.cart', verbose_name='Корзина')),
+            ],
+            options={
+                'verbose_name': 'Комментарий к корзине',
+                'verbose_name_plural': 'Комментарии к корзине',
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название модели')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Владелец')),
+            ],
+            options={
+                'verbose_name': 'Модель',
+                'verbose_name_plural': 'Модели',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(auto_now_add=True, verbose_name='Время')),
+                ('action_type', models.CharField(choices=[('LOGIN', 'Вход'), ('LOGOUT', 'Выход'), ('REGISTER', 'Регистрация'), ('ADD', 'Добавление'), ('DELETE', 'Удаление'), ('UPDATE', 'Обновление'), ('SALE', 'Продажа'), ('BLOCK', 'Блокировка'), ('UNBLOCK', 'Разблокировка'), ('RETURN', 'Возврат'), ('FAILED_LOGIN', 'Неудачная попытка входа'), ('APPROVE', 'Подтверждение регистрации'), ('REJECT', 'Отклонение регистрации')], max_length=20, verbose_name='Тип действия')),
+                ('message', models.TextField(verbose_name='Сообщение')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='inventory_log_entries', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Запись лога',
+                'verbose_name_plural': 'Записи логов',
+            },
+        ),
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(editable=False, max_length=200, verbose_name='Название')),
+                ('unique_id', models.CharField(editable=False, max_length=50, unique=True, verbose_name='Уникальный идентификатор')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('cost_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Себестоимость')),
+                ('selling_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена продажи')),
+                ('photo', models.ImageField(blank=True, null=True, upload_to='products/photos/', verbose_name='Фото')),
+                ('qr_code', models.ImageField(blank=True, null=True, upload_to='products/qr_codes/', verbose_name='QR-код')),
+                ('is_archived', models.BooleanField(default=False, verbose_name='Архивировано')),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='inventory.category', verbose_name='Модель')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Владелец')),
+            ],
+            options={
+                'verbose_name': 'Товар',
+                'verbose_name_plural': 'Товары',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CartItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('base_price_total', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Базовая стоимость')),
+                ('actual_price_total', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Фактическая стоимость')),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='inventory.cart', verbose_name='Корзина')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Элемент корзины',
+                'verbose_name_plural': 'Элементы корзины',
+            },
+        ),
+        migrations.CreateModel(
+            name='Sale',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(editable=False, verbose_name='Номер продажи')),
+                ('date', models.DateTimeField(auto_now_add=True, verbose_name='Дата')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Владелец')),
+            ],
+            options={
+                'verbose_name': 'Продажа',
+                'verbose_name_plural': 'Продажи',
+            },
+        ),
+        migrations.CreateModel(
+            name='SaleComment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField(verbose_name='Комментарий')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('sale', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='inventory.sale', verbose_name='Продажа')),
+            ],
+            options={
+                'verbose_name': 'Комментарий к продаже',
+                'verbose_name_plural': 'Комментарии к продаже',
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SaleItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('base_price_total', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Базовая стоимость')),
+                ('actual_price_total', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Фактическая стоимость')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.product', verbose_name='Товар')),
+                ('sale', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='inventory.sale', verbose_name='Продажа')),
+            ],
+            options={
+                'verbose_name': 'Элемент продажи',
+                'verbose_name_plural': 'Элементы продажи',
+            },
+        ),
+        migrations.CreateModel(
+            name='Return',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('returned_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата возврата')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='returns', to=settings.AUTH_USER_MODEL, verbose_name='Владелец')),
+                ('sale', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='returns', to='inventory.sale', verbose_name='Продажа')),
+                ('sale_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='returns', to='inventory.saleitem', verbose_name='Элемент продажи')),
+            ],
+            options={
+                'verbose_name': 'Возврат',
+                'verbose_name_plural': 'Возвраты',
+            },
+        ),
+        migrations.CreateModel(
+            name='Subcategory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название цвета')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Владелец')),
+            ],
+            options={
+                'verbose_name': 'Цвет',
+                'verbose_name_plural': 'Цвета',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='subcategory',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='inventory.subcategory', verbose_name='Цвет'),
+        ),
+        migrations.CreateModel(
+            name='UserSettings',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hide_cost_price', models.BooleanField(default=False, verbose_name='Скрыть себестоимость')),
+                ('is_pending', models.BooleanField(default=True, verbose_name='Ожидает подтверждения')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Настройки пользователя',
+                'verbose_name_plural': 'Настройки пользователей',
+            },
+        ),
+        migrations.CreateModel(
+            name='Warehouse',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Владелец')),
+            ],
+            options={
+                'verbose_name': 'Склад',
+                'verbose_name_plural': 'Склады',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='warehouse',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.warehouse', verbose_name='Склад'),
+        ),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('owner', 'number'), name='unique_cart_number_per_owner'),
+        ),
+        migrations.AddConstraint(
+            model_name='category',
+            constraint=models.UniqueConstraint(fields=('name', 'owner'), name='unique_category_per_owner'),
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='unique_cart_product'),
+        ),
+        migrations.AddConstraint(
+            model_name='sale',
+            constraint=models.UniqueConstraint(fields=('owner', 'number'), name='unique_sale_number_per_owner'),
+        ),
+        migrations.AddConstraint(
+            model_name='subcategory',
+            constraint=models.UniqueConstraint(fields=('name', 'owner'), name='unique_subcategory_per_owner'),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('category', 'subcategory', 'warehouse', 'owner'), name='unique_product_category_subcategory_warehouse_owner'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1 on 2026-10-19 11:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_sequences(apps, schema_editor):
+    NumberSequence = apps.get_model('inventory', 'NumberSequence')
+    sequences = []
+    for sequence_type, model_name in (('cart', 'Cart'), ('sale', 'Sale')):
+        model = apps.get_model('inventory', model_name)
+        for row in model.objects.values('owner').annotate(last_value=models.Max('number')).order_by():
+            sequences.append(NumberSequence(owner_id=row['owner'], sequence_type=sequence_type, last_value=row['last_value']))
+    NumberSequence.objects.bulk_create(sequences, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence_type', models.CharField(choices=[('cart', 'Корзина'), ('sale', 'Продажа')], max_length=10, verbose_name='Тип')),
+                ('last_value', models.PositiveIntegerField(default=0, verbose_name='Последний номер')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Владелец')),
+            ],
+            options={
+                'verbose_name': 'Счётчик номеров',
+                'verbose_name_plural': 'Счётчики номеров',
+                'constraints': [models.UniqueConstraint(fields=('owner', 'sequence_type'), name='unique_sequence_per_owner')],
+            },
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
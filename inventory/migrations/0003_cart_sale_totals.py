@@ -0,0 +1,99 @@
+# Generated by Django 5.1 on 2026-10-19 11:17
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_totals(apps, schema_editor):
+    for model_name, item_model_name, fk_name in (('Cart', 'CartItem', 'cart'), ('Sale', 'SaleItem', 'sale')):
+        model = apps.get_model('inventory', model_name)
+        item_model = apps.get_model('inventory', item_model_name)
+        items = item_model.objects.filter(**{fk_name: OuterRef('pk')}).order_by().values(fk_name)
+
+        def subquery(aggregate, output_field):
+            return Coalesce(Subquery(items.annotate(value=aggregate).values('value')), Value(0), output_field=output_field)
+
+        model.objects.update(
+            items_count=subquery(models.Count('id'), models.PositiveIntegerField()),
+            total_quantity=subquery(models.Sum('quantity'), models.PositiveIntegerField()),
+            base_total=subquery(models.Sum('base_price_total'), models.DecimalField(max_digits=12, decimal_places=2)),
+            actual_total=subquery(models.Sum('actual_price_total'), models.DecimalField(max_digits=12, decimal_places=2)),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_numbersequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='actual_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Общая фактическая стоимость'),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='base_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Общая базовая стоимость'),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество позиций'),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='total_quantity',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Общее количество'),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='actual_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Общая фактическая стоимость'),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='base_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Общая базовая стоимость'),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество позиций'),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='total_quantity',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Общее количество'),
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['owner', 'created_at'], name='cart_owner_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['owner', 'actual_total'], name='cart_owner_total_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['owner', 'items_count'], name='cart_owner_items_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['owner', 'date'], name='sale_owner_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['owner', 'actual_total'], name='sale_owner_total_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['owner', 'total_quantity'], name='sale_owner_quantity_idx'),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1 on 2026-10-19 11:20
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_sort_keys(apps, schema_editor):
+    Sale = apps.get_model('inventory', 'Sale')
+    SaleItem = apps.get_model('inventory', 'SaleItem')
+    items = SaleItem.objects.filter(sale=OuterRef('pk')).order_by()
+    Sale.objects.update(
+        sort_product_name=Coalesce(Subquery(items.order_by('product__name').values('product__name')[:1]), Value('')),
+        sort_warehouse_name=Coalesce(Subquery(items.order_by('product__warehouse__name').values('product__warehouse__name')[:1]), Value('')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_cart_sale_totals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='sort_product_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=200, verbose_name='Товар для сортировки'),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='sort_warehouse_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100, verbose_name='Склад для сортировки'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['owner', 'sort_product_name'], name='sale_owner_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['owner', 'sort_warehouse_name'], name='sale_owner_warehouse_idx'),
+        ),
+        migrations.RunPython(backfill_sort_keys, migrations.RunPython.noop),
+    ]
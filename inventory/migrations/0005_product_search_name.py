@@ -0,0 +1,46 @@
+# Generated by Django 5.1 on 2026-10-19 14:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+BATCH_SIZE = 500
+
+
+def search_key(text):
+    # Копия inventory.models.search_key на момент миграции: повтор миграции не должен зависеть от текущего кода
+    return ' '.join(text.casefold().split())
+
+
+def backfill_search_name(apps, schema_editor):
+    Product = apps.get_model('inventory', 'Product')
+    batch = []
+    for product in Product.objects.only('id', 'name').order_by('id').iterator(chunk_size=BATCH_SIZE):
+        product.search_name = search_key(product.name)
+        batch.append(product)
+        if len(batch) == BATCH_SIZE:
+            Product.objects.bulk_update(batch, ['search_name'])
+            batch = []
+    if batch:
+        Product.objects.bulk_update(batch, ['search_name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_sale_sort_keys'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=200, verbose_name='Название для поиска'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['owner', 'search_name'], name='product_owner_search_idx'),
+        ),
+        migrations.RunPython(backfill_search_name, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-19 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_product_search_name'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='logentry',
+            index=models.Index(fields=['timestamp'], name='logentry_timestamp_idx'),
+        ),
+    ]
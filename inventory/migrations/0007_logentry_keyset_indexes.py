@@ -0,0 +1,27 @@
+# Generated by Django 5.1 on 2026-10-19 16:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_logentry_timestamp_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='logentry',
+            name='logentry_timestamp_idx',
+        ),
+        migrations.AddIndex(
+            model_name='logentry',
+            index=models.Index(fields=['timestamp', 'id'], name='logentry_timestamp_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='logentry',
+            index=models.Index(fields=['user', 'timestamp'], name='logentry_user_time_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1 on 2026-10-19 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_logentry_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logentry',
+            name='object_type',
+            field=models.CharField(blank=True, choices=[('product', 'Товар'), ('sale', 'Продажа'), ('cart', 'Корзина'), ('warehouse', 'Склад'), ('category', 'Модель'), ('subcategory', 'Цвет'), ('user', 'Пользователь')], default='', max_length=20, verbose_name='Тип объекта'),
+        ),
+        migrations.AddField(
+            model_name='logentry',
+            name='object_id',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='ID объекта'),
+        ),
+        migrations.AddField(
+            model_name='logentry',
+            name='related_product_id',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='ID товара'),
+        ),
+        migrations.AddField(
+            model_name='logentry',
+            name='event',
+            field=models.CharField(blank=True, default='', max_length=50, verbose_name='Событие'),
+        ),
+        migrations.AddField(
+            model_name='logentry',
+            name='params',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Параметры'),
+        ),
+        migrations.AlterField(
+            model_name='logentry',
+            name='message',
+            field=models.TextField(blank=True, default='', verbose_name='Сообщение'),
+        ),
+        migrations.AddIndex(
+            model_name='logentry',
+            index=models.Index(fields=['object_type', 'object_id', 'timestamp'], name='logentry_object_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='logentry',
+            index=models.Index(fields=['related_product_id', 'timestamp'], name='logentry_product_idx'),
+        ),
+    ]
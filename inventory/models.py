@@ -1,6 +1,9 @@
 # inventory/models.py
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from contextlib import contextmanager
 import uuid
 import qrcode
 from django.core.files import File
@@ -61,12 +64,21 @@ class Warehouse(models.Model):
     def __str__(self):
         return self.name
 
+    def delete(self, *args, **kwargs):
+        with updating_totals(product__warehouse=self):
+            return super().delete(*args, **kwargs)
+
 ################
 ### PRODUCTS ###
 ################
 
+def search_key(text):
+    """Название в виде для поиска: регистр свёрнут в Python, т.к. LOWER в SQLite не понимает кириллицу."""
+    return ' '.join(text.casefold().split())
+
 class Product(models.Model):
     name = models.CharField(max_length=200, verbose_name="Название", editable=False)
+    search_name = models.CharField(max_length=200, blank=True, default='', editable=False, verbose_name="Название для поиска")
     unique_id = models.CharField(max_length=50, unique=True, editable=False, verbose_name="Уникальный идентификатор")
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, verbose_name="Модель")
     subcategory = models.ForeignKey(Subcategory, on_delete=models.SET_NULL, null=True, verbose_name="Цвет")
@@ -85,6 +97,7 @@ class Product(models.Model):
             self.name = f"{self.category.name} - {self.subcategory.name}"
         else:
             self.name = "Не указано"
+        self.search_name = search_key(self.name)
 
         if not self.unique_id:
             self.unique_id = str(uuid.uuid4())[:50]
@@ -98,6 +111,10 @@ class Product(models.Model):
 
         super().save(*args, **kwargs)
 
+    def delete(self, *args, **kwargs):
+        with updating_totals(product=self):
+            return super().delete(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
@@ -110,13 +127,122 @@ class Product(models.Model):
                 name='unique_product_category_subcategory_warehouse_owner'
             )
         ]
+        indexes = [
+            # Поиск по началу названия (product_search) — диапазон по этому индексу
+            models.Index(fields=['owner', 'search_name'], name='product_owner_search_idx'),
+        ]
         ordering = ['name']
 
+#######################
+### NUMBER SEQUENCE ###
+#######################
+
+class NumberSequence(models.Model):
+    SEQUENCE_TYPES = (
+        ('cart', 'Корзина'),
+        ('sale', 'Продажа'),
+    )
+
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Владелец")
+    sequence_type = models.CharField(max_length=10, choices=SEQUENCE_TYPES, verbose_name="Тип")
+    last_value = models.PositiveIntegerField(default=0, verbose_name="Последний номер")
+
+    class Meta:
+        verbose_name = "Счётчик номеров"
+        verbose_name_plural = "Счётчики номеров"
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'sequence_type'], name='unique_sequence_per_owner')
+        ]
+
+    @classmethod
+    def next_value(cls, owner, sequence_type):
+        """Атомарно выдаёт следующий номер: UPDATE одной строки вместо Max('number') по всей таблице."""
+        sequence = cls.objects.filter(owner=owner, sequence_type=sequence_type)
+        with transaction.atomic():
+            if not sequence.update(last_value=models.F('last_value') + 1):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(owner=owner, sequence_type=sequence_type, last_value=1)
+                    return 1
+                except IntegrityError:
+                    # Счётчик успел создать параллельный запрос
+                    sequence.update(last_value=models.F('last_value') + 1)
+            return sequence.values_list('last_value', flat=True).get()
+
+    def __str__(self):
+        return f"{self.get_sequence_type_display()} {self.owner}: {self.last_value}"
+
+##############
+### TOTALS ###
+##############
+
+class ItemTotals(models.Model):
+    """Итоги по позициям (related_name='items'), хранятся в самой строке и пересчитываются при изменении позиций."""
+    TOTAL_FIELDS = ('items_count', 'total_quantity', 'base_total', 'actual_total')
+
+    items_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество позиций")
+    total_quantity = models.PositiveIntegerField(default=0, editable=False, verbose_name="Общее количество")
+    base_total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, verbose_name="Общая базовая стоимость")
+    actual_total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, verbose_name="Общая фактическая стоимость")
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def items_subquery(cls):
+        """Позиции строки, связанные через OuterRef('pk'), для коррелированных подзапросов."""
+        relation = cls._meta.get_field('items')
+        return relation.related_model.objects.filter(**{relation.field.name: OuterRef('pk')}).order_by()
+
+    @classmethod
+    def totals_expressions(cls):
+        """Подзапросы итогов по позициям для UPDATE/annotate по OuterRef('pk')."""
+        relation = cls._meta.get_field('items')
+        items = cls.items_subquery().values(relation.field.name)
+
+        def subquery(aggregate, output_field):
+            return Coalesce(Subquery(items.annotate(value=aggregate).values('value')), Value(0), output_field=output_field)
+
+        return {
+            'items_count': subquery(models.Count('id'), models.PositiveIntegerField()),
+            'total_quantity': subquery(models.Sum('quantity'), models.PositiveIntegerField()),
+            'base_total': subquery(models.Sum('base_price_total'), models.DecimalField(max_digits=12, decimal_places=2)),
+            'actual_total': subquery(models.Sum('actual_price_total'), models.DecimalField(max_digits=12, decimal_places=2)),
+        }
+
+    def update_totals(self):
+        # Один UPDATE с подзапросами: итоги считаются в той же операции, что и запись
+        type(self).objects.filter(pk=self.pk).update(**self.totals_expressions())
+        self.refresh_from_db(fields=self.TOTAL_FIELDS)
+
+    @classmethod
+    def update_totals_for(cls, pks):
+        """Пересчитывает итоги нескольких строк одним UPDATE."""
+        if pks:
+            cls.objects.filter(pk__in=pks).update(**cls.totals_expressions())
+
+    def calculate_totals(self):
+        return self.base_total, self.actual_total
+
+@contextmanager
+def updating_totals(**item_filter):
+    """Пересчитывает итоги корзин и продаж, чьи позиции (по item_filter) удаляются каскадом внутри блока.
+
+    Каскадное удаление не вызывает CartItem.delete/SaleItem.delete, поэтому затронутые корзины и продажи
+    собираются до удаления и пересчитываются после него в той же транзакции.
+    """
+    with transaction.atomic():
+        cart_ids = set(CartItem.objects.filter(**item_filter).values_list('cart_id', flat=True))
+        sale_ids = set(SaleItem.objects.filter(**item_filter).values_list('sale_id', flat=True))
+        yield
+        Cart.update_totals_for(cart_ids)
+        Sale.update_totals_for(sale_ids)
+
 ############
 ### CART ###
 ############
 
-class Cart(models.Model):
+class Cart(ItemTotals):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Владелец")
     number = models.PositiveIntegerField(verbose_name="Номер корзины", editable=False)
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
@@ -127,19 +253,17 @@ class Cart(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['owner', 'number'], name='unique_cart_number_per_owner')
         ]
+        indexes = [
+            models.Index(fields=['owner', 'created_at'], name='cart_owner_created_idx'),
+            models.Index(fields=['owner', 'actual_total'], name='cart_owner_total_idx'),
+            models.Index(fields=['owner', 'items_count'], name='cart_owner_items_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.number:
-            max_number = Cart.objects.filter(owner=self.owner).aggregate(models.Max('number'))['number__max']
-            self.number = (max_number or 0) + 1
+            self.number = NumberSequence.next_value(self.owner, 'cart')
         super().save(*args, **kwargs)
 
-    def calculate_totals(self):
-        items = self.items.all()
-        base_total = sum(item.base_price_total for item in items)
-        actual_total = sum(item.actual_price_total for item in items)
-        return base_total, actual_total
-
     def __str__(self):
         return f"Корзина №{self.number} пользователя {self.owner.username} от {self.created_at}"
 
@@ -161,6 +285,15 @@ class CartItem(models.Model):
             models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product')
         ]
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.cart.update_totals()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self.cart.update_totals()
+        return result
+
     def __str__(self):
         return f"{self.quantity} x {self.product.name} в корзине №{self.cart.number}"
 
@@ -186,10 +319,14 @@ class CartComment(models.Model):
 ### SALE ###
 ############
 
-class Sale(models.Model):
+class Sale(ItemTotals):
+    TOTAL_FIELDS = ItemTotals.TOTAL_FIELDS + ('sort_product_name', 'sort_warehouse_name')
+
     owner = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Владелец")
     number = models.PositiveIntegerField(verbose_name="Номер продажи", editable=False)
     date = models.DateTimeField(auto_now_add=True, verbose_name="Дата")
+    sort_product_name = models.CharField(max_length=200, blank=True, default='', editable=False, verbose_name="Товар для сортировки")
+    sort_warehouse_name = models.CharField(max_length=100, blank=True, default='', editable=False, verbose_name="Склад для сортировки")
 
     class Meta:
         verbose_name = "Продажа"
@@ -197,19 +334,29 @@ class Sale(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['owner', 'number'], name='unique_sale_number_per_owner')
         ]
+        indexes = [
+            models.Index(fields=['owner', 'date'], name='sale_owner_date_idx'),
+            models.Index(fields=['owner', 'actual_total'], name='sale_owner_total_idx'),
+            models.Index(fields=['owner', 'total_quantity'], name='sale_owner_quantity_idx'),
+            models.Index(fields=['owner', 'sort_product_name'], name='sale_owner_product_idx'),
+            models.Index(fields=['owner', 'sort_warehouse_name'], name='sale_owner_warehouse_idx'),
+        ]
+
+    @classmethod
+    def totals_expressions(cls):
+        # Ключи сортировки - первые по алфавиту товар и склад продажи, чтобы не сортировать через JOIN позиций
+        items = cls.items_subquery()
+        return {
+            **super().totals_expressions(),
+            'sort_product_name': Coalesce(Subquery(items.order_by('product__name').values('product__name')[:1]), Value('')),
+            'sort_warehouse_name': Coalesce(Subquery(items.order_by('product__warehouse__name').values('product__warehouse__name')[:1]), Value('')),
+        }
 
     def save(self, *args, **kwargs):
         if not self.number:
-            max_number = Sale.objects.filter(owner=self.owner).aggregate(models.Max('number'))['number__max']
-            self.number = (max_number or 0) + 1
+            self.number = NumberSequence.next_value(self.owner, 'sale')
         super().save(*args, **kwargs)
 
-    def calculate_totals(self):
-        items = self.items.all()
-        base_total = sum(item.base_price_total for item in items)
-        actual_total = sum(item.actual_price_total for item in items)
-        return base_total, actual_total
-
     def __str__(self):
         return f"Продажа №{self.number} от {self.date}"
 
@@ -228,6 +375,15 @@ class SaleItem(models.Model):
         verbose_name = "Элемент продажи"
         verbose_name_plural = "Элементы продажи"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.sale.update_totals()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self.sale.update_totals()
+        return result
+
     def __str__(self):
         return f"{self.quantity} x {self.product.name} в продаже №{self.sale.number}"
 
@@ -284,6 +440,64 @@ class UserSettings(models.Model):
 ### LOG ENTRY ###
 #################
 
+# Тексты записей журнала: в базе хранятся только событие и параметры, текст собирается при показе.
+# {username} — пользователь, совершивший действие: create_log_entry сохраняет его имя в параметрах,
+# для записей без него берётся текущее имя LogEntry.user.
+LOG_MESSAGES = {
+    'user.login': 'Пользователь {username} вошёл в систему',
+    'user.login_failed': 'Неудачная попытка входа для пользователя {username}',
+    'user.logout': 'Пользователь {username} вышел из системы',
+    'user.registered': 'Новый пользователь {username} зарегистрирован и ожидает подтверждения',
+    'user.profile_updated': 'Пользователь {username} обновил свой профиль',
+    'user.approved': 'Регистрация пользователя {target} подтверждена администратором {username}',
+    'user.rejected': 'Регистрация пользователя {target} отклонена администратором {username}',
+    'user.blocked': 'Пользователь {target} заблокирован администратором {username}',
+    'user.unblocked': 'Пользователь {target} разблокирован администратором {username}',
+    'user.deleted': 'Пользователь {target} удалён администратором {username}',
+    'product.added': 'Товар "{name}" добавлен пользователем {username}',
+    'product.updated': 'Товар "{name}" обновлён пользователем {username}',
+    'product.deleted': 'Товар "{name}" удалён пользователем {username}',
+    'product.archived': 'Товар "{name}" архивирован пользователем {username}',
+    'product.unarchived': 'Товар "{name}" разархивирован пользователем {username}',
+    'warehouse.added': 'Склад "{name}" добавлен пользователем {username}',
+    'warehouse.updated': 'Склад "{name}" обновлён пользователем {username}',
+    'warehouse.deleted': 'Склад "{name}" удалён пользователем {username}',
+    'category.added': 'Модель "{name}" добавлена пользователем {username}',
+    'category.updated': 'Модель "{old_name}" обновлена на "{name}" пользователем {username}',
+    'category.deleted': 'Модель "{name}" удалена пользователем {username}',
+    'subcategory.added': 'Цвет "{name}" добавлен пользователем {username}',
+    'subcategory.updated': 'Цвет "{name}" обновлен пользователем {username}',
+    'subcategory.deleted': 'Цвет "{name}" удален пользователем {username}',
+    'sale.completed': 'Продажа №{number} на основе корзины №{cart_number} завершена пользователем {username}',
+    'sale.item_added': 'Товар "{product_name}" (кол-во: {quantity}) добавлен в продажу №{number} пользователем {username}',
+    'sale.item_removed': 'Товар "{product_name}" (кол-во: {quantity}) удалён из продажи №{number} пользователем {username}',
+    'sale.item_returned': 'Возврат {quantity} x "{product_name}" из продажи №{number} пользователем {username}',
+    'sale.comment_added': 'Комментарий к продаже №{number} добавлен пользователем {username}',
+    'sale.comment_updated': 'Комментарий к продаже №{number} обновлён пользователем {username}',
+    'sale.comment_deleted': 'Комментарий к продаже №{number} удалён пользователем {username}',
+    'cart.created': 'Новая корзина №{number} создана пользователем {username}',
+    'cart.created_by_scan': 'Новая корзина №{number} создана пользователем {username} через сканирование',
+    'cart.deleted': 'Корзина №{number} удалена пользователем {username}',
+    'cart.item_added': 'Товар "{product_name}" (кол-во: {quantity}) добавлен в корзину №{number} пользователем {username}',
+    'cart.item_increased': 'Количество товара "{product_name}" в корзине №{number} увеличено на {quantity} (итого: {total}) пользователем {username}',
+    'cart.item_increased_by_scan': 'Количество товара "{product_name}" в корзине №{number} увеличено на {quantity} (итого: {total}) пользователем {username} через сканирование UUID',
+    'cart.item_scanned': 'Товар "{product_name}" (кол-во: {quantity}) добавлен в корзину №{number} пользователем {username} через сканирование UUID',
+    'cart.items_scanned': 'В корзину №{number} добавлено {lines} товар(ов), {quantity} шт., пользователем {username} через сканирование UUID',
+    'cart.comment_added': 'Комментарий к корзине №{number} добавлен пользователем {username}',
+    'cart.comment_updated': 'Комментарий к корзине №{number} обновлён пользователем {username}',
+    'cart.comment_deleted': 'Комментарий к корзине №{number} удалён пользователем {username}',
+}
+
+def render_log_message(event, params, username, message=''):
+    """Текст записи журнала. Старые записи (без события) хранят готовый текст в message."""
+    template = LOG_MESSAGES.get(event)
+    if template is None:
+        return message
+    try:
+        return template.format(**{'username': username or 'Неизвестный', **(params or {})})
+    except (KeyError, IndexError, ValueError):
+        return message or template
+
 class LogEntry(models.Model):
     ACTION_TYPES = (
         ('LOGIN', 'Вход'),
@@ -301,17 +515,54 @@ class LogEntry(models.Model):
         ('REJECT', 'Отклонение регистрации'),
     )
 
+    OBJECT_TYPES = (
+        ('product', 'Товар'),
+        ('sale', 'Продажа'),
+        ('cart', 'Корзина'),
+        ('warehouse', 'Склад'),
+        ('category', 'Модель'),
+        ('subcategory', 'Цвет'),
+        ('user', 'Пользователь'),
+    )
+
     timestamp = models.DateTimeField(auto_now_add=True, verbose_name="Время")
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='inventory_log_entries', verbose_name="Пользователь")
     action_type = models.CharField(max_length=20, choices=ACTION_TYPES, verbose_name="Тип действия")
-    message = models.TextField(verbose_name="Сообщение")
+    # Объект записи и товар позиции (для продаж и корзин) — без внешних ключей, чтобы история пережила удаление
+    object_type = models.CharField(max_length=20, choices=OBJECT_TYPES, blank=True, default='', verbose_name="Тип объекта")
+    object_id = models.PositiveBigIntegerField(null=True, blank=True, verbose_name="ID объекта")
+    related_product_id = models.PositiveBigIntegerField(null=True, blank=True, verbose_name="ID товара")
+    event = models.CharField(max_length=50, blank=True, default='', verbose_name="Событие")
+    params = models.JSONField(default=dict, blank=True, verbose_name="Параметры")
+    message = models.TextField(blank=True, default='', verbose_name="Сообщение")
 
     def get_action_type_display(self):
         return dict(self.ACTION_TYPES).get(self.action_type, self.action_type)
 
+    @property
+    def text(self):
+        return render_log_message(self.event, self.params, self.user.username if self.user_id else None, self.message)
+
+    @classmethod
+    def history(cls, object_type, object_id):
+        """История объекта по индексам: записи о нём самом, а для товара — ещё и о позициях с ним в продажах и корзинах."""
+        condition = models.Q(object_type=object_type, object_id=object_id)
+        if object_type == 'product':
+            condition |= models.Q(related_product_id=object_id)
+        return cls.objects.filter(condition).select_related('user').order_by('-timestamp', '-id')
+
     def __str__(self):
-        return f"{self.user} - {self.timestamp} - {self.get_action_type_display()} - {self.message}"
+        return f"{self.user} - {self.timestamp} - {self.get_action_type_display()} - {self.text}"
 
     class Meta:
         verbose_name = "Запись лога"
-        verbose_name_plural = "Записи логов"
\ No newline at end of file
+        verbose_name_plural = "Записи логов"
+        indexes = [
+            # Лента журнала и курсорная пагинация: WHERE/ORDER BY (timestamp, id)
+            models.Index(fields=['timestamp', 'id'], name='logentry_timestamp_id_idx'),
+            # Журнал обычного пользователя: только свои записи по времени
+            models.Index(fields=['user', 'timestamp'], name='logentry_user_time_idx'),
+            # История объекта (LogEntry.history)
+            models.Index(fields=['object_type', 'object_id', 'timestamp'], name='logentry_object_idx'),
+            models.Index(fields=['related_product_id', 'timestamp'], name='logentry_product_idx'),
+        ]
@@ -0,0 +1,143 @@
+import base64
+import datetime
+import decimal
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# Сколько секунд хранится посчитанное количество строк для постраничной навигации
+COUNT_CACHE_TIMEOUT = 60
+
+
+def count_cache_key(prefix, request, ignore=('page', 'cursor')):
+    """Ключ кэша количества: владелец + параметры фильтрации без параметров навигации."""
+    params = sorted((key, value) for key, value in request.GET.items() if key not in ignore and value)
+    digest = hashlib.md5(json.dumps(params).encode()).hexdigest()
+    return f'{prefix}:count:{request.user.pk}:{digest}'
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, который берёт общее количество из кэша вместо COUNT на каждый запрос.
+
+    Количество может отставать от реального на COUNT_CACHE_TIMEOUT секунд —
+    для навигации по страницам этого достаточно.
+    """
+
+    def __init__(self, object_list, per_page, cache_key, timeout=COUNT_CACHE_TIMEOUT, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.cache_key = cache_key
+        self.timeout = timeout
+
+    @cached_property
+    def count(self):
+        count = cache.get(self.cache_key)
+        if count is None:
+            count = super().count
+            cache.set(self.cache_key, count, self.timeout)
+        return count
+
+
+class CursorPage:
+    """Страница курсорной навигации с интерфейсом, похожим на Page."""
+    is_cursor = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def _cursor_value(value):
+    # Полная точность: DjangoJSONEncoder обрезает микросекунды, и строка на границе страницы потерялась бы
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps([direction, [_cursor_value(value) for value in values]])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Возвращает (направление, значения ключа) или None для пустого и испорченного курсора."""
+    if not cursor:
+        return None
+    try:
+        direction, values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        return None
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        return None
+    return direction, values
+
+
+def keyset_filter(ordering, values, reverse=False):
+    """Условие «строка идёт после values» для сортировки ordering, например ('-date', '-id')."""
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        descending = field.startswith('-')
+        name = field.lstrip('-')
+        lookup = 'lt' if descending != reverse else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def cursor_paginate(queryset, ordering, cursor, per_page):
+    """Keyset-пагинация: одна выборка per_page + 1 строк по индексу, без COUNT и OFFSET."""
+    position = decode_cursor(cursor)
+    if position and len(position[1]) != len(ordering):
+        position = None
+    reverse = position is not None and position[0] == 'prev'
+    if position:
+        try:
+            queryset = queryset.filter(keyset_filter(ordering, position[1], reverse))
+        except (ValidationError, ValueError, TypeError):
+            # Подделанный курсор — как и неверный номер страницы, показываем первую страницу
+            position, reverse = None, False
+    if reverse:
+        ordering_for_query = [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+    else:
+        ordering_for_query = list(ordering)
+
+    rows = list(queryset.order_by(*ordering_for_query)[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if reverse:
+        rows.reverse()
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, position is not None
+
+    def key_of(row):
+        return [getattr(row, field.lstrip('-')) for field in ordering]
+
+    return CursorPage(
+        rows,
+        next_cursor=encode_cursor('next', key_of(rows[-1])) if has_next and rows else None,
+        previous_cursor=encode_cursor('prev', key_of(rows[0])) if has_previous and rows else None,
+    )
@@ -0,0 +1,86 @@
+import cProfile
+import io
+import pstats
+import re
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+# Профилирование по запросу (settings.INVENTORY_PROFILING): суперпользователь добавляет к адресу
+# ?_profile=1 (или заголовок X-Profile: 1), запрос выполняется под cProfile, в DIR сохраняются
+# .prof для snakeviz/pstats и текстовая сводка. Хранятся последние KEEP профилей.
+DEFAULTS = {
+    'ENABLED': True,
+    'QUERY_PARAM': '_profile',
+    'HEADER': 'X-Profile',
+    'DIR': Path(settings.BASE_DIR) / 'profiles',
+    'KEEP': 20,
+    'TOP': 40,
+}
+
+PROFILE_NAME_RE = re.compile(r'^[\w.-]+$')
+
+# cProfile — один на процесс: пока идёт одно профилирование, остальные запросы выполняются как обычно
+_profile_lock = threading.Lock()
+
+
+def profiling_settings():
+    return {**DEFAULTS, **getattr(settings, 'INVENTORY_PROFILING', {})}
+
+
+def requested_mode(request, options):
+    """'summary' — вернуть сводку вместо страницы, 'save' — страница как обычно, None — без профилирования."""
+    value = request.GET.get(options['QUERY_PARAM'])
+    if value is None:
+        value = request.headers.get(options['HEADER'])
+    if not value or value == '0':
+        return None
+    return 'summary' if value == 'summary' else 'save'
+
+
+def summary_text(profiler, top):
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(top)
+    return stream.getvalue()
+
+
+def save_profile(profiler, view_name, options):
+    """Пишет .prof и сводку .txt, удаляет старые профили сверх KEEP. Возвращает имя профиля."""
+    directory = Path(options['DIR'])
+    directory.mkdir(parents=True, exist_ok=True)
+    safe_view_name = re.sub(r'[^\w.-]', '_', view_name)
+    name = f'{timezone.now():%Y%m%d-%H%M%S-%f}-{safe_view_name}'
+    profiler.dump_stats(directory / f'{name}.prof')
+    (directory / f'{name}.txt').write_text(summary_text(profiler, options['TOP']), encoding='utf-8')
+    for stale in list_profiles(directory)[options['KEEP']:]:
+        for suffix in ('.prof', '.txt'):
+            (directory / f'{stale}{suffix}').unlink(missing_ok=True)
+    return name
+
+
+def list_profiles(directory=None):
+    """Имена сохранённых профилей от новых к старым."""
+    directory = Path(directory or profiling_settings()['DIR'])
+    if not directory.exists():
+        return []
+    return sorted((path.stem for path in directory.glob('*.prof')), reverse=True)
+
+
+def profile_file(name, suffix):
+    """Путь к файлу профиля или None, если имя недопустимо или файла нет."""
+    if not PROFILE_NAME_RE.match(name):
+        return None
+    path = Path(profiling_settings()['DIR']) / f'{name}{suffix}'
+    return path if path.is_file() else None
+
+
+def acquire():
+    return _profile_lock.acquire(blocking=False)
+
+
+def release():
+    _profile_lock.release()
@@ -0,0 +1,147 @@
+import contextvars
+import functools
+import re
+import sqlite3
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+
+# Чтение отчётов с реплики (settings.INVENTORY_REPLICA, по умолчанию выключено): представления с
+# декоратором use_replica читают из базы ALIAS, все записи идут в default. После своей записи
+# пользователь STICKY_SECONDS читает только default — иначе отстающая реплика не покажет его же
+# продажу. Запросы вне представлений (команды, фоновые потоки) всегда идут в default.
+DEFAULTS = {
+    'ENABLED': False,
+    'ALIAS': 'replica',
+    'STICKY_SECONDS': 30,
+    # Эти приложения всегда читаются из default, и запись в них не закрепляет пользователя за default:
+    # сессия сохраняется на каждом запросе, а устаревшая сессия с реплики разлогинила бы пользователя
+    'PRIMARY_ONLY_APPS': ('sessions',),
+}
+
+SESSION_KEY = '_replica_pinned_until'
+
+# Запись определяется по выполненному SQL, а не по db_for_write: get_or_create и select_for_update
+# спрашивают базу для записи, даже когда ничего не пишут
+WRITE_SQL_RE = re.compile(r'\s*(?:INSERT\s+(?:OR\s+\w+\s+)?INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM)\s+"?(\w+)"?', re.IGNORECASE)
+
+_request_state = contextvars.ContextVar('inventory_replica_state', default=None)
+
+
+def replica_settings():
+    return {**DEFAULTS, **getattr(settings, 'INVENTORY_REPLICA', {})}
+
+
+class RoutingState:
+    """Маршрутизация текущего запроса: читать ли с реплики и была ли уже запись."""
+    __slots__ = ('alias', 'read_replica', 'wrote', 'primary_only_apps', 'primary_only_tables')
+
+    def __init__(self, alias, primary_only_apps):
+        self.alias = alias
+        self.read_replica = False
+        self.wrote = False
+        self.primary_only_apps = frozenset(primary_only_apps)
+        self.primary_only_tables = frozenset(
+            model._meta.db_table for app_label in primary_only_apps for model in apps.get_app_config(app_label).get_models()
+        )
+
+
+def start_request(options):
+    return _request_state.set(RoutingState(options['ALIAS'], options['PRIMARY_ONLY_APPS']))
+
+
+def finish_request(token):
+    state = _request_state.get()
+    _request_state.reset(token)
+    return state
+
+
+def is_pinned(request):
+    session = getattr(request, 'session', None)
+    return session is not None and session.get(SESSION_KEY, 0) > time.time()
+
+
+def pin(request, seconds):
+    session = getattr(request, 'session', None)
+    if session is not None:
+        session[SESSION_KEY] = time.time() + seconds
+
+
+def use_replica(view):
+    """Чтение этого представления идёт с реплики, если пользователь недавно ничего не записывал."""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        state = _request_state.get()
+        if state is not None and not is_pinned(request):
+            state.read_replica = True
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+class ReplicaRouter:
+    """DATABASE_ROUTERS: чтение с реплики только внутри представлений с use_replica, запись — всегда в default."""
+
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if state is None:
+            return None
+        if state.read_replica and not state.wrote and model._meta.app_label not in state.primary_only_apps:
+            return state.alias
+        # Внутри запроса явно: иначе связанные объекты записи, прочитанной с реплики, читались бы оттуда же
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика — копия default: объекты из обеих баз можно связывать
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплики приходит вместе с данными (sync_replica), миграции на неё не применяются
+        return db != replica_settings()['ALIAS']
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """Отмечает запись в текущем запросе: дальше запрос и STICKY_SECONDS после него читают из default."""
+    state = _request_state.get()
+    if state is not None and not state.wrote:
+        match = WRITE_SQL_RE.match(sql)
+        if match and match.group(1) not in state.primary_only_tables:
+            state.wrote = True
+    return execute(sql, params, many, context)
+
+
+def install_execute_wrapper(sender, connection, **kwargs):
+    """Обработчик connection_created, см. inventory.metrics.install_execute_wrapper."""
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, execute_wrapper)
+
+
+def backup(source_name, target_name, pages=-1):
+    """Копирует файл SQLite source_name в target_name через backup API.
+
+    Копия согласованна: backup читает один снимок базы, даже если в неё идёт запись. Читатели копии
+    на время копирования ждут (busy_timeout) и затем видят новое состояние целиком.
+    """
+    source_db, target_db = sqlite3.connect(source_name), sqlite3.connect(target_name)
+    try:
+        source_db.backup(target_db, pages=pages)
+    finally:
+        source_db.close()
+        target_db.close()
+
+
+def sync(source_alias='default', replica_alias=None):
+    """Обновляет реплику копией source_alias. Возвращает время копирования, с."""
+    replica_alias = replica_alias or replica_settings()['ALIAS']
+    source, target = connections[source_alias].settings_dict, connections[replica_alias].settings_dict
+    for alias, settings_dict in ((source_alias, source), (replica_alias, target)):
+        if settings_dict['ENGINE'] != 'django.db.backends.sqlite3':
+            raise ValueError(f'База {alias} не SQLite — копируйте её средствами СУБД')
+    start = time.perf_counter()
+    backup(source['NAME'], target['NAME'])
+    return time.perf_counter() - start
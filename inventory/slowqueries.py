@@ -0,0 +1,131 @@
+import contextvars
+import re
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.utils import timezone
+
+# Журнал медленных запросов (settings.INVENTORY_SLOW_QUERIES, по умолчанию выключен): запросы дольше
+# THRESHOLD_MS попадают в кольцевой буфер на BUFFER_SIZE записей вместе с именем представления и планом
+# EXPLAIN. Параметры запросов не сохраняются — только SQL с плейсхолдерами. Буфер у каждого процесса свой.
+DEFAULTS = {
+    'ENABLED': False,
+    'THRESHOLD_MS': 100,
+    'BUFFER_SIZE': 200,
+    'EXPLAIN': True,
+}
+
+_request_context = contextvars.ContextVar('inventory_slow_query_context', default=None)
+
+
+def slow_query_settings():
+    return {**DEFAULTS, **getattr(settings, 'INVENTORY_SLOW_QUERIES', {})}
+
+
+class QueryContext:
+    """Настройки записи и имя представления текущего запроса (имя появляется после разбора URL)."""
+    __slots__ = ('view', 'threshold', 'explain')
+
+    def __init__(self, threshold, explain):
+        self.view = '<unresolved>'
+        self.threshold = threshold
+        self.explain = explain
+
+
+def start_request(threshold, explain):
+    return _request_context.set(QueryContext(threshold, explain))
+
+
+def set_view(view_name):
+    context = _request_context.get()
+    if context is not None:
+        context.view = view_name
+
+
+def finish_request(token):
+    _request_context.reset(token)
+
+
+class SlowQueryLog:
+    def __init__(self, size):
+        self.entries = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def add(self, entry):
+        with self.lock:
+            self.entries.append(entry)
+
+    def snapshot(self):
+        """Записи от новых к старым."""
+        with self.lock:
+            return list(reversed(self.entries))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_log():
+    global _log
+    with _log_lock:
+        if _log is None:
+            _log = SlowQueryLog(slow_query_settings()['BUFFER_SIZE'])
+        return _log
+
+
+def normalize_sql(sql):
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def explain(connection, sql, params):
+    """План запроса отдельным курсором драйвера: мимо execute-обёрток и не сбивая выборку исходного курсора."""
+    cursor = connection.create_cursor()
+    try:
+        cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+        # SQLite: (id, parent, notused, detail); PostgreSQL и другие — одна колонка с текстом
+        return [str(row[-1]) for row in cursor.fetchall()]
+    except Exception as exc:
+        return [f'EXPLAIN не выполнен: {exc}']
+    finally:
+        cursor.close()
+
+
+def is_full_scan(plan):
+    # SQLite: «SCAN таблица» без индекса — полный проход по таблице
+    return any(line.startswith('SCAN ') and ' INDEX ' not in line for line in plan)
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """Подключается к каждому соединению (см. apps.py); работает только внутри запроса с включённым журналом."""
+    request_context = _request_context.get()
+    if request_context is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration = time.perf_counter() - start
+    if duration >= request_context.threshold:
+        plan = []
+        if request_context.explain and not many and sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+            plan = explain(context['connection'], sql, params)
+        get_log().add({
+            'timestamp': timezone.now(),
+            'view': request_context.view,
+            'duration_ms': round(duration * 1000, 1),
+            'sql': normalize_sql(sql),
+            'many': many,
+            'plan': plan,
+            'full_scan': is_full_scan(plan),
+        })
+    return result
+
+
+def install_execute_wrapper(sender, connection, **kwargs):
+    """Обработчик connection_created, см. inventory.metrics.install_execute_wrapper."""
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, execute_wrapper)
@@ -0,0 +1,83 @@
+import functools
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+logger = logging.getLogger(__name__)
+
+# Рабочий профиль SQLite (settings.INVENTORY_SQLITE): PRAGMA применяются к каждому новому соединению.
+# WAL позволяет читать, пока идёт запись; synchronous=NORMAL в режиме WAL не теряет согласованность
+# при сбое процесса (только последние транзакции при сбое питания); busy_timeout — сколько соединение
+# ждёт чужую запись, прежде чем вернуть «database is locked». Транзакции на запись начинаются с
+# BEGIN IMMEDIATE (DATABASES OPTIONS transaction_mode), иначе повышение блокировки с чтения до записи
+# падает сразу, не дожидаясь busy_timeout.
+DEFAULTS = {
+    'PRAGMAS': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,  # в КиБ, то есть 64 МиБ на соединение
+        'temp_store': 'MEMORY',
+    },
+    'RETRY_ATTEMPTS': 4,
+    'RETRY_BASE_DELAY': 0.05,
+    'RETRY_MAX_DELAY': 1.0,
+}
+
+
+def sqlite_settings():
+    options = {**DEFAULTS, **getattr(settings, 'INVENTORY_SQLITE', {})}
+    options['PRAGMAS'] = {**DEFAULTS['PRAGMAS'], **options['PRAGMAS']}
+    return options
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    """Обработчик connection_created: PRAGMA рабочего профиля для соединений SQLite."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in sqlite_settings()['PRAGMAS'].items():
+            if value is not None:
+                cursor.execute(f'PRAGMA {name} = {value}')
+
+
+LOCK_MESSAGES = ('database is locked', 'database table is locked')
+
+
+def is_lock_error(error):
+    """Ошибка блокировки SQLite (SQLITE_BUSY/SQLITE_LOCKED), а не любая OperationalError."""
+    # Django оборачивает исключение sqlite3, код ошибки — у исходного
+    name = getattr(error.__cause__ or error, 'sqlite_errorname', None)
+    if name:
+        return name.startswith(('SQLITE_BUSY', 'SQLITE_LOCKED'))
+    message = str(error).lower()
+    return any(lock_message in message for lock_message in LOCK_MESSAGES)
+
+
+def retry_on_lock(view):
+    """Повторяет представление, если запись упала на блокировке SQLite.
+
+    Повтор безопасен, когда ошибка случилась внутри transaction.atomic представления: транзакция уже
+    откатилась. Внутри внешней транзакции (ATOMIC_REQUESTS, тесты) повтор ничего не даст — ошибка
+    пробрасывается сразу. Паузы растут вдвое со случайным разбросом, чтобы воркеры не повторяли хором.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        options = sqlite_settings()
+        attempt = 0
+        while True:
+            try:
+                return view(request, *args, **kwargs)
+            except OperationalError as error:
+                attempt += 1
+                if not is_lock_error(error) or connection.in_atomic_block or attempt >= options['RETRY_ATTEMPTS']:
+                    raise
+                delay = min(options['RETRY_MAX_DELAY'], options['RETRY_BASE_DELAY'] * 2 ** (attempt - 1))
+                logger.warning('%s: база занята, повтор %d через %.0f мс', view.__name__, attempt, delay * 1000)
+                time.sleep(delay * random.uniform(0.5, 1.0))
+
+    return wrapper
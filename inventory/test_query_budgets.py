@@ -0,0 +1,294 @@
+# inventory/test_query_budgets.py
+# Бюджеты запросов: каждая страница из inventory/urls.py открывается на малом и на большом наборе данных,
+# число запросов к БД должно совпасть. Рост числа запросов вместе с данными — это N+1 (цикл шаблона по
+# sale.items.all, обращение к внешнему ключу в строке списка), и он виден здесь, а не в продакшене.
+import json
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from inventory import urls
+from inventory.models import Product, Warehouse, Sale, SaleItem, Category, Subcategory, LogEntry, Cart, CartItem, \
+    CartComment, UserSettings, SaleComment, Return, search_key
+
+# Размеры наборов: большой меньше страницы списков (10), чтобы рост строк на странице был виден
+SMALL = 2
+LARGE = 8
+
+
+class QueryCountMixin:
+    """Помощник для тестов стоимости: число запросов одного запроса к странице.
+
+    Каждый замер — новый клиент (сообщения и сессия прошлого запроса не влияют), с пустым кэшем (кэш
+    количества строк CachedCountPaginator) и в откатываемой транзакции: изменяющие запросы не меняют данные.
+    Перед замером страница открывается один раз вхолостую — прогрев кэшей ContentType и т.п.
+    """
+
+    def count_queries(self, method, path, data=None, user=None, **extra):
+        counts = []
+        for _ in range(2):
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            cache.clear()
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as queries:
+                    response = getattr(client, method)(path, data or {}, **extra)
+                transaction.set_rollback(True)
+            self.assertLess(response.status_code, 500, f'{method.upper()} {path}')
+            counts.append(len(queries))
+        return counts[-1]
+
+    def assertQueriesConstant(self, measure, grow):
+        """measure() -> {имя: запросов}; grow() добавляет данные. Имена, у которых число запросов выросло, — ошибка."""
+        before = measure()
+        grow()
+        after = measure()
+        grown = [f'{name}: {before[name]} -> {after[name]}' for name in before if after[name] != before[name]]
+        self.assertFalse(grown, 'Число запросов зависит от объёма данных:\n' + '\n'.join(grown))
+
+
+class Dataset:
+    """Данные пользователя, которые растут вызовами grow(). Первые созданные объекты — «фокусные»:
+    их открывают страницы деталей, и с каждым grow() у них тоже прибавляется позиций и комментариев."""
+
+    def __init__(self, user):
+        self.user = user
+        self.created = 0
+        self.category = self.subcategory = self.warehouse = self.product = self.archived_product = None
+        self.sale = self.cart = None
+        # Модель и цвет без товаров — их можно удалить
+        self.free_category = Category.objects.create(name='Без товаров', owner=user)
+        self.free_subcategory = Subcategory.objects.create(name='Без товаров', owner=user)
+
+    def grow(self, count):
+        user = self.user
+        products = []
+        for _ in range(count):
+            self.created += 1
+            number = self.created
+            category = Category.objects.create(name=f'Модель {number}', owner=user)
+            subcategory = Subcategory.objects.create(name=f'Цвет {number}', owner=user)
+            warehouse = Warehouse.objects.create(name=f'Склад {number}', owner=user)
+            archive = Warehouse.objects.create(name=f'Архив {number}', owner=user)
+            # bulk_create не вызывает Product.save: без QR-кодов и с заданным названием
+            active, archived = Product.objects.bulk_create([
+                Product(
+                    name=f'Модель {number} - Цвет {number}{suffix}', search_name=search_key(f'Модель {number} - Цвет {number}{suffix}'),
+                    unique_id=f'product-{number}{suffix}', category=category, subcategory=subcategory,
+                    warehouse=archive if suffix else warehouse, quantity=1000, selling_price=100, cost_price=60,
+                    owner=user, is_archived=bool(suffix),
+                )
+                for suffix in ('', '-archived')
+            ])
+            products.append(active)
+            self.category = self.category or category
+            self.subcategory = self.subcategory or subcategory
+            self.warehouse = self.warehouse or warehouse
+            self.product = self.product or active
+            self.archived_product = self.archived_product or archived
+
+            pending = User.objects.create_user(username=f'pending{number}', email=f'pending{number}@example.com', is_active=False)
+            UserSettings.objects.create(user=pending, is_pending=True)
+            active_user = User.objects.create_user(username=f'active{number}', email=f'active{number}@example.com')
+            UserSettings.objects.create(user=active_user)
+
+        for product in products:
+            sale = Sale.objects.create(owner=user)
+            cart = Cart.objects.create(owner=user)
+            self.sale = self.sale or sale
+            self.cart = self.cart or cart
+            self._add_sale_items(sale, [product, self.product])
+            self._add_cart_items(cart, [product, self.product])
+            SaleComment.objects.create(sale=sale, text='Комментарий')
+            CartComment.objects.create(cart=cart, text='Комментарий')
+
+        # Фокусные продажа и корзина растут вместе с набором
+        self._add_sale_items(self.sale, products)
+        self._add_cart_items(self.cart, products)
+        SaleComment.objects.bulk_create([SaleComment(sale=self.sale, text=f'Комментарий {i}') for i in range(count)])
+        CartComment.objects.bulk_create([CartComment(cart=self.cart, text=f'Комментарий {i}') for i in range(count)])
+        Return.objects.bulk_create([
+            Return(sale=self.sale, sale_item=item, quantity=1, owner=user)
+            for item in self.sale.items.filter(product__in=products)
+        ])
+        LogEntry.objects.bulk_create([
+            LogEntry(user=user, action_type='SALE', event='sale.completed', object_type='sale', object_id=self.sale.id,
+                     related_product_id=self.product.id, params={'number': self.sale.number, 'cart_number': 1})
+            for _ in range(count)
+        ] + [
+            LogEntry(user=user, action_type='ADD', event='product.added', object_type='product', object_id=product.id,
+                     params={'name': product.name})
+            for product in products
+        ])
+
+    def _add_sale_items(self, sale, products):
+        existing = set(sale.items.values_list('product_id', flat=True))
+        SaleItem.objects.bulk_create([
+            SaleItem(sale=sale, product=product, quantity=2, base_price_total=200, actual_price_total=180)
+            for product in dict.fromkeys(products) if product.id not in existing
+        ])
+        sale.update_totals()
+
+    def _add_cart_items(self, cart, products):
+        # В корзине товар встречается одной позицией
+        existing = set(cart.items.values_list('product_id', flat=True))
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=1, base_price_total=100, actual_price_total=90)
+            for product in dict.fromkeys(products) if product.id not in existing
+        ])
+        cart.update_totals()
+
+
+class Case:
+    """Запрос к странице: request(data) возвращает (метод, путь, параметры); admin — от суперпользователя,
+    anonymous — без входа."""
+
+    def __init__(self, url_name, request, admin=False, anonymous=False, variant=''):
+        self.url_name = url_name
+        self.request = request
+        self.admin = admin
+        self.anonymous = anonymous
+        self.name = f'{url_name}:{variant}' if variant else url_name
+
+
+def get(url_name, *args, params=None, **options):
+    return Case(url_name, lambda data: ('get', reverse(url_name, args=[arg(data) for arg in args]), params and params(data)), **options)
+
+
+def post(url_name, *args, params=None, **options):
+    return Case(url_name, lambda data: ('post', reverse(url_name, args=[arg(data) for arg in args]), params and params(data)), **options)
+
+
+def post_json(url_name, *args, payload, **options):
+    return Case(url_name, lambda data: (
+        'post', reverse(url_name, args=[arg(data) for arg in args]), json.dumps(payload(data))
+    ), **options)
+
+
+def product_id(data):
+    return data.product.id
+
+
+def sale_id(data):
+    return data.sale.id
+
+
+def cart_id(data):
+    return data.cart.id
+
+
+CASES = [
+    get('login', anonymous=True),
+    post('login', params=lambda data: {'username': 'owner', 'password': 'ownerpass'}, anonymous=True, variant='post'),
+    get('logout'),
+    get('register', anonymous=True),
+    get('profile'),
+
+    get('products'),
+    get('products', params=lambda data: {'sort_by': 'warehouse__name'}, variant='sorted'),
+    get('product_add'),
+    get('product_edit', product_id),
+    post('product_delete', product_id),
+    get('product_detail', product_id),
+    get('get_product_price', params=lambda data: {'product_id': data.product.id}),
+    get('get_product_by_uuid', params=lambda data: {'unique_id': data.product.unique_id}),
+    get('get_product_by_id', params=lambda data: {'product_id': data.product.id}),
+    get('product_search', params=lambda data: {'q': 'модель'}),
+    post('product_archive', product_id),
+    post('product_unarchive', lambda data: data.archived_product.id),
+    get('archived_products'),
+
+    get('warehouses'),
+    get('warehouse_add'),
+    get('warehouse_edit', lambda data: data.warehouse.id),
+    post('warehouse_delete', lambda data: data.warehouse.id),
+
+    get('category_manage'),
+    get('category_edit', lambda data: data.category.id),
+    post('category_delete', lambda data: data.free_category.id),
+    get('subcategory_edit', lambda data: data.subcategory.id),
+    post('subcategory_delete', lambda data: data.free_subcategory.id),
+
+    get('sales_list'),
+    get('sales_list', params=lambda data: {'sort_by': '-actual_total'}, variant='sorted'),
+    get('sale_detail', sale_id),
+    get('sale_edit', sale_id),
+    get('return_item', sale_id, lambda data: data.sale.items.order_by('id').first().id),
+    post('return_item', sale_id, lambda data: data.sale.items.order_by('id').first().id,
+         params=lambda data: {'quantity': 1}, variant='post'),
+    post('sale_comment_add', sale_id, params=lambda data: {'comment_text': 'Новый'}),
+    post('sale_comment_edit', sale_id, lambda data: data.sale.comments.order_by('id').first().id,
+         params=lambda data: {'comment_text': 'Исправлено'}),
+    post('sale_comment_delete', sale_id, lambda data: data.sale.comments.order_by('id').first().id),
+
+    get('cart_list'),
+    get('cart_list', params=lambda data: {'sort_by': '-actual_total'}, variant='sorted'),
+    post('cart_create'),
+    get('cart_add_item', cart_id),
+    post_json('cart_add_item_json', cart_id, payload=lambda data: {'product': data.product.id, 'quantity': 1, 'actual_price': 0}),
+    post_json('cart_add_items', cart_id, payload=lambda data: {'items': [{'product': data.product.id, 'quantity': 1}]}),
+    post('cart_remove_item', cart_id, lambda data: data.cart.items.order_by('id').first().id),
+    post('cart_confirm', cart_id),
+    post('cart_cancel', cart_id),
+    post('cart_delete', cart_id),
+    post('cart_comment_add', cart_id, params=lambda data: {'comment_text': 'Новый'}),
+    post('cart_comment_edit', cart_id, lambda data: data.cart.comments.order_by('id').first().id,
+         params=lambda data: {'comment_text': 'Исправлено'}),
+    post('cart_comment_delete', cart_id, lambda data: data.cart.comments.order_by('id').first().id),
+
+    get('scan_product', params=lambda data: {'code': data.product.unique_id}),
+    post('scan_product_confirm', params=lambda data: {'product_id': data.product.id, 'quantity': 1, 'actual_price': 0}),
+
+    get('stats'),
+    get('user_logs'),
+    get('user_logs', admin=True, variant='admin'),
+    get('object_history', lambda data: 'sale', sale_id),
+    get('object_history', lambda data: 'product', product_id, variant='product'),
+
+    get('admin_panel', admin=True),
+    get('metrics', admin=True),
+    get('memory_diagnostics', admin=True),
+    get('profile_download', lambda data: 'budget', admin=True),
+    get('profile_summary', lambda data: 'budget', admin=True),
+]
+
+
+class QueryBudgetTestCase(QueryCountMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='ownerpass')
+        UserSettings.objects.create(user=self.user)
+        self.admin = User.objects.create_superuser(username='admin', password='adminpass')
+        UserSettings.objects.create(user=self.admin)
+        self.data = Dataset(self.user)
+        self.data.grow(SMALL)
+        # Файлы для страниц профилей
+        profiles = tempfile.TemporaryDirectory()
+        self.addCleanup(profiles.cleanup)
+        for suffix in ('.prof', '.txt'):
+            with open(f'{profiles.name}/budget{suffix}', 'w', encoding='utf-8') as profile:
+                profile.write('profile')
+        settings_override = override_settings(INVENTORY_PROFILING={'DIR': profiles.name})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def measure(self):
+        counts = {}
+        for case in CASES:
+            method, path, params = case.request(self.data)
+            extra = {'content_type': 'application/json'} if isinstance(params, str) else {}
+            user = None if case.anonymous else self.admin if case.admin else self.user
+            counts[case.name] = self.count_queries(method, path, params, user=user, **extra)
+        return counts
+
+    def test_every_url_has_a_case(self):
+        url_names = {pattern.name for pattern in urls.urlpatterns}
+        self.assertEqual(url_names - {case.url_name for case in CASES}, set())
+
+    def test_query_counts_do_not_grow_with_data(self):
+        self.assertQueriesConstant(self.measure, lambda: self.data.grow(LARGE - SMALL))
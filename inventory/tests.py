@@ -1,10 +1,32 @@
 # inventory/tests.py
-from django.test import TestCase, TransactionTestCase
+from django.test import Client, LiveServerTestCase, SimpleTestCase, TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.http import HttpResponse
+from asgiref.sync import sync_to_async
 from django.urls import reverse
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.utils import timezone
 from django.contrib.auth.models import User
-from django.db import connection
+from django.db import connection, connections, transaction, OperationalError
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+import json
+import logging
 import os
-from inventory.models import Product, Warehouse, Sale, SaleItem, Category, Subcategory, LogEntry, Cart, UserSettings
+import sqlite3
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from urllib.parse import urlsplit
+import threading
+import time
+import tracemalloc
+import uuid
+from inventory.models import Product, Warehouse, Sale, SaleItem, Category, Subcategory, LogEntry, Cart, CartItem, \
+    CartComment, NumberSequence, UserSettings, SaleComment, Return, search_key
+from inventory.views import take_stock, take_stock_bulk
+from inventory.middleware import LogBufferMiddleware, MemoryDiagnosticsMiddleware
+from inventory import benchmarks, loadtest, logsink, memory, metrics, replicas, slowqueries, sqlite
 
 class AuthTestCase(TestCase):
     def setUp(self):
@@ -418,7 +440,7 @@ class LoggingTestCase(TestCase):
             'password2': 'newpassword123',
         })
         log_entry = LogEntry.objects.get(action_type='REGISTER')
-        self.assertEqual(log_entry.message, 'Новый пользователь newuser зарегистрирован')
+        self.assertEqual(log_entry.text, 'Новый пользователь newuser зарегистрирован')
 
     def test_logging_category_creation(self):
         self.client.login(username='admin', password='adminpassword123')
@@ -427,7 +449,7 @@ class LoggingTestCase(TestCase):
             'add_category': '1',
         })
         log_entry = LogEntry.objects.get(action_type='ADD')
-        self.assertEqual(log_entry.message, 'Категория "New Category" добавлена администратором admin')
+        self.assertEqual(log_entry.text, 'Категория "New Category" добавлена администратором admin')
 
 class ScanAndSaleTestCase(TestCase):
     def setUp(self):
@@ -526,4 +548,1290 @@ class StatsTestCase(TestCase):
         Subcategory.objects.all().delete()
         Category.objects.all().delete()
         UserSettings.objects.all().delete()
-        User.objects.all().delete()
\ No newline at end of file
+        User.objects.all().delete()
+
+class InventoryDataMixin:
+    """Общие данные тестов: владелец с настройками, его модель и склад, товары через bulk_create.
+
+    bulk_create не вызывает Product.save, поэтому QR-коды не генерируются; название и search_name
+    заполняются так же, как в save.
+    """
+
+    def create_owner(self, username='testuser', password='testpass'):
+        user = User.objects.create_user(username=username, password=password)
+        UserSettings.objects.create(user=user)
+        return user
+
+    def create_catalog(self, category='Test Category', warehouse='Test Warehouse'):
+        self.user = self.create_owner()
+        self.category = Category.objects.create(name=category, owner=self.user)
+        self.warehouse = Warehouse.objects.create(name=warehouse, owner=self.user)
+
+    def build_product(self, name, **fields):
+        return Product(**{
+            'name': name, 'search_name': search_key(name), 'unique_id': str(uuid.uuid4()), 'category': self.category,
+            'quantity': 10, 'selling_price': 100, 'warehouse': self.warehouse, 'owner': self.user, **fields,
+        })
+
+    def create_products(self, *colors, **fields):
+        """По товару модели self.category на каждый цвет, с названием «Модель - Цвет»."""
+        subcategories = Subcategory.objects.bulk_create([Subcategory(name=color, owner=self.user) for color in colors])
+        return Product.objects.bulk_create([
+            self.build_product(f'{self.category.name} - {subcategory.name}', subcategory=subcategory, **fields)
+            for subcategory in subcategories
+        ])
+
+
+class ConcurrentStockTestCase(InventoryDataMixin, TransactionTestCase):
+    def setUp(self):
+        self.create_catalog()
+        self.product, = self.create_products('Test Subcategory', quantity=25)
+        self.client.login(username='testuser', password='testpass')
+
+    def test_parallel_take_stock_does_not_oversell(self):
+        threads_count = 8
+        attempts_per_thread = 5  # 40 попыток списать по 1 шт. при остатке 25
+        barrier = threading.Barrier(threads_count)
+        successes = []
+
+        def worker():
+            try:
+                barrier.wait()
+                for _ in range(attempts_per_thread):
+                    while True:
+                        try:
+                            if take_stock(self.product.id, 1):
+                                successes.append(1)
+                            break
+                        except OperationalError:
+                            # Общая in-memory база SQLite отвечает "table is locked" вместо ожидания
+                            time.sleep(0.001)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.product.refresh_from_db()
+        self.assertEqual(len(successes), 25)
+        self.assertEqual(self.product.quantity, 0)
+
+    def _run_in_threads(self, threads_count, target):
+        barrier = threading.Barrier(threads_count)
+
+        def worker():
+            try:
+                barrier.wait()
+                target()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_parallel_take_stock_bulk_does_not_oversell(self):
+        other, = self.create_products('Other Subcategory')
+        quantities = {self.product.id: 2, other.id: 1}
+        successes = []
+
+        def checkout():
+            for _ in range(5):  # 40 попыток при остатке на 10 продаж (по второму товару)
+                while True:
+                    try:
+                        with transaction.atomic():
+                            if take_stock_bulk(quantities):
+                                successes.append(1)
+                            else:
+                                transaction.set_rollback(True)
+                        break
+                    except OperationalError:
+                        time.sleep(0.001)
+
+        self._run_in_threads(8, checkout)
+
+        self.product.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(len(successes), 10)
+        self.assertEqual((self.product.quantity, other.quantity), (5, 0))
+
+    def test_parallel_checkouts_of_same_product_do_not_oversell(self):
+        carts = [Cart.objects.create(owner=self.user) for _ in range(6)]
+        for cart in carts:
+            CartItem.objects.create(cart=cart, product=self.product, quantity=5, base_price_total=500, actual_price_total=500)
+        pending = list(carts)
+        lock = threading.Lock()
+        # Блокировки общей in-memory базы повторяются; их записи в журнал (django.request, inventory.sqlite) здесь не нужны
+        logging.disable(logging.ERROR)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        # Вход — до потоков: кассы работают под одной сессией
+        self.client.force_login(self.user)
+
+        def checkout():
+            client = Client()
+            client.cookies = self.client.cookies
+            while True:
+                with lock:
+                    if not pending:
+                        return
+                    cart = pending.pop()
+                while True:
+                    try:
+                        client.post(reverse('cart_confirm', args=[cart.id]))
+                        break
+                    except OperationalError:
+                        time.sleep(0.001)
+
+        self._run_in_threads(6, checkout)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 0)
+        self.assertEqual(Sale.objects.filter(owner=self.user).count(), 5)
+        self.assertEqual(SaleItem.objects.aggregate(total=Sum('quantity'))['total'], 25)
+        self.assertEqual(Cart.objects.filter(owner=self.user).count(), 1)
+
+    def test_checkout_of_deleted_product_returns_to_cart(self):
+        cart = Cart.objects.create(owner=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2, base_price_total=200, actual_price_total=200)
+        deleted = []
+
+        def delete_product_before_stock_read(execute, sql, params, many, context):
+            # Товар удаляет «другой запрос» между чтением корзины и чтением остатков
+            if not deleted and '"inventory_product"."id" IN' in sql:
+                deleted.append(True)
+                Product.objects.filter(id=self.product.id).delete()
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(delete_product_before_stock_read):
+            response = self.client.post(reverse('cart_confirm', args=[cart.id]))
+
+        self.assertRedirects(response, reverse('cart_add_item', args=[cart.id]), fetch_redirect_response=False)
+        self.assertEqual(Sale.objects.filter(owner=self.user).count(), 0)
+        self.assertTrue(Cart.objects.filter(id=cart.id).exists())
+
+    def test_checkout_rolls_back_when_stock_was_taken(self):
+        first_cart = Cart.objects.create(owner=self.user)
+        second_cart = Cart.objects.create(owner=self.user)
+        for cart in (first_cart, second_cart):
+            CartItem.objects.create(cart=cart, product=self.product, quantity=15, base_price_total=1500, actual_price_total=1500)
+
+        response = self.client.post(reverse('cart_confirm', args=[first_cart.id]))
+        self.assertRedirects(response, reverse('sales_list'))
+
+        response = self.client.post(reverse('cart_confirm', args=[second_cart.id]))
+        self.assertRedirects(response, reverse('cart_add_item', args=[second_cart.id]), fetch_redirect_response=False)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 10)
+        self.assertEqual(Sale.objects.filter(owner=self.user).count(), 1)
+        self.assertTrue(Cart.objects.filter(id=second_cart.id).exists())
+        self.assertEqual(second_cart.items.count(), 1)
+
+    def test_repeated_confirm_of_same_cart_creates_one_sale(self):
+        cart = Cart.objects.create(owner=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2, base_price_total=200, actual_price_total=200)
+
+        self.client.post(reverse('cart_confirm', args=[cart.id]))
+        response = self.client.post(reverse('cart_confirm', args=[cart.id]))
+        self.assertEqual(response.status_code, 404)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 23)
+        self.assertEqual(Sale.objects.filter(owner=self.user).count(), 1)
+
+
+class CheckoutQueryCountTestCase(InventoryDataMixin, TestCase):
+    def setUp(self):
+        self.create_catalog()
+        self.products = self.create_products(*[f'Color {i}' for i in range(50)])
+        # Счётчик продаж создаётся при первой продаже; создаём его заранее, чтобы сравнивать одинаковые пути
+        NumberSequence.objects.create(owner=self.user, sequence_type='sale')
+        self.client.login(username='testuser', password='testpass')
+
+    def _make_cart(self, lines):
+        cart = Cart.objects.create(owner=self.user)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=2, base_price_total=200, actual_price_total=180)
+            for product in self.products[:lines]
+        ])
+        CartComment.objects.bulk_create([CartComment(cart=cart, text=f'Comment {i}') for i in range(lines)])
+        return cart
+
+    def _confirm_queries(self, cart):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse('cart_confirm', args=[cart.id]))
+        self.assertRedirects(response, reverse('sales_list'), fetch_redirect_response=False)
+        return len(context.captured_queries)
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        small_cart_queries = self._confirm_queries(self._make_cart(1))
+        large_cart_queries = self._confirm_queries(self._make_cart(50))
+        self.assertEqual(small_cart_queries, large_cart_queries)
+
+    def test_bulk_checkout_moves_items_comments_and_stock(self):
+        cart = self._make_cart(50)
+        self._confirm_queries(cart)
+
+        sale = Sale.objects.get(owner=self.user)
+        self.assertEqual(sale.items.count(), 50)
+        self.assertEqual(sale.comments.count(), 50)
+        self.assertFalse(Cart.objects.filter(id=cart.id).exists())
+        self.assertEqual(set(Product.objects.filter(owner=self.user).values_list('quantity', flat=True)), {8})
+
+
+class NumberSequenceTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.other_user = User.objects.create_user(username='otheruser', password='testpass')
+
+    def test_numbers_are_per_owner_and_never_reused(self):
+        first_cart = Cart.objects.create(owner=self.user)
+        second_cart = Cart.objects.create(owner=self.user)
+        other_cart = Cart.objects.create(owner=self.other_user)
+        self.assertEqual((first_cart.number, second_cart.number, other_cart.number), (1, 2, 1))
+
+        second_cart.delete()
+        self.assertEqual(Cart.objects.create(owner=self.user).number, 3)
+        self.assertEqual(Sale.objects.create(owner=self.user).number, 1)
+
+    def test_parallel_allocation_is_collision_free(self):
+        threads_count = 8
+        numbers_per_thread = 10
+        barrier = threading.Barrier(threads_count)
+        numbers = []
+
+        def worker():
+            try:
+                barrier.wait()
+                for _ in range(numbers_per_thread):
+                    while True:
+                        try:
+                            numbers.append(NumberSequence.next_value(self.user, 'sale'))
+                            break
+                        except OperationalError:
+                            # Общая in-memory база SQLite отвечает "table is locked" вместо ожидания
+                            time.sleep(0.001)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(numbers), list(range(1, threads_count * numbers_per_thread + 1)))
+
+
+class DenormalizedTotalsTestCase(InventoryDataMixin, TestCase):
+    def setUp(self):
+        self.create_catalog()
+        self.product, = self.create_products('Test Subcategory')
+        self.client.login(username='testuser', password='testpass')
+
+    def test_cart_totals_follow_add_and_remove(self):
+        cart = Cart.objects.create(owner=self.user)
+        self.client.post(reverse('cart_add_item', args=[cart.id]), {
+            'product': self.product.id,
+            'quantity': 3,
+            'actual_price': 90,
+        })
+        cart.refresh_from_db()
+        self.assertEqual((cart.items_count, cart.total_quantity, cart.base_total, cart.actual_total), (1, 3, 300, 270))
+
+        item = cart.items.get()
+        self.client.get(reverse('cart_remove_item', args=[cart.id, item.id]))
+        cart.refresh_from_db()
+        self.assertEqual((cart.items_count, cart.total_quantity, cart.base_total, cart.actual_total), (0, 0, 0, 0))
+
+    def test_sale_totals_follow_confirm_and_return(self):
+        cart = Cart.objects.create(owner=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=4, base_price_total=400, actual_price_total=360)
+        self.client.post(reverse('cart_confirm', args=[cart.id]))
+
+        sale = Sale.objects.get(owner=self.user)
+        self.assertEqual((sale.items_count, sale.total_quantity, sale.base_total, sale.actual_total), (1, 4, 400, 360))
+
+        item = sale.items.get()
+        self.client.post(reverse('return_item', args=[sale.id, item.id]), {'quantity': 1})
+        sale.refresh_from_db()
+        self.assertEqual((sale.items_count, sale.total_quantity, sale.base_total, sale.actual_total), (1, 3, 300, 270))
+
+    def test_cart_list_sorts_and_hides_empty_by_columns(self):
+        empty_cart = Cart.objects.create(owner=self.user)
+        full_cart = Cart.objects.create(owner=self.user)
+        CartItem.objects.create(cart=full_cart, product=self.product, quantity=1, base_price_total=100, actual_price_total=100)
+
+        response = self.client.get(reverse('cart_list'), {'hide_empty': 'on', 'sort_by': '-actual_total'})
+        self.assertEqual([cart.id for cart in response.context['carts']], [full_cart.id])
+        self.assertNotIn(empty_cart.id, [cart.id for cart in response.context['carts']])
+
+    def _sale_and_cart_with_second_product(self, warehouse):
+        other, = self.create_products('Another Subcategory', selling_price=50, warehouse=warehouse)
+        sale = Sale.objects.create(owner=self.user)
+        SaleItem.objects.create(sale=sale, product=self.product, quantity=1, base_price_total=100, actual_price_total=100)
+        SaleItem.objects.create(sale=sale, product=other, quantity=1, base_price_total=50, actual_price_total=50)
+        cart = Cart.objects.create(owner=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2, base_price_total=200, actual_price_total=200)
+        CartItem.objects.create(cart=cart, product=other, quantity=1, base_price_total=50, actual_price_total=50)
+        return sale, cart, other
+
+    def test_product_delete_updates_totals_of_its_sales_and_carts(self):
+        sale, cart, other = self._sale_and_cart_with_second_product(self.warehouse)
+        self.client.post(reverse('product_delete', args=[other.id]))
+
+        sale.refresh_from_db()
+        cart.refresh_from_db()
+        self.assertEqual(sale.items.count(), 1)
+        self.assertEqual((sale.items_count, sale.total_quantity, sale.base_total, sale.actual_total), (1, 1, 100, 100))
+        self.assertEqual(sale.sort_product_name, self.product.name)
+        self.assertEqual((cart.items_count, cart.total_quantity, cart.base_total, cart.actual_total), (1, 2, 200, 200))
+
+    def test_warehouse_delete_updates_totals_of_its_sales_and_carts(self):
+        other_warehouse = Warehouse.objects.create(name='Another Warehouse', owner=self.user)
+        sale, cart, _ = self._sale_and_cart_with_second_product(other_warehouse)
+        self.assertEqual(sale.sort_warehouse_name, 'Another Warehouse')
+        self.client.post(reverse('warehouse_delete', args=[other_warehouse.id]))
+
+        sale.refresh_from_db()
+        cart.refresh_from_db()
+        self.assertEqual((sale.items_count, sale.actual_total, sale.sort_warehouse_name), (1, 100, 'Test Warehouse'))
+        self.assertEqual((cart.items_count, cart.actual_total), (1, 200))
+
+
+class BatchCartAddTestCase(InventoryDataMixin, TestCase):
+    def setUp(self):
+        self.create_catalog()
+        self.products = self.create_products(*[f'Color {i}' for i in range(30)], quantity=5)
+        self.cart = Cart.objects.create(owner=self.user)
+        self.client.login(username='testuser', password='testpass')
+
+    def _post(self, lines):
+        return self.client.post(
+            reverse('cart_add_items', args=[self.cart.id]),
+            data=json.dumps({'items': lines}),
+            content_type='application/json'
+        )
+
+    def test_lines_are_merged_with_existing_items(self):
+        first, second = self.products[:2]
+        CartItem.objects.create(cart=self.cart, product=first, quantity=1, base_price_total=100, actual_price_total=100)
+
+        response = self._post([
+            {'product': first.id, 'quantity': 1},
+            {'product': second.id, 'quantity': 2, 'actual_price': 80},
+            {'product': first.id, 'quantity': 1},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_quantity'], 5)
+        self.assertEqual(response.json()['actual_total'], 460.0)
+        quantities = dict(self.cart.items.values_list('product_id', 'quantity'))
+        self.assertEqual(quantities, {first.id: 3, second.id: 2})
+
+    def test_insufficient_stock_writes_nothing(self):
+        response = self._post([
+            {'product': self.products[0].id, 'quantity': 2},
+            {'product': self.products[1].id, 'quantity': 6},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.cart.items.count(), 0)
+
+    def test_invalid_prices_are_rejected(self):
+        for price in ('Infinity', '-Infinity', 'NaN', '1e30', '100000000', '10.001', 'abc'):
+            with self.subTest(price=price):
+                response = self._post([{'product': self.products[0].id, 'quantity': 1, 'actual_price': price}])
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['error'], 'Неверный формат данных.')
+        self.assertEqual(self.cart.items.count(), 0)
+
+        response = self._post([{'product': self.products[0].id, 'quantity': 1, 'actual_price': '99999999.99'}])
+        self.assertEqual(response.status_code, 200)
+
+    def test_line_total_over_field_limit_is_rejected(self):
+        response = self._post([{'product': self.products[0].id, 'quantity': 2, 'actual_price': '99999999.99'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.cart.items.count(), 0)
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        with CaptureQueriesContext(connection) as small_batch:
+            self._post([{'product': self.products[0].id, 'quantity': 1}])
+        with CaptureQueriesContext(connection) as large_batch:
+            self._post([{'product': product.id, 'quantity': 1} for product in self.products[1:]])
+        self.assertEqual(len(small_batch.captured_queries), len(large_batch.captured_queries))
+        self.assertEqual(self.cart.items.count(), 30)
+
+
+class AsyncScanEndpointsTestCase(InventoryDataMixin, TestCase):
+    def setUp(self):
+        self.create_catalog()
+        self.product, = self.create_products('Test Subcategory')
+        self.cart = Cart.objects.create(owner=self.user)
+
+    async def test_lookup_endpoints(self):
+        await self.async_client.aforce_login(self.user)
+
+        response = await self.async_client.get(reverse('get_product_by_uuid'), {'unique_id': self.product.unique_id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['warehouse'], 'Test Warehouse')
+
+        response = await self.async_client.get(reverse('get_product_by_id'), {'product_id': self.product.id})
+        self.assertEqual(response.json()['name'], 'Test Category - Test Subcategory')
+
+        response = await self.async_client.get(reverse('get_product_price'), {'product_id': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+        response = await self.async_client.get(reverse('get_product_by_uuid'), {'unique_id': 'missing'})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_add_item_json(self):
+        await self.async_client.aforce_login(self.user)
+        url = reverse('cart_add_item_json', args=[self.cart.id])
+        payload = json.dumps({'product': self.product.id, 'quantity': 2, 'actual_price': 90})
+
+        response = await self.async_client.post(url, payload, content_type='application/json')
+        self.assertEqual(response.json(), {'success': True, 'cart_id': self.cart.id})
+        response = await self.async_client.post(url, payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        cart_item = await CartItem.objects.aget(cart=self.cart)
+        self.assertEqual((cart_item.quantity, cart_item.actual_price_total), (4, 360))
+        await self.cart.arefresh_from_db()
+        self.assertEqual(self.cart.total_quantity, 4)
+
+    async def test_repeated_scans_cannot_exceed_stock(self):
+        await self.async_client.aforce_login(self.user)
+        url = reverse('cart_add_item_json', args=[self.cart.id])
+        payload = json.dumps({'product': self.product.id, 'quantity': 4})
+
+        for _ in range(2):
+            response = await self.async_client.post(url, payload, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+        # В корзине уже 8 из 10: ещё 4 не хватит, хотя по отдельности 4 <= 10
+        response = await self.async_client.post(url, payload, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Недостаточно товара', response.json()['error'])
+
+        cart_item = await CartItem.objects.aget(cart=self.cart)
+        self.assertEqual(cart_item.quantity, 8)
+
+    def test_legacy_xhr_add_item_is_served_by_async_view(self):
+        self.client.login(username='testuser', password='testpass')
+        response = self.client.post(
+            reverse('cart_add_item', args=[self.cart.id]),
+            data=json.dumps({'product': self.product.id, 'quantity': 20}),
+            content_type='application/json',
+            headers={'X-Requested-With': 'XMLHttpRequest'}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Недостаточно товара', response.json()['error'])
+
+
+class SalesListFilterTestCase(InventoryDataMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(category='Phone', warehouse='Alpha')
+        self.warehouses = [self.warehouse, Warehouse.objects.create(name='Beta', owner=self.user)]
+        self.black, self.red = self.create_products('Black', 'Red')
+        self.white, = self.create_products('White', warehouse=self.warehouses[1])
+        # Продажа с двумя подходящими позициями должна попасть в список один раз
+        self.first_sale = Sale.objects.create(owner=self.user)
+        SaleItem.objects.create(sale=self.first_sale, product=self.black, quantity=1, base_price_total=100, actual_price_total=100)
+        SaleItem.objects.create(sale=self.first_sale, product=self.white, quantity=2, base_price_total=200, actual_price_total=200)
+        self.second_sale = Sale.objects.create(owner=self.user)
+        SaleItem.objects.create(sale=self.second_sale, product=self.red, quantity=5, base_price_total=500, actual_price_total=450)
+        self.client.login(username='testuser', password='testpass')
+
+    def _sale_ids(self, **params):
+        response = self.client.get(reverse('sales_list'), params)
+        return [sale.id for sale in response.context['sales']]
+
+    def test_item_filters_return_each_sale_once(self):
+        self.assertEqual(self._sale_ids(product_name='phone'), [self.second_sale.id, self.first_sale.id])
+        self.assertEqual(self._sale_ids(warehouse='Beta'), [self.first_sale.id])
+        self.assertEqual(self._sale_ids(min_amount='400'), [self.second_sale.id])
+        self.assertEqual(self._sale_ids(max_quantity='3'), [self.first_sale.id])
+
+    def test_sorts_use_sale_columns(self):
+        self.first_sale.refresh_from_db()
+        self.assertEqual((self.first_sale.sort_product_name, self.first_sale.sort_warehouse_name), ('Phone - Black', 'Alpha'))
+        self.assertEqual(self._sale_ids(sort_by='-sort_product_name'), [self.second_sale.id, self.first_sale.id])
+        self.assertEqual(self._sale_ids(sort_by='sort_warehouse_name'), [self.second_sale.id, self.first_sale.id])
+        self.assertEqual(self._sale_ids(sort_by='total_quantity'), [self.first_sale.id, self.second_sale.id])
+
+
+class ListPaginationTestCase(InventoryDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.create_catalog(category='Phone', warehouse='Main')
+        product, = Product.objects.bulk_create([self.build_product('Phone', quantity=100)])
+        self.sales = []
+        for _ in range(25):
+            sale = Sale.objects.create(owner=self.user)
+            SaleItem.objects.create(sale=sale, product=product, quantity=1, base_price_total=100, actual_price_total=100)
+            SaleComment.objects.create(sale=sale, text='Комментарий')
+            self.sales.append(sale)
+        # Все продажи в одну секунду: порядок внутри одной даты задаёт id
+        Sale.objects.filter(owner=self.user).update(date=timezone.now())
+        self.client.login(username='testuser', password='testpass')
+
+    def test_cursor_walks_forward_and_back(self):
+        expected = [sale.id for sale in reversed(self.sales)]
+        seen = []
+        response = self.client.get(reverse('sales_list'))
+        pages = [response]
+        while True:
+            page = response.context['sales']
+            seen.extend(sale.id for sale in page)
+            if not page.has_next():
+                break
+            response = self.client.get(reverse('sales_list'), {'cursor': page.next_cursor})
+            pages.append(response)
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(pages), 3)
+
+        previous = pages[-1].context['sales'].previous_cursor
+        response = self.client.get(reverse('sales_list'), {'cursor': previous})
+        self.assertEqual([sale.id for sale in response.context['sales']], expected[10:20])
+        self.assertContains(response, 'Phone (1 шт.)')
+
+    def test_page_query_count_does_not_grow_with_rows(self):
+        with CaptureQueriesContext(connection) as first:
+            response = self.client.get(reverse('sales_list'))
+        next_cursor = response.context['sales'].next_cursor
+        with CaptureQueriesContext(connection) as second:
+            self.client.get(reverse('sales_list'), {'cursor': next_cursor})
+        self.assertEqual(len(first), len(second))
+        self.assertFalse(any('COUNT(' in query['sql'] and 'inventory_salecomment' not in query['sql'] for query in second))
+
+    def test_sorted_pages_cache_count(self):
+        self.client.get(reverse('sales_list'), {'sort_by': 'actual_total'})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('sales_list'), {'sort_by': 'actual_total', 'page': 2})
+        self.assertEqual(response.context['sales'].paginator.count, 25)
+        self.assertFalse(any(query['sql'].startswith('SELECT COUNT(') for query in queries))
+
+
+class SalePagesQueryCountTestCase(InventoryDataMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(category='Phone', warehouse='Main')
+        self.other = User.objects.create_user(username='otheruser', password='testpass')
+        self.products = Product.objects.bulk_create([
+            self.build_product(f'Phone {i:02d}', quantity=100, is_archived=(i == 0)) for i in range(30)
+        ])
+        self.sale = Sale.objects.create(owner=self.user)
+        SaleComment.objects.create(sale=self.sale, text='Комментарий')
+        self.client.login(username='testuser', password='testpass')
+
+    def _add_items(self, products):
+        for product in products:
+            SaleItem.objects.create(sale=self.sale, product=product, quantity=1, base_price_total=100, actual_price_total=100)
+
+    def _count(self, url_name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name, args=[self.sale.id]))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_detail_and_edit_do_not_grow_with_items(self):
+        self._add_items(self.products[1:2])
+        detail_one, edit_one = self._count('sale_detail'), self._count('sale_edit')
+        self._add_items(self.products[2:12])
+        self.assertEqual(self._count('sale_detail'), detail_one)
+        self.assertEqual(self._count('sale_edit'), edit_one)
+
+    def test_edit_page_does_not_render_catalog(self):
+        response = self.client.get(reverse('sale_edit', args=[self.sale.id]))
+        self.assertNotContains(response, 'Phone 29')
+        self.assertNotContains(response, '<select name="product"')
+
+    def test_edit_adds_item_by_product_id(self):
+        response = self.client.post(reverse('sale_edit', args=[self.sale.id]), {
+            'add_item': '', 'product': self.products[5].id, 'quantity': 2, 'actual_price': ''
+        })
+        self.assertRedirects(response, reverse('sale_edit', args=[self.sale.id]))
+        self.assertEqual(self.sale.items.get().product, self.products[5])
+        # Архивный товар выбрать нельзя
+        self.client.post(reverse('sale_edit', args=[self.sale.id]), {
+            'add_item': '', 'product': self.products[0].id, 'quantity': 1, 'actual_price': ''
+        })
+        self.assertEqual(self.sale.items.count(), 1)
+
+    def test_product_search(self):
+        response = self.client.get(reverse('product_search'), {'q': 'phone'})
+        results = response.json()['results']
+        self.assertEqual(len(results), 20)
+        self.assertEqual(results[0]['name'], 'Phone 01')
+        self.assertEqual(self.client.get(reverse('product_search'), {'q': ''}).json(), {'results': []})
+
+        self.client.login(username='otheruser', password='testpass')
+        self.assertEqual(self.client.get(reverse('product_search'), {'q': 'phone'}).json(), {'results': []})
+
+
+class ProductSearchTestCase(InventoryDataMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(category='Чехол', warehouse='Main')
+        self.colors = [Subcategory.objects.create(name=name, owner=self.user) for name in ('Синий', 'Телефон')]
+        self.client.login(username='testuser', password='testpass')
+
+    def _product(self, subcategory, category=None):
+        return Product.objects.create(
+            category=category or self.category, subcategory=subcategory, quantity=5,
+            selling_price=100, warehouse=self.warehouse, owner=self.user
+        )
+
+    def _names(self, query):
+        response = self.client.get(reverse('product_search'), {'q': query})
+        return [product['name'] for product in response.json()['results']]
+
+    def test_prefix_matches_first_and_case_is_folded(self):
+        case = self._product(self.colors[1])
+        phone = self._product(self.colors[0], Category.objects.create(name='Телефон', owner=self.user))
+        self.assertEqual(case.search_name, 'чехол - телефон')
+        self.assertEqual(self._names('ТЕЛ'), [phone.name, case.name])
+        self.assertEqual(self._names('  чехол   - тел '), [case.name])
+
+    def test_cart_page_uses_search_widget(self):
+        self._product(self.colors[0])
+        cart = Cart.objects.create(owner=self.user)
+        response = self.client.get(reverse('cart_add_item', args=[cart.id]))
+        self.assertContains(response, 'class="product-search position-relative"')
+        self.assertContains(response, 'js/product_search.js')
+        self.assertNotContains(response, '<option value="')
+
+    def test_invalid_form_does_not_show_other_owners_product(self):
+        own = self._product(self.colors[0])
+        other_user = User.objects.create_user(username='otheruser', password='testpass')
+        foreign = Product.objects.create(
+            category=Category.objects.create(name='Чужая модель', owner=other_user),
+            subcategory=Subcategory.objects.create(name='Чужой цвет', owner=other_user),
+            quantity=5, selling_price=100, owner=other_user,
+            warehouse=Warehouse.objects.create(name='Other', owner=other_user)
+        )
+        sale = Sale.objects.create(owner=self.user)
+        response = self.client.post(reverse('sale_edit', args=[sale.id]), {'add_item': '', 'product': foreign.id, 'quantity': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, foreign.name)
+
+        response = self.client.post(reverse('sale_edit', args=[sale.id]), {'add_item': '', 'product': own.id, 'quantity': ''})
+        self.assertContains(response, f'value="{own.name}"')
+
+
+class AdminChangelistQueryCountTestCase(InventoryDataMixin, TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='adminpass')
+        self.create_catalog(category='Phone', warehouse='Main')
+        self.created = 0
+        self.client.login(username='admin', password='adminpass')
+
+    def _add_rows(self, count):
+        for _ in range(count):
+            self.created += 1
+            product, = self.create_products(f'Color {self.created}')
+            sale = Sale.objects.create(owner=self.user)
+            SaleItem.objects.create(sale=sale, product=product, quantity=1, base_price_total=100, actual_price_total=100)
+            cart = Cart.objects.create(owner=self.user)
+            CartItem.objects.create(cart=cart, product=product, quantity=1, base_price_total=100, actual_price_total=100)
+            LogEntry.objects.create(user=self.user, action_type='ADD', message=f'Запись {self.created}')
+
+    def _count(self, url_name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists_do_not_grow_with_rows(self):
+        url_names = [
+            'admin:inventory_sale_changelist', 'admin:inventory_cart_changelist',
+            'admin:inventory_product_changelist', 'admin:inventory_saleitem_changelist',
+            'admin:inventory_cartitem_changelist', 'admin:inventory_logentry_changelist',
+        ]
+        self._add_rows(2)
+        counts = {url_name: self._count(url_name) for url_name in url_names}
+        self._add_rows(8)
+        self.assertEqual({url_name: self._count(url_name) for url_name in url_names}, counts)
+
+
+class LogSinkTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+
+    def _entry(self, number):
+        return LogEntry(user=self.user, action_type='ADD', message=f'Запись {number}')
+
+    def test_request_entries_are_written_in_one_insert(self):
+        token = logsink.start_request()
+        for number in range(3):
+            logsink.record(self._entry(number))
+        self.assertFalse(LogEntry.objects.exists())
+        with CaptureQueriesContext(connection) as queries:
+            logsink.finish_request(token)
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "inventory_logentry"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(LogEntry.objects.count(), 3)
+
+    def test_view_logs_are_flushed_before_response(self):
+        self.client.login(username='testuser', password='testpass')
+        self.client.post(reverse('cart_create'))
+        self.assertTrue(LogEntry.objects.filter(user=self.user, event='cart.created').exists())
+
+    @override_settings(INVENTORY_LOG_SINK={'MODE': 'sync'})
+    def test_sync_mode_writes_immediately(self):
+        token = logsink.start_request()
+        logsink.record(self._entry(1))
+        self.assertEqual(LogEntry.objects.count(), 1)
+        logsink.finish_request(token)
+        self.assertEqual(LogEntry.objects.count(), 1)
+
+    def test_queue_sink_spills_when_full_and_drains_on_close(self):
+        sink = logsink.QueueLogSink(queue_size=2, flush_interval=60, batch_size=10)
+        sink.submit([self._entry(number) for number in range(3)])
+        # Третья запись не поместилась в очередь и записана сразу
+        self.assertEqual(LogEntry.objects.count(), 1)
+        sink.close()
+        self.assertEqual(LogEntry.objects.count(), 3)
+
+    def test_deleted_user_does_not_lose_entry(self):
+        other = User.objects.create_user(username='gone', password='testpass')
+        entry = LogEntry(user=other, action_type='DELETE', message='Удалён')
+        other.delete()
+        logsink.write_entries([self._entry(1), entry])
+        self.assertEqual(LogEntry.objects.filter(user__isnull=True).count(), 1)
+        self.assertEqual(LogEntry.objects.count(), 2)
+
+    async def test_async_middleware_flushes_entries(self):
+        async def view(request):
+            await sync_to_async(logsink.record)(LogEntry(action_type='FAILED_LOGIN', message='Асинхронная запись'))
+            return HttpResponse()
+
+        await LogBufferMiddleware(view)(RequestFactory().get('/'))
+        self.assertTrue(await LogEntry.objects.filter(message='Асинхронная запись').aexists())
+
+
+class LogArchiveTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.archive_dir.cleanup)
+        now = timezone.now()
+        for days_ago in (400, 370, 369, 10):
+            entry = LogEntry.objects.create(user=self.user, action_type='SALE', message=f'Продажа {days_ago} дней назад')
+            LogEntry.objects.filter(id=entry.id).update(timestamp=now - timedelta(days=days_ago))
+
+    def test_archive_moves_old_entries_and_search_reads_them_back(self):
+        out = StringIO()
+        call_command('archive_logs', days=180, chunk_size=2, archive_dir=self.archive_dir.name, stdout=out)
+        self.assertIn('Перенесено записей: 3', out.getvalue())
+        self.assertEqual(list(LogEntry.objects.values_list('message', flat=True)), ['Продажа 10 дней назад'])
+        self.assertTrue(all(name.endswith('.ndjson.gz') for name in os.listdir(self.archive_dir.name)))
+
+        out = StringIO()
+        call_command('search_log_archive', archive_dir=self.archive_dir.name, contains='ПРОДАЖА 3', stdout=out)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([record['message'] for record in records], ['Продажа 370 дней назад', 'Продажа 369 дней назад'])
+        self.assertEqual(records[0]['username'], 'testuser')
+
+    def test_dry_run_keeps_entries(self):
+        out = StringIO()
+        call_command('archive_logs', days=180, dry_run=True, archive_dir=self.archive_dir.name, stdout=out)
+        self.assertIn('Будет перенесено записей: 3', out.getvalue())
+        self.assertEqual(LogEntry.objects.count(), 4)
+
+
+class LogTimelineTestCase(InventoryDataMixin, TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='adminpass')
+        self.user = self.create_owner()
+        same_time = timezone.now()
+        LogEntry.objects.bulk_create([
+            LogEntry(user=self.user if i % 2 else self.admin, action_type='ADD', message=f'Запись {i}')
+            for i in range(45)
+        ])
+        # Одинаковое время у всех записей: порядок на границах страниц держится на id
+        LogEntry.objects.update(timestamp=same_time)
+
+    def _walk(self, client):
+        messages_seen = []
+        cursor = None
+        while True:
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(reverse('user_logs'), {'cursor': cursor} if cursor else {})
+            self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+            page = response.context['logs']
+            messages_seen.extend(log.message for log in page)
+            if not page.has_next():
+                return messages_seen
+            cursor = page.next_cursor
+
+    def test_admin_timeline_walks_all_entries_newest_first(self):
+        self.client.login(username='admin', password='adminpass')
+        self.assertEqual(self._walk(self.client), [f'Запись {i}' for i in reversed(range(45))])
+
+    def test_user_timeline_uses_user_index(self):
+        self.client.login(username='testuser', password='testpass')
+        self.assertEqual(self._walk(self.client), [f'Запись {i}' for i in reversed(range(1, 45, 2))])
+        queryset = LogEntry.objects.filter(user=self.user).order_by('-timestamp', '-id')
+        self.assertIn('logentry_user_time_idx', queryset.explain())
+
+class StructuredLogTestCase(InventoryDataMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(category='Phone', warehouse='Main')
+        self.other = User.objects.create_user(username='otheruser', password='testpass')
+        self.product, = Product.objects.bulk_create([self.build_product('Phone X')])
+        self.client.login(username='testuser', password='testpass')
+
+    def test_entries_store_event_and_render_text(self):
+        self.client.post(reverse('cart_create'))
+        cart = Cart.objects.get(owner=self.user)
+        self.client.post(reverse('cart_add_item', args=[cart.id]), {'product': self.product.id, 'quantity': 2, 'actual_price': ''})
+
+        entry = LogEntry.objects.get(event='cart.item_added')
+        self.assertEqual((entry.object_type, entry.object_id, entry.related_product_id), ('cart', cart.id, self.product.id))
+        self.assertEqual(entry.params, {'product_name': 'Phone X', 'quantity': 2, 'number': cart.number, 'username': 'testuser'})
+        self.assertEqual(entry.message, '')
+        self.assertEqual(entry.text, f'Товар "Phone X" (кол-во: 2) добавлен в корзину №{cart.number} пользователем testuser')
+
+    def test_text_keeps_username_after_rename_and_delete(self):
+        self.client.post(reverse('cart_create'))
+        self.user.username = 'renamed'
+        self.user.save()
+        entry = LogEntry.objects.get(event='cart.created')
+        self.assertIn('пользователем testuser', entry.text)
+
+        self.user.delete()
+        entry.refresh_from_db()
+        self.assertIsNone(entry.user_id)
+        self.assertIn('пользователем testuser', entry.text)
+
+    def test_legacy_entries_keep_message(self):
+        entry = LogEntry.objects.create(user=self.user, action_type='ADD', message='Старая запись')
+        self.assertEqual(entry.text, 'Старая запись')
+
+    def test_product_history_includes_cart_lines(self):
+        self.client.post(reverse('cart_create'))
+        cart = Cart.objects.get(owner=self.user)
+        self.client.post(reverse('cart_add_item', args=[cart.id]), {'product': self.product.id, 'quantity': 1, 'actual_price': ''})
+        LogEntry.objects.create(user=self.user, action_type='UPDATE', event='product.updated', object_type='product', object_id=self.product.id, params={'name': 'Phone X'})
+
+        history = LogEntry.history('product', self.product.id)
+        self.assertEqual([entry.event for entry in history], ['product.updated', 'cart.item_added'])
+        self.assertIn('logentry_', history.explain())
+
+        response = self.client.get(reverse('object_history', args=['product', self.product.id]))
+        self.assertContains(response, f'добавлен в корзину №{cart.number}')
+        # Чужие записи об объекте обычному пользователю не видны
+        self.client.login(username='otheruser', password='testpass')
+        response = self.client.get(reverse('object_history', args=['product', self.product.id]))
+        self.assertEqual(list(response.context['logs']), [])
+        self.assertEqual(self.client.get(reverse('object_history', args=['unknown', 1])).status_code, 404)
+
+class MetricsTestCase(InventoryDataMixin, TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='adminpass')
+        self.create_catalog(category='Phone', warehouse='Main')
+        self.product, = Product.objects.bulk_create([self.build_product('Phone X')])
+        metrics.get_registry().reset()
+
+    def test_request_is_measured_and_reported_in_server_timing(self):
+        self.client.login(username='testuser', password='testpass')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('products'))
+        self.assertIn('desc="%d queries"' % len(queries), response['Server-Timing'])
+
+        data = metrics.get_registry().views['products']
+        self.assertEqual((data.count, data.queries), (1, len(queries)))
+        self.assertGreater(data.render_time, 0)
+        self.assertEqual(data.response_bytes, len(response.content))
+
+    def test_async_view_queries_are_counted(self):
+        self.client.login(username='testuser', password='testpass')
+        self.client.get(reverse('get_product_by_id'), {'product_id': self.product.id})
+        self.assertGreater(metrics.get_registry().views['get_product_by_id'].queries, 0)
+
+    def test_endpoint_is_admin_only(self):
+        self.client.login(username='testuser', password='testpass')
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 302)
+        self.client.login(username='admin', password='adminpass')
+        self.client.get(reverse('products'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertContains(response, 'inventory_request_duration_seconds_bucket{view="products",le="+Inf"} 1')
+        self.assertContains(response, 'inventory_db_queries_total{view="products"}')
+
+    def test_queries_outside_requests_are_not_counted(self):
+        token = metrics.start_request()
+        Product.objects.count()
+        stats = metrics.finish_request(token)
+        self.assertEqual(stats.queries, 1)
+        Product.objects.count()
+        self.assertIsNone(metrics.current_stats())
+
+@override_settings(INVENTORY_SLOW_QUERIES={'ENABLED': True, 'THRESHOLD_MS': 0, 'BUFFER_SIZE': 500, 'EXPLAIN': True})
+class SlowQueryLogTestCase(InventoryDataMixin, TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='adminpass')
+        self.user = self.create_owner()
+        slowqueries.get_log().clear()
+
+    def test_queries_are_recorded_with_view_and_plan(self):
+        self.client.login(username='testuser', password='testpass')
+        self.client.get(reverse('products'), {'q': 'secret-value'})
+        entries = slowqueries.get_log().snapshot()
+        product_queries = [entry for entry in entries if entry['view'] == 'products' and 'inventory_product' in entry['sql']]
+        self.assertTrue(product_queries)
+        self.assertTrue(all(entry['plan'] for entry in product_queries))
+        # Параметры запроса не сохраняются
+        self.assertFalse(any('secret-value' in entry['sql'] for entry in entries))
+
+    def test_full_scan_is_flagged(self):
+        self.assertTrue(slowqueries.is_full_scan(['SCAN inventory_product']))
+        self.assertFalse(slowqueries.is_full_scan(['SEARCH inventory_product USING INDEX product_owner_search_idx (owner_id=?)']))
+
+    def test_admin_panel_shows_and_clears_log(self):
+        self.client.login(username='admin', password='adminpass')
+        self.client.get(reverse('products'))
+        response = self.client.get(reverse('admin_panel'))
+        self.assertContains(response, 'Медленные запросы')
+        self.assertTrue(response.context['slow_queries'])
+        self.client.post(reverse('admin_panel'), {'clear_slow_queries': '1'})
+        # Очищается всё, что было до запроса на очистку
+        self.assertFalse(any(entry['view'] == 'products' for entry in slowqueries.get_log().snapshot()))
+
+    def test_disabled_by_default_outside_requests(self):
+        Product.objects.count()
+        self.assertEqual(slowqueries.get_log().snapshot(), [])
+
+class ProfilingTestCase(InventoryDataMixin, TestCase):
+    def setUp(self):
+        profiles_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(profiles_dir.cleanup)
+        self.profiles_dir = profiles_dir.name
+        self.settings_override = override_settings(INVENTORY_PROFILING={'DIR': self.profiles_dir, 'KEEP': 2})
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.admin = User.objects.create_superuser(username='admin', password='adminpass')
+        self.user = self.create_owner()
+
+    def test_superuser_request_is_profiled(self):
+        self.client.login(username='admin', password='adminpass')
+        response = self.client.get(reverse('products'), {'_profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        name = response['X-Profile-Id']
+        self.assertTrue(name.endswith('-products'))
+        download = self.client.get(response['X-Profile-Url'])
+        self.assertEqual(download['Content-Disposition'], f'attachment; filename="{name}.prof"')
+        self.assertContains(self.client.get(reverse('profile_summary', args=[name])), 'cumulative')
+        self.assertContains(self.client.get(reverse('admin_panel')), name)
+
+    def test_summary_mode_and_header(self):
+        self.client.login(username='admin', password='adminpass')
+        response = self.client.get(reverse('stats'), headers={'X-Profile': 'summary'})
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertContains(response, 'function calls')
+
+    def test_regular_users_and_requests_are_not_profiled(self):
+        self.client.login(username='testuser', password='testpass')
+        self.assertNotIn('X-Profile-Id', self.client.get(reverse('products'), {'_profile': '1'}))
+        self.assertEqual(self.client.get(reverse('profile_download', args=['x'])).status_code, 302)
+        self.client.login(username='admin', password='adminpass')
+        self.assertNotIn('X-Profile-Id', self.client.get(reverse('products')))
+        self.assertEqual(self.client.get(reverse('profile_download', args=['..'])).status_code, 404)
+
+    def test_old_profiles_are_pruned(self):
+        self.client.login(username='admin', password='adminpass')
+        for _ in range(3):
+            self.client.get(reverse('products'), {'_profile': '1'})
+        self.assertEqual(len(os.listdir(self.profiles_dir)), 4)
+
+@override_settings(INVENTORY_MEMORY_DIAGNOSTICS={'ENABLED': True, 'FRAMES': 1, 'SNAPSHOTS': True, 'TOP': 5})
+class MemoryDiagnosticsTestCase(TestCase):
+    def setUp(self):
+        if not tracemalloc.is_tracing():
+            self.addCleanup(tracemalloc.stop)
+        self.admin = User.objects.create_superuser(username='admin', password='adminpass')
+        memory.registry.reset()
+
+    def test_views_are_measured(self):
+        self.client.login(username='admin', password='adminpass')
+        self.client.get(reverse('products'))
+        data = dict(memory.registry.rows())['products']
+        self.assertEqual(data.count, 1)
+        self.assertGreater(data.peak_max, 0)
+        response = self.client.get(reverse('memory_diagnostics'))
+        self.assertContains(response, 'products')
+        self.client.post(reverse('memory_diagnostics'))
+        self.assertNotIn('products', dict(memory.registry.rows()))
+
+    def test_top_lines_point_to_retained_allocations(self):
+        memory.start_tracing(1)
+        before = memory.take_snapshot()
+        retained = [bytearray(1024) for _ in range(200)]
+        lines = memory.top_lines(before, memory.take_snapshot(), 3)
+        self.assertIn(f'{__file__}:', lines[0]['location'])
+        self.assertIn('bytearray(1024)', lines[0]['code'])
+        self.assertGreaterEqual(lines[0]['size_diff'], 200 * 1024)
+        del retained
+
+    def test_admin_only(self):
+        User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        self.assertEqual(self.client.get(reverse('memory_diagnostics')).status_code, 302)
+
+    def test_failing_request_is_measured(self):
+        def failing_view(request):
+            raise ValueError('view failed')
+
+        middleware = MemoryDiagnosticsMiddleware(failing_view)
+        with self.assertRaises(ValueError):
+            middleware(RequestFactory().get('/'))
+        self.assertEqual(dict(memory.registry.rows())['<unresolved>'].count, 1)
+
+class GenerateDatasetTestCase(TestCase):
+    options = dict(owners=2, warehouses=2, categories=4, colors=3, products=20, carts=5, sales=30, max_items=3,
+                   returns=0.5, comments=0.5, log_entries=50, end_date='2026-01-31', seed=7, batch_size=8, stdout=StringIO())
+
+    def _fingerprint(self):
+        return list(Sale.objects.order_by('owner__username', 'number').values_list(
+            'owner__username', 'number', 'date', 'actual_total', 'sort_product_name'
+        ))
+
+    def test_dataset_is_consistent(self):
+        call_command('generate_dataset', **self.options)
+        owner = User.objects.get(username='demo1')
+        self.assertTrue(owner.check_password('demo'))
+        self.assertEqual(Product.objects.filter(owner=owner).count(), 20)
+        self.assertEqual(Sale.objects.filter(owner=owner).count(), 30)
+        self.assertTrue(Return.objects.filter(owner=owner).exists())
+        self.assertEqual(LogEntry.objects.filter(user=owner).count(), 50)
+        self.assertFalse(Product.objects.exclude(qr_code='').exists())
+        self.assertFalse(Sale.objects.filter(date__gte=timezone.now() - timedelta(days=1)).exists())
+        # Итоги и ключи сортировки совпадают с пересчётом по позициям
+        for sale in Sale.objects.filter(owner=owner):
+            stored = [getattr(sale, field) for field in Sale.TOTAL_FIELDS]
+            sale.update_totals()
+            self.assertEqual(stored, [getattr(sale, field) for field in Sale.TOTAL_FIELDS])
+        # Счётчики номеров продолжают сгенерированные номера
+        self.assertEqual(Sale.objects.create(owner=owner).number, 31)
+
+    def test_same_seed_gives_same_data(self):
+        call_command('generate_dataset', **self.options)
+        first = self._fingerprint()
+        with self.assertRaises(CommandError):
+            call_command('generate_dataset', **self.options)
+        call_command('generate_dataset', clear=True, **self.options)
+        self.assertEqual(self._fingerprint(), first)
+
+class BenchmarkViewsTestCase(TestCase):
+    def setUp(self):
+        call_command('generate_dataset', owners=1, products=15, carts=3, sales=20, log_entries=20, categories=5, colors=3,
+                     seed=3, end_date='2026-01-31', stdout=StringIO())
+        output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(output_dir.cleanup)
+        self.output = os.path.join(output_dir.name, 'results.json')
+
+    def test_cases_run_and_do_not_change_data(self):
+        counts = Cart.objects.count(), Sale.objects.count(), LogEntry.objects.count()
+        call_command('benchmark_views', repeat=1, warmup=0, only=['product_list:q', 'stats', 'cart_confirm', 'cart_add_item_json'],
+                     output=self.output, stdout=StringIO())
+        with open(self.output, encoding='utf-8') as output:
+            results = json.load(output)['results']
+        self.assertEqual(set(results), {'product_list:q', 'stats', 'cart_confirm', 'cart_add_item_json'})
+        self.assertGreater(results['cart_confirm']['queries'], 0)
+        self.assertGreater(results['stats']['peak_kb'], 0)
+        self.assertEqual((Cart.objects.count(), Sale.objects.count(), LogEntry.objects.count()), counts)
+
+    def test_regressions_against_baseline(self):
+        baseline = {'sales_list': {'median_ms': 10.0, 'queries': 8, 'peak_kb': 400.0}}
+        same = {'sales_list': {'median_ms': 14.0, 'queries': 8, 'peak_kb': 410.0}}
+        self.assertEqual(benchmarks.compare(same, baseline), [])
+        slower = {'sales_list': {'median_ms': 30.0, 'queries': 9, 'peak_kb': 900.0}}
+        self.assertEqual(len(benchmarks.compare(slower, baseline)), 3)
+        self.assertEqual(benchmarks.compare(slower, baseline, tolerance=3, query_tolerance=1, memory_tolerance=2), [])
+
+
+class LoadTestCheckoutTestCase(LiveServerTestCase):
+    def setUp(self):
+        call_command('generate_dataset', owners=1, products=15, carts=0, sales=5, log_entries=0, categories=5, colors=3,
+                     seed=5, end_date='2026-01-31', stdout=StringIO())
+        self.user = User.objects.get(username='demo1')
+
+    def test_till_completes_checkouts_and_stock_matches(self):
+        # Одна касса: тестовый сервер делит одно соединение с SQLite в памяти между потоками
+        report = loadtest.run_load_test(self.user, self.live_server_url,
+                                        {'tills': 1, 'iterations': 5, 'duration': 60, 'password': 'demo'})
+        self.assertNotIn('login_errors', report)
+        self.assertEqual(sum(report['outcomes'].values()), 5)
+        self.assertGreater(report['outcomes'].get('completed', 0), 0)
+        self.assertEqual(report['steps']['cart_create']['count'], 5)
+        self.assertTrue(report['stock']['consistent'])
+        self.assertEqual(report['stock']['new_sales'], report['outcomes']['completed'])
+        self.assertFalse(Cart.objects.filter(owner=self.user, items__isnull=True).exists())
+
+    def test_wrong_password_is_reported(self):
+        report = loadtest.run_load_test(self.user, self.live_server_url,
+                                        {'tills': 1, 'iterations': 1, 'duration': 10, 'password': 'wrong'})
+        self.assertIn('login_errors', report)
+        self.assertEqual(report['outcomes'], {})
+
+
+class LoadTestClockTestCase(SimpleTestCase):
+    def test_till_crashing_on_login_does_not_block_others(self):
+        def crash(username, password):
+            raise RuntimeError('unexpected')
+
+        # Исключение упавшей кассы ожидаемо, его трассировка в выводе тестов не нужна
+        crashed = []
+        original_hook = threading.excepthook
+        threading.excepthook = lambda args: crashed.append(args.exc_type)
+        self.addCleanup(setattr, threading, 'excepthook', original_hook)
+
+        options = {**loadtest.DEFAULTS, 'iterations': 1, 'timeout': 1, 'username': 'demo', 'password': 'demo'}
+        clock = loadtest.RunClock(2, 5, options['timeout'])
+        stats = loadtest.LoadStats()
+        tills = [loadtest.Till(number, urlsplit('http://127.0.0.1:9'), options, ['id'], stats, clock) for number in range(2)]
+        tills[0].client.login = crash
+        tills[1].client.login = lambda username, password: None
+        for till in tills:
+            till.start()
+        for till in tills:
+            till.join(10)
+
+        self.assertFalse(any(till.is_alive() for till in tills))
+        self.assertEqual(crashed, [RuntimeError])
+        self.assertIsNotNone(clock.started)
+        self.assertEqual(stats.outcomes['failed'], 1)
+
+    def test_wait_gives_up_when_a_till_never_arrives(self):
+        clock = loadtest.RunClock(2, 5, 0.05)
+        self.assertFalse(clock.wait())
+        self.assertIsNone(clock.started)
+
+
+class SqliteProfileTestCase(TestCase):
+    def test_pragmas_are_applied_to_connections(self):
+        with connection.cursor() as cursor:
+            self.assertEqual(cursor.execute('PRAGMA synchronous').fetchone()[0], 1)
+            self.assertEqual(cursor.execute('PRAGMA busy_timeout').fetchone()[0], 5000)
+            self.assertEqual(cursor.execute('PRAGMA cache_size').fetchone()[0], -64 * 1024)
+
+    def test_no_retry_inside_outer_transaction(self):
+        calls = []
+
+        @sqlite.retry_on_lock
+        def view(request):
+            calls.append(request)
+            raise OperationalError('database is locked')
+
+        with self.assertRaises(OperationalError):
+            view(RequestFactory().post('/'))
+        self.assertEqual(len(calls), 1)
+
+
+@override_settings(INVENTORY_SQLITE={'RETRY_ATTEMPTS': 3, 'RETRY_BASE_DELAY': 0})
+class SqliteRetryTestCase(SimpleTestCase):
+    def _view(self, errors):
+        calls = []
+
+        @sqlite.retry_on_lock
+        def view(request):
+            calls.append(request)
+            if len(calls) <= len(errors):
+                raise errors[len(calls) - 1]
+            return HttpResponse('ok')
+
+        return view, calls
+
+    def test_lock_errors_are_retried(self):
+        view, calls = self._view([OperationalError('database is locked')] * 2)
+        self.assertEqual(view(RequestFactory().post('/')).content, b'ok')
+        self.assertEqual(len(calls), 3)
+
+    def test_retries_are_bounded(self):
+        view, calls = self._view([OperationalError('database is locked')] * 5)
+        with self.assertRaises(OperationalError):
+            view(RequestFactory().post('/'))
+        self.assertEqual(len(calls), 3)
+
+    def test_other_errors_are_not_retried(self):
+        view, calls = self._view([OperationalError('no such table: inventory_cart')])
+        with self.assertRaises(OperationalError):
+            view(RequestFactory().post('/'))
+        self.assertEqual(len(calls), 1)
+
+    def test_lock_errors_are_recognized_by_sqlite_error_code(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        name = os.path.join(directory.name, 'locked.sqlite3')
+        holder = sqlite3.connect(name, isolation_level=None)
+        self.addCleanup(holder.close)
+        holder.execute('BEGIN EXCLUSIVE')
+        waiter = sqlite3.connect(name, timeout=0)
+        self.addCleanup(waiter.close)
+        with self.assertRaises(sqlite3.OperationalError) as locked:
+            waiter.execute('SELECT 1 FROM sqlite_master')
+        self.assertEqual(locked.exception.sqlite_errorname, 'SQLITE_BUSY')
+        self.assertTrue(sqlite.is_lock_error(locked.exception))
+
+        self.assertFalse(sqlite.is_lock_error(OperationalError('device or resource busy')))
+
+
+@override_settings(INVENTORY_REPLICA={'ENABLED': True, 'ALIAS': 'replica', 'STICKY_SECONDS': 30})
+class ReplicaRoutingTestCase(InventoryDataMixin, TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.create_catalog(category='Phone', warehouse='Main')
+        self.product, = Product.objects.bulk_create([self.build_product('Phone')])
+        self.client.force_login(self.user)
+
+    def _queries(self, method, url_name, *args):
+        with CaptureQueriesContext(connection) as primary, CaptureQueriesContext(connections['replica']) as replica:
+            response = getattr(self.client, method)(reverse(url_name, args=args))
+        self.assertLess(response.status_code, 400)
+        return len(primary), len(replica)
+
+    def test_reporting_views_read_from_replica(self):
+        for url_name in ('stats', 'user_logs', 'sales_list'):
+            _, replica = self._queries('get', url_name)
+            self.assertGreater(replica, 0, url_name)
+        # Остальные страницы и всё до представления (сессия, пользователь) — из default
+        self.assertEqual(self._queries('get', 'products')[1], 0)
+
+    def test_user_reads_primary_after_own_write(self):
+        cart = Cart.objects.create(owner=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1, base_price_total=100, actual_price_total=100)
+        self.assertEqual(self._queries('post', 'cart_confirm', cart.id)[1], 0)
+        primary, replica = self._queries('get', 'sales_list')
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+
+        session = self.client.session
+        session[replicas.SESSION_KEY] = 0
+        session.save()
+        self.assertGreater(self._queries('get', 'sales_list')[1], 0)
+
+    def test_outside_requests_router_does_not_choose(self):
+        router = replicas.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Sale))
+        self.assertEqual(router.db_for_write(Sale), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'inventory'))
+        self.assertTrue(router.allow_migrate('default', 'inventory'))
+
+
+class ReplicaSyncTestCase(SimpleTestCase):
+    def test_backup_copies_database_file(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        source, target = os.path.join(directory.name, 'main.sqlite3'), os.path.join(directory.name, 'replica.sqlite3')
+        with sqlite3.connect(source) as db:
+            db.execute('CREATE TABLE sale (id INTEGER PRIMARY KEY, total INTEGER)')
+            db.executemany('INSERT INTO sale (total) VALUES (?)', [(100,), (250,)])
+        db.close()
+        replicas.backup(source, target)
+        copy = sqlite3.connect(target)
+        self.addCleanup(copy.close)
+        self.assertEqual(copy.execute('SELECT SUM(total) FROM sale').fetchone()[0], 350)
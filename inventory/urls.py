@@ -21,6 +21,7 @@ urlpatterns = [
     path('get-product-price/', views.get_product_price, name='get_product_price'),
     path('get-product-by-uuid/', views.get_product_by_uuid, name='get_product_by_uuid'),
     path('get-product-by-id/', views.get_product_by_id, name='get_product_by_id'),
+    path('products/search/', views.product_search, name='product_search'),
 
     # Archive
     path('products/<int:product_id>/archive/', views.product_archive, name='product_archive'),
@@ -55,6 +56,8 @@ urlpatterns = [
     path('carts/', views.cart_list, name='cart_list'),
     path('cart/create/', views.cart_create, name='cart_create'),
     path('cart/<int:cart_id>/add_item/', views.cart_add_item, name='cart_add_item'),
+    path('cart/<int:cart_id>/add_item/json/', views.cart_add_item_json, name='cart_add_item_json'),
+    path('cart/<int:cart_id>/add_items/', views.cart_add_items, name='cart_add_items'),
     path('cart/<int:cart_id>/remove_item/<int:item_id>/', views.cart_remove_item, name='cart_remove_item'),
     path('cart/<int:cart_id>/confirm/', views.cart_confirm, name='cart_confirm'),
     path('cart/<int:cart_id>/cancel/', views.cart_cancel, name='cart_cancel'),
@@ -73,7 +76,12 @@ urlpatterns = [
 
     # Logs
     path('logs/', views.logs, name='user_logs'),
+    path('logs/<str:object_type>/<int:object_id>/', views.object_history, name='object_history'),
 
     # Admin panel
     path('admin-panel/', views.admin_panel, name='admin_panel'),
+    path('metrics/', views.prometheus_metrics, name='metrics'),
+    path('admin-panel/memory/', views.memory_diagnostics, name='memory_diagnostics'),
+    path('admin-panel/profiles/<str:name>/', views.profile_download, name='profile_download'),
+    path('admin-panel/profiles/<str:name>/summary/', views.profile_summary, name='profile_summary'),
 ]
\ No newline at end of file
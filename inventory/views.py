@@ -1,24 +1,114 @@
 # inventory/views.py
 import uuid
 import json
+from decimal import Decimal, InvalidOperation
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
-from django.db.models import Sum, Q, F, Value, FloatField
+from django.db import transaction
+from django.db.models import Sum, Q, F, Value, Case, When, Exists, OuterRef, Prefetch, Subquery, Count
 from django.db.models.functions import Coalesce
 from django.utils import timezone
 from datetime import timedelta
 from .forms import RegisterForm, ProductForm, WarehouseForm, UserChangeForm, UserSettingsForm, CategoryForm, \
     SubcategoryForm, CartItemForm, ReturnForm, SaleItemForm, LoginForm
 from .models import Product, Warehouse, Sale, SaleItem, Cart, CartItem, Category, Subcategory, UserSettings, User, \
-    Return, LogEntry, CartComment, SaleComment
-from django.http import JsonResponse
+    Return, LogEntry, CartComment, SaleComment, search_key
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from .pagination import CachedCountPaginator, count_cache_key, cursor_paginate
+from . import logsink, memory, metrics, profiling, slowqueries
+from .replicas import use_replica
+from .sqlite import retry_on_lock
+from asgiref.sync import async_to_sync, sync_to_async
+
+# Максимум товаров в ответе поиска для выпадающих подсказок
+PRODUCT_SEARCH_LIMIT = 20
 
 # Helper function to log actions
-def create_log_entry(user, action_type, message):
-    LogEntry.objects.create(user=user, action_type=action_type, message=message)
+def create_log_entry(user, action_type, event, obj=None, object_id=None, product=None, **params):
+    """Запись в журнал: событие из LOG_MESSAGES с параметрами, объект истории и товар позиции.
+
+    object_id передаётся явно для уже удалённого obj. Имя пользователя сохраняется в параметрах:
+    журнал показывает его таким, каким оно было в момент действия. Запись сохраняется пачкой
+    в конце запроса или фоновым потоком — см. inventory.logsink.
+    """
+    if user is not None:
+        params.setdefault('username', user.username)
+    logsink.record(LogEntry(
+        user=user,
+        action_type=action_type,
+        event=event,
+        params=params,
+        object_type=obj._meta.model_name if obj is not None else '',
+        object_id=object_id if object_id is not None else getattr(obj, 'pk', None),
+        related_product_id=product.pk if product is not None else None,
+    ))
+
+# Helper functions to change stock atomically
+def take_stock(product_id, quantity):
+    """Списывает товар одним условным UPDATE. Возвращает False, если товара недостаточно."""
+    return Product.objects.filter(id=product_id, quantity__gte=quantity).update(quantity=F('quantity') - quantity) > 0
+
+def take_stock_bulk(quantities):
+    """Списывает несколько товаров одним UPDATE по словарю {product_id: количество}.
+
+    Возвращает False, если хотя бы одного товара не хватило; в этом случае
+    вызывающий код обязан откатить транзакцию.
+    """
+    condition = Q()
+    for product_id, quantity in quantities.items():
+        condition |= Q(id=product_id, quantity__gte=quantity)
+    decrement = Case(*[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()])
+    return Product.objects.filter(condition).update(quantity=F('quantity') - decrement) == len(quantities)
+
+def product_json(product):
+    """Данные товара для JSON-ответов сканера и ручного поиска."""
+    return {
+        'id': product.id,
+        'name': product.name,
+        'category': product.category.name if product.category else '',
+        'subcategory': product.subcategory.name if product.subcategory else '',
+        'warehouse': product.warehouse.name if product.warehouse else '',
+        'quantity': product.quantity,
+        'selling_price': float(product.selling_price),
+        'photo': product.photo.url if product.photo else '',
+    }
+
+# Цены позиций в моделях — DecimalField(max_digits=10, decimal_places=2)
+PRICE_LIMIT = Decimal(10) ** 8
+
+def parse_price(value):
+    """Цена из JSON-запроса. ValueError, если это не конечное число, которое помещается в поле цены."""
+    price = Decimal(str(value or 0))
+    if not price.is_finite() or abs(price) >= PRICE_LIMIT or price != price.quantize(Decimal('0.01')):
+        raise ValueError(f'Неверная цена: {value}')
+    return price
+
+def return_stock(product_id, quantity):
+    """Возвращает товар на склад без чтения текущего остатка."""
+    Product.objects.filter(id=product_id).update(quantity=F('quantity') + quantity)
+
+def list_items_queryset(model, parent_field):
+    """Позиции для списков продаж и корзин: только поля, которые выводит шаблон."""
+    return model.objects.select_related('product').only(
+        'id', parent_field, 'quantity', 'product__id', 'product__name'
+    ).order_by('id')
+
+def comments_count_subquery(model, parent_field):
+    """Количество комментариев одним подзапросом вместо загрузки их текста."""
+    counts = model.objects.filter(**{parent_field: OuterRef('pk')}).order_by().values(parent_field).annotate(
+        count=Count('id')
+    ).values('count')
+    return Coalesce(Subquery(counts), Value(0))
+
+def navigation_query_string(request):
+    """Текущие параметры фильтров без параметров навигации — для ссылок пагинации."""
+    params = request.GET.copy()
+    params.pop('page', None)
+    params.pop('cursor', None)
+    return params.urlencode()
 
 ######################
 ### LOGIN / LOGOUT ###
@@ -33,10 +123,10 @@ def login_view(request):
             user = authenticate(request, username=username, password=password)
             if user is not None:
                 login(request, user)
-                create_log_entry(user, 'LOGIN', f'Пользователь {user.username} вошёл в систему')
+                create_log_entry(user, 'LOGIN', 'user.login', user)
                 return redirect('products')
             else:
-                create_log_entry(None, 'FAILED_LOGIN', f'Неудачная попытка входа для пользователя {username}')
+                create_log_entry(None, 'FAILED_LOGIN', 'user.login_failed', username=username)
                 messages.error(request, 'Неверный логин или пароль.')
         else:
             messages.error(request, 'Пожалуйста, исправьте ошибки в форме.')
@@ -47,7 +137,7 @@ def login_view(request):
 def logout_view(request):
     user = request.user
     if user.is_authenticated:
-        create_log_entry(user, 'LOGOUT', f'Пользователь {user.username} вышел из системы')
+        create_log_entry(user, 'LOGOUT', 'user.logout', user)
     logout(request)
     messages.success(request, 'Вы вышли из системы.')
     return redirect('login')
@@ -69,7 +159,7 @@ def register(request):
             user.set_password(form.cleaned_data['password'])
             user.save()
             UserSettings.objects.create(user=user, is_pending=True)
-            create_log_entry(user, 'REGISTER', f'Новый пользователь {user.username} зарегистрирован и ожидает подтверждения')
+            create_log_entry(user, 'REGISTER', 'user.registered', user)
             messages.success(request, 'Регистрация успешна! Ожидайте подтверждения администратором.')
             return redirect('login')
         else:
@@ -91,7 +181,7 @@ def profile(request):
         if user_form.is_valid() and settings_form.is_valid():
             user_form.save()
             settings_form.save()
-            create_log_entry(request.user, 'UPDATE', f'Пользователь {request.user.username} обновил свой профиль')
+            create_log_entry(request.user, 'UPDATE', 'user.profile_updated', request.user)
             messages.success(request, 'Профиль обновлен.')
             return redirect('profile')
     else:
@@ -112,7 +202,8 @@ def product_list(request):
     min_quantity = request.GET.get('min_quantity', '')
     sort_by = request.GET.get('sort_by', '')
 
-    products = Product.objects.filter(owner=request.user, is_archived=False)
+    # Модель, цвет и склад выводятся в каждой карточке — одним JOIN, а не запросом на карточку
+    products = Product.objects.filter(owner=request.user, is_archived=False).select_related('category', 'subcategory', 'warehouse')
 
     if query:
         try:
@@ -187,7 +278,7 @@ def product_add(request):
             product = form.save(commit=False)
             product.owner = request.user
             product.save()
-            create_log_entry(request.user, 'ADD', f'Товар "{product.name}" добавлен пользователем {request.user.username}')
+            create_log_entry(request.user, 'ADD', 'product.added', product, name=product.name)
             if product.quantity < 5:
                 messages.warning(request, f"Товар {product.name} заканчивается (осталось {product.quantity})")
             return redirect('products')
@@ -207,7 +298,7 @@ def product_edit(request, product_id):
         form = ProductForm(request.POST, request.FILES, instance=product, user=request.user)
         if form.is_valid():
             product = form.save()
-            create_log_entry(request.user, 'UPDATE', f'Товар "{product.name}" обновлён пользователем {request.user.username}')
+            create_log_entry(request.user, 'UPDATE', 'product.updated', product, name=product.name)
             if product.quantity < 5:
                 messages.warning(request, f"Товар {product.name} заканчивается (осталось {product.quantity})")
             return redirect('products')
@@ -220,30 +311,24 @@ def product_edit(request, product_id):
 def product_delete(request, product_id):
     product = get_object_or_404(Product, id=product_id, owner=request.user)
     if request.method == 'POST':
-        product_name = product.name
+        product_name, deleted_id = product.name, product.id
         product.delete()
-        create_log_entry(request.user, 'DELETE', f'Товар "{product_name}" удалён пользователем {request.user.username}')
+        create_log_entry(request.user, 'DELETE', 'product.deleted', product, object_id=deleted_id, name=product_name)
         messages.success(request, f'Товар "{product_name}" удален.')
     return redirect('products')
 
 @login_required
-def get_product_price(request):
+async def get_product_price(request):
     if request.method == 'GET':
         product_id = request.GET.get('product_id')
+        user = await request.auser()
         try:
-            product = Product.objects.get(id=product_id, owner=request.user)
-            return JsonResponse({
-                'id': product.id,
-                'name': product.name,
-                'category': product.category.name if product.category else '',
-                'subcategory': product.subcategory.name if product.subcategory else '',
-                'warehouse': product.warehouse.name if product.warehouse else '',
-                'quantity': product.quantity,
-                'selling_price': float(product.selling_price),
-                'photo': product.photo.url if product.photo else '',
-            })
+            product = await Product.objects.select_related('category', 'subcategory', 'warehouse').aget(id=product_id, owner=user)
+            return JsonResponse(product_json(product))
         except Product.DoesNotExist:
             return JsonResponse({'error': 'Товар не найден'}, status=404)
+        except ValueError:
+            return JsonResponse({'error': 'Неверный ID товара'}, status=400)
     return JsonResponse({'error': 'Неверный метод запроса'}, status=400)
 
 ###############
@@ -253,7 +338,9 @@ def get_product_price(request):
 @login_required
 def archived_products(request):
     # Ensure consistent ordering
-    products = Product.objects.filter(owner=request.user, is_archived=True).order_by('name')
+    products = Product.objects.filter(owner=request.user, is_archived=True).select_related(
+        'category', 'subcategory', 'warehouse'
+    ).order_by('name')
 
     # Пагинация
     paginator = Paginator(products, 10)  # 10 товаров на страницу
@@ -275,7 +362,7 @@ def product_archive(request, product_id):
     if request.method == 'POST':
         product.is_archived = True
         product.save()
-        create_log_entry(request.user, 'UPDATE', f'Товар "{product.name}" архивирован пользователем {request.user.username}')
+        create_log_entry(request.user, 'UPDATE', 'product.archived', product, name=product.name)
         messages.success(request, f'Товар "{product.name}" архивирован.')
     return redirect('products')
 
@@ -285,7 +372,7 @@ def product_unarchive(request, product_id):
     if request.method == 'POST':
         product.is_archived = False
         product.save()
-        create_log_entry(request.user, 'UPDATE', f'Товар "{product.name}" разархивирован пользователем {request.user.username}')
+        create_log_entry(request.user, 'UPDATE', 'product.unarchived', product, name=product.name)
         messages.success(request, f'Товар "{product.name}" разархивирован.')
     return redirect('archived_products')
 
@@ -302,17 +389,20 @@ def warehouse_list(request):
                 warehouse = form.save(commit=False)
                 warehouse.owner = request.user
                 warehouse.save()
-                create_log_entry(request.user, 'ADD', f'Склад "{warehouse.name}" добавлен пользователем {request.user.username}')
+                create_log_entry(request.user, 'ADD', 'warehouse.added', warehouse, name=warehouse.name)
                 messages.success(request, 'Склад добавлен.')
                 return redirect('warehouses')
         elif 'warehouse_id' in request.POST and request.POST.get('action') == 'delete':
             warehouse = get_object_or_404(Warehouse, id=request.POST['warehouse_id'], owner=request.user)
-            warehouse_name = warehouse.name
+            warehouse_name, deleted_id = warehouse.name, warehouse.id
             warehouse.delete()
-            create_log_entry(request.user, 'DELETE', f'Склад "{warehouse_name}" удалён пользователем {request.user.username}')
+            create_log_entry(request.user, 'DELETE', 'warehouse.deleted', warehouse, object_id=deleted_id, name=warehouse_name)
             messages.success(request, 'Склад удален.')
             return redirect('warehouses')
-    warehouses = Warehouse.objects.filter(owner=request.user).order_by('name')  # Ensure ordering
+    # Товары всех складов — одним запросом на страницу, а не по запросу на склад и на строку таблицы
+    warehouses = Warehouse.objects.filter(owner=request.user).order_by('name').prefetch_related(
+        Prefetch('product_set', queryset=Product.objects.select_related('category', 'subcategory'))
+    )
     form = WarehouseForm()
     return render(request, 'warehouses.html', {'warehouses': warehouses, 'form': form})
 
@@ -324,7 +414,7 @@ def warehouse_add(request):
             warehouse = form.save(commit=False)
             warehouse.owner = request.user
             warehouse.save()
-            create_log_entry(request.user, 'ADD', f'Склад "{warehouse.name}" добавлен пользователем {request.user.username}')
+            create_log_entry(request.user, 'ADD', 'warehouse.added', warehouse, name=warehouse.name)
             return redirect('warehouses')
     else:
         form = WarehouseForm()
@@ -337,7 +427,7 @@ def warehouse_edit(request, warehouse_id):
         form = WarehouseForm(request.POST, instance=warehouse)
         if form.is_valid():
             form.save()
-            create_log_entry(request.user, 'UPDATE', f'Склад "{warehouse.name}" обновлён пользователем {request.user.username}')
+            create_log_entry(request.user, 'UPDATE', 'warehouse.updated', warehouse, name=warehouse.name)
             messages.success(request, 'Название склада обновлено.')
             return redirect('warehouses')
     else:
@@ -348,9 +438,9 @@ def warehouse_edit(request, warehouse_id):
 def warehouse_delete(request, warehouse_id):
     warehouse = get_object_or_404(Warehouse, id=warehouse_id, owner=request.user)
     if request.method == 'POST':
-        warehouse_name = warehouse.name
+        warehouse_name, deleted_id = warehouse.name, warehouse.id
         warehouse.delete()
-        create_log_entry(request.user, 'DELETE', f'Склад "{warehouse_name}" удалён пользователем {request.user.username}')
+        create_log_entry(request.user, 'DELETE', 'warehouse.deleted', warehouse, object_id=deleted_id, name=warehouse_name)
         messages.success(request, f'Склад "{warehouse_name}" удален.')
         return redirect('warehouses')
     return redirect('warehouses')
@@ -360,8 +450,9 @@ def warehouse_delete(request, warehouse_id):
 ############
 
 @login_required
+@use_replica
 def sales_list(request):
-    sales = Sale.objects.filter(owner=request.user).prefetch_related('items__product', 'comments')
+    sales = Sale.objects.filter(owner=request.user)
 
     product_name = request.GET.get('product_name', '')
     warehouse = request.GET.get('warehouse', '')
@@ -373,10 +464,11 @@ def sales_list(request):
     max_quantity = request.GET.get('max_quantity', '')
     sort_by = request.GET.get('sort_by', '')
 
+    # Фильтры по позициям через EXISTS: без JOIN в основном запросе и без дублей продаж
     if product_name:
-        sales = sales.filter(items__product__name__icontains=product_name)
+        sales = sales.filter(Exists(SaleItem.objects.filter(sale=OuterRef('pk'), product__name__icontains=product_name)))
     if warehouse:
-        sales = sales.filter(items__product__warehouse__name=warehouse)
+        sales = sales.filter(Exists(SaleItem.objects.filter(sale=OuterRef('pk'), product__warehouse__name=warehouse)))
     if date_from:
         try:
             date_from = timezone.datetime.strptime(date_from, '%Y-%m-%d')
@@ -391,21 +483,19 @@ def sales_list(request):
         except ValueError:
             messages.error(request, 'Неверный формат даты "по". Используйте YYYY-MM-DD.')
     if min_amount or max_amount:
-        sales = sales.annotate(total_amount=Sum('items__actual_price_total'))
         if min_amount:
             try:
                 min_amount = float(min_amount)
-                sales = sales.filter(total_amount__gte=min_amount)
+                sales = sales.filter(actual_total__gte=min_amount)
             except ValueError:
                 messages.error(request, 'Минимальная сумма должна быть числом.')
         if max_amount:
             try:
                 max_amount = float(max_amount)
-                sales = sales.filter(total_amount__lte=max_amount)
+                sales = sales.filter(actual_total__lte=max_amount)
             except ValueError:
                 messages.error(request, 'Максимальная сумма должна быть числом.')
     if min_quantity or max_quantity:
-        sales = sales.annotate(total_quantity=Sum('items__quantity'))
         if min_quantity:
             try:
                 min_quantity = int(min_quantity)
@@ -422,25 +512,28 @@ def sales_list(request):
     # Ensure consistent ordering
     allowed_sort_fields = [
         'date', '-date',
-        'items__product__name', '-items__product__name',
-        'items__quantity', '-items__quantity',
-        'items__product__warehouse__name', '-items__product__warehouse__name',
-        'items__actual_price_total', '-items__actual_price_total'
+        'sort_product_name', '-sort_product_name',
+        'total_quantity', '-total_quantity',
+        'sort_warehouse_name', '-sort_warehouse_name',
+        'actual_total', '-actual_total'
     ]
-    if sort_by in allowed_sort_fields:
-        sales = sales.order_by(sort_by)
-    else:
-        sales = sales.order_by('-date')  # Default ordering
+    ordering = (sort_by, '-id') if sort_by in allowed_sort_fields else ('-date', '-id')  # Default ordering
+    sales = sales.annotate(comments_count=comments_count_subquery(SaleComment, 'sale')).prefetch_related(
+        Prefetch('items', queryset=list_items_queryset(SaleItem, 'sale'))
+    )
 
-    # Пагинация
-    paginator = Paginator(sales, 10)  # 10 продаж на страницу
-    page_number = request.GET.get('page', 1)
-    try:
-        sales_paginated = paginator.page(page_number)
-    except PageNotAnInteger:
-        sales_paginated = paginator.page(1)
-    except EmptyPage:
-        sales_paginated = paginator.page(paginator.num_pages)
+    # Пагинация: по дате — курсором, по остальным полям — страницами с кэшированным количеством
+    if ordering[0].lstrip('-') == 'date':
+        sales_paginated = cursor_paginate(sales, ordering, request.GET.get('cursor'), 10)  # 10 продаж на страницу
+    else:
+        paginator = CachedCountPaginator(sales.order_by(*ordering), 10, count_cache_key('sales', request))
+        page_number = request.GET.get('page', 1)
+        try:
+            sales_paginated = paginator.page(page_number)
+        except PageNotAnInteger:
+            sales_paginated = paginator.page(1)
+        except EmptyPage:
+            sales_paginated = paginator.page(paginator.num_pages)
 
     warehouses = Warehouse.objects.filter(owner=request.user).order_by('name')
 
@@ -456,13 +549,14 @@ def sales_list(request):
         'min_quantity': min_quantity,
         'max_quantity': max_quantity,
         'sort_by': sort_by,
+        'query_string': navigation_query_string(request),
     })
 
 @login_required
 def sale_detail(request, sale_id):
-    sale = get_object_or_404(Sale, id=sale_id, owner=request.user)
-    items = sale.items.all()
-    comments = sale.comments.all()
+    sale = get_object_or_404(Sale.objects.select_related('owner'), id=sale_id, owner=request.user)
+    items = list(sale.items.select_related('product').order_by('id'))
+    comments = list(sale.comments.all())
     base_total, actual_total = sale.calculate_totals()
     return render(request, 'sale_detail.html', {
         'sale': sale,
@@ -475,7 +569,8 @@ def sale_detail(request, sale_id):
 @login_required
 def sale_edit(request, sale_id):
     sale = get_object_or_404(Sale, id=sale_id, owner=request.user)
-    products = Product.objects.filter(owner=request.user).order_by('name')
+    # Товар выбирается через поиск (product_search), список всех товаров на страницу не выводится
+    products = Product.objects.filter(owner=request.user, is_archived=False)
 
     form = SaleItemForm()
     form.fields['product'].queryset = products
@@ -483,6 +578,7 @@ def sale_edit(request, sale_id):
     if request.method == 'POST':
         if 'add_item' in request.POST:
             form = SaleItemForm(request.POST)
+            form.fields['product'].queryset = products
             if form.is_valid():
                 sale_item = form.save(commit=False)
                 product = sale_item.product
@@ -491,11 +587,13 @@ def sale_edit(request, sale_id):
                 actual_price = form.cleaned_data['actual_price'] or product.selling_price
                 sale_item.actual_price_total = sale_item.quantity * actual_price
 
-                if sale_item.quantity <= product.quantity:
-                    product.quantity -= sale_item.quantity
-                    product.save()
-                    sale_item.save()
-                    create_log_entry(request.user, 'UPDATE', f'Товар "{product.name}" (кол-во: {sale_item.quantity}) добавлен в продажу №{sale.number} пользователем {request.user.username}')
+                with transaction.atomic():
+                    if take_stock(product.id, sale_item.quantity):
+                        sale_item.save()
+                    else:
+                        sale_item = None
+                if sale_item:
+                    create_log_entry(request.user, 'UPDATE', 'sale.item_added', sale, product=product, product_name=product.name, quantity=sale_item.quantity, number=sale.number)
                     messages.success(request, f'Товар "{product.name}" добавлен в продажу.')
                     return redirect('sale_edit', sale_id=sale.id)
                 else:
@@ -504,20 +602,25 @@ def sale_edit(request, sale_id):
             item_id = request.POST.get('item_id')
             sale_item = get_object_or_404(SaleItem, id=item_id, sale=sale)
             product = sale_item.product
-            product.quantity += sale_item.quantity
-            product.save()
-            sale_item.delete()
-            create_log_entry(request.user, 'UPDATE', f'Товар "{product.name}" (кол-во: {sale_item.quantity}) удалён из продажи №{sale.number} пользователем {request.user.username}')
-            messages.success(request, f'Товар "{product.name}" удалён из продажи.')
+            with transaction.atomic():
+                # Удаляем по id: если параллельный запрос уже удалил позицию, товар не вернётся дважды
+                deleted, _ = SaleItem.objects.filter(id=sale_item.id).delete()
+                if deleted:
+                    return_stock(product.id, sale_item.quantity)
+                    sale.update_totals()
+            if deleted:
+                create_log_entry(request.user, 'UPDATE', 'sale.item_removed', sale, product=product, product_name=product.name, quantity=sale_item.quantity, number=sale.number)
+                messages.success(request, f'Товар "{product.name}" удалён из продажи.')
             return redirect('sale_edit', sale_id=sale.id)
 
     return render(request, 'sale_edit.html', {
         'sale': sale,
         'form': form,
-        'products': products
+        'items': list(sale.items.select_related('product').order_by('id')),
     })
 
 @login_required
+@retry_on_lock
 def return_item(request, sale_id, item_id):
     sale = get_object_or_404(Sale, id=sale_id, owner=request.user)
     sale_item = get_object_or_404(SaleItem, id=item_id, sale=sale)
@@ -530,26 +633,33 @@ def return_item(request, sale_id, item_id):
                 messages.error(request, 'Нельзя вернуть больше, чем было продано.')
                 return redirect('sale_detail', sale_id=sale.id)
 
-            return_record = Return.objects.create(
-                sale=sale,
-                sale_item=sale_item,
-                quantity=return_quantity,
-                owner=request.user
-            )
-
-            sale_item.quantity -= return_quantity
-            if sale_item.quantity == 0:
-                sale_item.delete()
-            else:
-                sale_item.base_price_total = sale_item.quantity * sale_item.product.selling_price
-                sale_item.actual_price_total = sale_item.quantity * (sale_item.actual_price_total / (sale_item.quantity + return_quantity))
-                sale_item.save()
-
             product = sale_item.product
-            product.quantity += return_quantity
-            product.save()
+            old_quantity = sale_item.quantity
+            new_quantity = old_quantity - return_quantity
+            with transaction.atomic():
+                # Обновляем позицию только если её количество не изменилось с момента чтения
+                changed = SaleItem.objects.filter(id=sale_item.id, quantity=old_quantity).update(
+                    quantity=new_quantity,
+                    base_price_total=new_quantity * product.selling_price,
+                    actual_price_total=new_quantity * (sale_item.actual_price_total / old_quantity)
+                )
+                if changed:
+                    Return.objects.create(
+                        sale=sale,
+                        sale_item=sale_item,
+                        quantity=return_quantity,
+                        owner=request.user
+                    )
+                    if new_quantity == 0:
+                        SaleItem.objects.filter(id=sale_item.id).delete()
+                    return_stock(product.id, return_quantity)
+                    sale.update_totals()
 
-            create_log_entry(request.user, 'RETURN', f'Возврат {return_quantity} x "{product.name}" из продажи №{sale.number} пользователем {request.user.username}')
+            if not changed:
+                messages.error(request, 'Позиция продажи была изменена другим запросом. Попробуйте ещё раз.')
+                return redirect('sale_detail', sale_id=sale.id)
+
+            create_log_entry(request.user, 'RETURN', 'sale.item_returned', sale, product=product, product_name=product.name, quantity=return_quantity, number=sale.number)
             messages.success(request, f'Возвращено {return_quantity} шт. товара "{product.name}".')
             return redirect('sale_detail', sale_id=sale.id)
     else:
@@ -568,7 +678,7 @@ def sale_comment_add(request, sale_id):
         comment_text = request.POST.get('comment_text', '').strip()
         if comment_text:
             comment = SaleComment.objects.create(sale=sale, text=comment_text)
-            create_log_entry(request.user, 'ADD', f'Комментарий к продаже №{sale.number} добавлен пользователем {request.user.username}')
+            create_log_entry(request.user, 'ADD', 'sale.comment_added', sale, number=sale.number)
             messages.success(request, 'Комментарий добавлен.')
         else:
             messages.error(request, 'Комментарий не может быть пустым.')
@@ -583,7 +693,7 @@ def sale_comment_edit(request, sale_id, comment_id):
         if comment_text:
             comment.text = comment_text
             comment.save()
-            create_log_entry(request.user, 'UPDATE', f'Комментарий к продаже №{sale.number} обновлён пользователем {request.user.username}')
+            create_log_entry(request.user, 'UPDATE', 'sale.comment_updated', sale, number=sale.number)
             messages.success(request, 'Комментарий обновлён.')
         else:
             messages.error(request, 'Комментарий не может быть пустым.')
@@ -595,7 +705,7 @@ def sale_comment_delete(request, sale_id, comment_id):
     comment = get_object_or_404(SaleComment, id=comment_id, sale=sale)
     if request.method == 'POST':
         comment.delete()
-        create_log_entry(request.user, 'DELETE', f'Комментарий к продаже №{sale.number} удалён пользователем {request.user.username}')
+        create_log_entry(request.user, 'DELETE', 'sale.comment_deleted', sale, number=sale.number)
         messages.success(request, 'Комментарий удалён.')
     return redirect('sale_detail', sale_id=sale.id)
 
@@ -605,47 +715,42 @@ def sale_comment_delete(request, sale_id, comment_id):
 
 @login_required
 def cart_list(request):
-    carts = Cart.objects.filter(owner=request.user).prefetch_related('items__product', 'comments')
+    carts = Cart.objects.filter(owner=request.user).annotate(
+        comments_count=comments_count_subquery(CartComment, 'cart')
+    ).prefetch_related(Prefetch('items', queryset=list_items_queryset(CartItem, 'cart')))
 
     hide_empty = request.GET.get('hide_empty', 'off') == 'on'
     sort_by = request.GET.get('sort_by', '')
 
     if hide_empty:
-        carts = carts.filter(items__isnull=False).distinct()
-
-    carts = carts.annotate(
-        total_cost=Coalesce(
-            Sum('items__actual_price_total'),
-            Value(0.0),
-            output_field=FloatField()
-        )
-    )
+        carts = carts.filter(items_count__gt=0)
 
     # Ensure consistent ordering
     allowed_sort_fields = [
         'number', '-number',
         'created_at', '-created_at',
-        'total_cost', '-total_cost'
+        'actual_total', '-actual_total'
     ]
-    if sort_by in allowed_sort_fields:
-        carts = carts.order_by(sort_by)
-    else:
-        carts = carts.order_by('-created_at')  # Default ordering
+    ordering = (sort_by, '-id') if sort_by in allowed_sort_fields else ('-created_at', '-id')  # Default ordering
 
-    # Пагинация
-    paginator = Paginator(carts, 10)  # 10 корзин на страницу
-    page_number = request.GET.get('page', 1)
-    try:
-        carts_paginated = paginator.page(page_number)
-    except PageNotAnInteger:
-        carts_paginated = paginator.page(1)
-    except EmptyPage:
-        carts_paginated = paginator.page(paginator.num_pages)
+    # Пагинация: по дате — курсором, по остальным полям — страницами с кэшированным количеством
+    if ordering[0].lstrip('-') == 'created_at':
+        carts_paginated = cursor_paginate(carts, ordering, request.GET.get('cursor'), 10)  # 10 корзин на страницу
+    else:
+        paginator = CachedCountPaginator(carts.order_by(*ordering), 10, count_cache_key('carts', request))
+        page_number = request.GET.get('page', 1)
+        try:
+            carts_paginated = paginator.page(page_number)
+        except PageNotAnInteger:
+            carts_paginated = paginator.page(1)
+        except EmptyPage:
+            carts_paginated = paginator.page(paginator.num_pages)
 
     return render(request, 'cart_list.html', {
         'carts': carts_paginated,
         'hide_empty': hide_empty,
         'sort_by': sort_by,
+        'query_string': navigation_query_string(request),
     })
 
 @login_required
@@ -653,7 +758,7 @@ def cart_create(request):
     if request.method == 'POST':
         try:
             cart = Cart.objects.create(owner=request.user)
-            create_log_entry(request.user, 'ADD', f'Новая корзина №{cart.number} создана пользователем {request.user.username}')
+            create_log_entry(request.user, 'ADD', 'cart.created', cart, number=cart.number)
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({'cart_id': cart.id}, status=200)
             else:
@@ -674,59 +779,19 @@ def cart_create(request):
 @login_required
 def cart_add_item(request, cart_id):
     cart = get_object_or_404(Cart, id=cart_id, owner=request.user)
-    products = Product.objects.filter(owner=request.user, is_archived=False).order_by('name')
+    # Товар выбирается через поиск (product_search), список всех товаров на страницу не выводится
+    products = Product.objects.filter(owner=request.user, is_archived=False)
 
     form = CartItemForm()
     form.fields['product'].queryset = products
 
     if request.method == 'POST':
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            try:
-                data = json.loads(request.body)
-                product_id = data.get('product')
-                quantity = int(data.get('quantity', 1))
-                actual_price = float(data.get('actual_price', 0))
-
-                try:
-                    product = Product.objects.get(id=product_id, owner=request.user, is_archived=False)
-                except Product.DoesNotExist:
-                    return JsonResponse({'error': 'Товар не найден.'}, status=404)
-
-                if quantity <= 0:
-                    return JsonResponse({'error': 'Количество должно быть больше 0.'}, status=400)
-
-                if quantity > product.quantity:
-                    return JsonResponse({'error': f'Недостаточно товара на складе. В наличии: {product.quantity} шт.'}, status=400)
-
-                if actual_price < 0:
-                    return JsonResponse({'error': 'Фактическая цена не может быть отрицательной.'}, status=400)
-
-                cart_item = CartItem.objects.filter(cart=cart, product=product).first()
-                if cart_item:
-                    cart_item.quantity += quantity
-                    cart_item.base_price_total = cart_item.quantity * product.selling_price
-                    cart_item.actual_price_total = cart_item.quantity * (actual_price or product.selling_price)
-                    cart_item.save()
-                    action_message = f'Количество товара "{product.name}" в корзине №{cart.number} увеличено на {quantity} (итого: {cart_item.quantity}) пользователем {request.user.username} через сканирование UUID'
-                else:
-                    cart_item = CartItem(
-                        cart=cart,
-                        product=product,
-                        quantity=quantity,
-                        base_price_total=quantity * product.selling_price,
-                        actual_price_total=quantity * (actual_price or product.selling_price)
-                    )
-                    cart_item.save()
-                    action_message = f'Товар "{product.name}" (кол-во: {quantity}) добавлен в корзину №{cart.number} пользователем {request.user.username} через сканирование UUID'
-
-                create_log_entry(request.user, 'ADD', action_message)
-                return JsonResponse({'success': True, 'cart_id': cart.id})
-            except json.JSONDecodeError:
-                return JsonResponse({'error': 'Неверный формат данных.'}, status=400)
-            except Exception as e:
-                return JsonResponse({'error': str(e)}, status=500)
+            # JSON-запросы старых клиентов обслуживает асинхронная версия
+            return async_to_sync(cart_add_item_json)(request, cart_id)
 
         form = CartItemForm(request.POST)
+        form.fields['product'].queryset = products
         if form.is_valid():
             cart_item = form.save(commit=False)
             product = cart_item.product
@@ -738,39 +803,175 @@ def cart_add_item(request, cart_id):
                 existing_item.base_price_total = existing_item.quantity * product.selling_price
                 existing_item.actual_price_total = existing_item.quantity * actual_price
                 existing_item.save()
-                action_message = f'Количество товара "{product.name}" в корзине №{cart.number} увеличено на {cart_item.quantity} (итого: {existing_item.quantity}) пользователем {request.user.username}'
+                log_event = 'cart.item_increased'
+                log_params = {'quantity': cart_item.quantity, 'total': existing_item.quantity}
             else:
                 cart_item.cart = cart
                 cart_item.base_price_total = cart_item.quantity * product.selling_price
                 cart_item.actual_price_total = cart_item.quantity * actual_price
                 if cart_item.quantity <= product.quantity:
                     cart_item.save()
-                    action_message = f'Товар "{product.name}" (кол-во: {cart_item.quantity}) добавлен в корзину №{cart.number} пользователем {request.user.username}'
+                    log_event = 'cart.item_added'
+                    log_params = {'quantity': cart_item.quantity}
                 else:
                     messages.error(request, 'Недостаточно товара на складе.')
                     return redirect('cart_add_item', cart_id=cart.id)
 
-            create_log_entry(request.user, 'ADD', action_message)
+            create_log_entry(request.user, 'ADD', log_event, cart, product=product, product_name=product.name, number=cart.number, **log_params)
             messages.success(request, f'Товар "{product.name}" добавлен в корзину.')
             return redirect('cart_add_item', cart_id=cart.id)
         else:
             messages.error(request, 'Ошибка при добавлении товара. Проверьте данные.')
             return redirect('cart_add_item', cart_id=cart.id)
 
-    total_quantity = sum(item.quantity for item in cart.items.all())
+    total_quantity = cart.total_quantity
     base_total, actual_total = cart.calculate_totals()
     product_totals = cart.items.values('product__name').annotate(total_quantity=Sum('quantity')).order_by('product__name')
 
     return render(request, 'cart_form.html', {
         'form': form,
         'cart': cart,
-        'products': products,
+        'items': list(cart.items.select_related('product').order_by('id')),
+        'comments': list(cart.comments.all()),
         'total_quantity': total_quantity,
         'base_total': base_total,
         'actual_total': actual_total,
         'product_totals': product_totals,
     })
 
+@login_required
+async def cart_add_item_json(request, cart_id):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Неверный метод запроса'}, status=400)
+
+    user = await request.auser()
+    try:
+        cart = await Cart.objects.aget(id=cart_id, owner=user)
+    except Cart.DoesNotExist:
+        return JsonResponse({'error': 'Корзина не найдена.'}, status=404)
+
+    try:
+        data = json.loads(request.body)
+        product_id = data.get('product')
+        quantity = int(data.get('quantity', 1))
+        actual_price = float(data.get('actual_price', 0))
+
+        try:
+            product = await Product.objects.aget(id=product_id, owner=user, is_archived=False)
+        except Product.DoesNotExist:
+            return JsonResponse({'error': 'Товар не найден.'}, status=404)
+
+        if quantity <= 0:
+            return JsonResponse({'error': 'Количество должно быть больше 0.'}, status=400)
+
+        if actual_price < 0:
+            return JsonResponse({'error': 'Фактическая цена не может быть отрицательной.'}, status=400)
+
+        cart_item = await CartItem.objects.filter(cart=cart, product=product).afirst()
+        # Как в cart_add_items: на складе должно хватать всей позиции корзины, а не только этого скана
+        if (cart_item.quantity if cart_item else 0) + quantity > product.quantity:
+            return JsonResponse({'error': f'Недостаточно товара на складе. В наличии: {product.quantity} шт.'}, status=400)
+
+        if cart_item:
+            cart_item.cart = cart
+            cart_item.quantity += quantity
+            cart_item.base_price_total = cart_item.quantity * product.selling_price
+            cart_item.actual_price_total = cart_item.quantity * (actual_price or product.selling_price)
+            await cart_item.asave()
+            log_event = 'cart.item_increased_by_scan'
+            log_params = {'quantity': quantity, 'total': cart_item.quantity}
+        else:
+            cart_item = CartItem(
+                cart=cart,
+                product=product,
+                quantity=quantity,
+                base_price_total=quantity * product.selling_price,
+                actual_price_total=quantity * (actual_price or product.selling_price)
+            )
+            await cart_item.asave()
+            log_event = 'cart.item_scanned'
+            log_params = {'quantity': quantity}
+
+        await sync_to_async(create_log_entry)(
+            user, 'ADD', log_event, cart, product=product, product_name=product.name, number=cart.number, **log_params
+        )
+        return JsonResponse({'success': True, 'cart_id': cart.id})
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Неверный формат данных.'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@login_required
+@retry_on_lock
+def cart_add_items(request, cart_id):
+    """Пакетное добавление товаров в корзину: {"items": [{"product": id, "quantity": n, "actual_price": p}, ...]}."""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Неверный метод запроса'}, status=400)
+
+    cart = get_object_or_404(Cart, id=cart_id, owner=request.user)
+    try:
+        lines = json.loads(request.body).get('items')
+        if not isinstance(lines, list) or not lines:
+            return JsonResponse({'error': 'Список товаров пуст.'}, status=400)
+        # Объединяем строки по товару: количество суммируется, действует последняя указанная цена
+        merged = {}
+        for line in lines:
+            product_id = int(line['product'])
+            quantity = int(line.get('quantity', 1))
+            actual_price = parse_price(line.get('actual_price'))
+            if quantity <= 0:
+                return JsonResponse({'error': 'Количество должно быть больше 0.'}, status=400)
+            if actual_price < 0:
+                return JsonResponse({'error': 'Фактическая цена не может быть отрицательной.'}, status=400)
+            entry = merged.setdefault(product_id, {'quantity': 0, 'actual_price': Decimal(0)})
+            entry['quantity'] += quantity
+            if actual_price:
+                entry['actual_price'] = actual_price
+    except (json.JSONDecodeError, AttributeError, KeyError, TypeError, ValueError, InvalidOperation):
+        return JsonResponse({'error': 'Неверный формат данных.'}, status=400)
+
+    with transaction.atomic():
+        # Товары и уже лежащие в корзине позиции - по одному запросу на всю пачку
+        products = Product.objects.filter(owner=request.user, is_archived=False).in_bulk(merged.keys())
+        if len(products) != len(merged):
+            return JsonResponse({'error': 'Товар не найден.'}, status=404)
+        existing_items = {item.product_id: item for item in CartItem.objects.filter(cart=cart, product_id__in=merged.keys())}
+
+        new_items = []
+        updated_items = []
+        for product_id, entry in merged.items():
+            product = products[product_id]
+            cart_item = existing_items.get(product_id)
+            quantity = entry['quantity'] + (cart_item.quantity if cart_item else 0)
+            if quantity > product.quantity:
+                return JsonResponse({'error': f'Недостаточно товара "{product.name}" на складе. В наличии: {product.quantity} шт.'}, status=400)
+
+            if cart_item is None:
+                cart_item = CartItem(cart=cart, product=product)
+                new_items.append(cart_item)
+            else:
+                updated_items.append(cart_item)
+            cart_item.quantity = quantity
+            cart_item.base_price_total = quantity * product.selling_price
+            cart_item.actual_price_total = quantity * (entry['actual_price'] or product.selling_price)
+            if max(cart_item.base_price_total, cart_item.actual_price_total) >= PRICE_LIMIT:
+                return JsonResponse({'error': f'Сумма позиции "{product.name}" слишком велика.'}, status=400)
+
+        CartItem.objects.bulk_create(new_items)
+        CartItem.objects.bulk_update(updated_items, ['quantity', 'base_price_total', 'actual_price_total'])
+        cart.update_totals()
+
+    added_quantity = sum(entry['quantity'] for entry in merged.values())
+    create_log_entry(request.user, 'ADD', 'cart.items_scanned', cart, number=cart.number, lines=len(merged), quantity=added_quantity)
+    return JsonResponse({
+        'success': True,
+        'cart_id': cart.id,
+        'items_count': cart.items_count,
+        'total_quantity': cart.total_quantity,
+        'base_total': float(cart.base_total),
+        'actual_total': float(cart.actual_total),
+    })
+
 @login_required
 def cart_remove_item(request, cart_id, item_id):
     cart = get_object_or_404(Cart, id=cart_id, owner=request.user)
@@ -781,9 +982,10 @@ def cart_remove_item(request, cart_id, item_id):
     return redirect('cart_add_item', cart_id=cart.id)
 
 @login_required
+@retry_on_lock
 def cart_confirm(request, cart_id):
     cart = get_object_or_404(Cart, id=cart_id, owner=request.user)
-    cart_items = cart.items.all()
+    cart_items = list(cart.items.all())
 
     if not cart_items:
         messages.error(request, 'Корзина пуста. Добавьте товары перед подтверждением.')
@@ -791,50 +993,58 @@ def cart_confirm(request, cart_id):
 
     product_quantities = {}
     for item in cart_items:
-        product = item.product
-        if product.id not in product_quantities:
-            product_quantities[product.id] = {'quantity': 0, 'items': []}
-        product_quantities[product.id]['quantity'] += item.quantity
-        product_quantities[product.id]['items'].append(item)
-
-    for product_id, data in product_quantities.items():
-        product = Product.objects.get(id=product_id)
-        total_quantity = data['quantity']
-        if total_quantity > product.quantity:
-            messages.error(request,
-                           f'Недостаточно товара "{product.name}" на складе. В корзине: {total_quantity} шт., на складе: {product.quantity} шт.')
+        product_quantities[item.product_id] = product_quantities.get(item.product_id, 0) + item.quantity
+
+    with transaction.atomic():
+        # Удаляем корзину в начале транзакции: повторное подтверждение той же корзины не спишет товар дважды
+        comments = list(cart.comments.all())
+        if not Cart.objects.filter(id=cart.id).delete()[0]:
+            messages.error(request, 'Корзина уже оформлена.')
+            return redirect('sales_list')
+
+        # Все товары корзины одним запросом
+        products = Product.objects.select_for_update().in_bulk(product_quantities.keys())
+        for product_id, total_quantity in product_quantities.items():
+            product = products.get(product_id)
+            if product is None:
+                # Товар удалили, пока корзина ждала оформления
+                transaction.set_rollback(True)
+                messages.error(request, 'Товар из корзины был удалён. Проверьте корзину.')
+                return redirect('cart_add_item', cart_id=cart.id)
+            if total_quantity > product.quantity:
+                transaction.set_rollback(True)
+                messages.error(request,
+                               f'Недостаточно товара "{product.name}" на складе. В корзине: {total_quantity} шт., на складе: {product.quantity} шт.')
+                return redirect('cart_add_item', cart_id=cart.id)
+
+        # Списываем товар условным UPDATE: параллельная продажа не может увести остаток в минус
+        if not take_stock_bulk(product_quantities):
+            transaction.set_rollback(True)
+            messages.error(request, 'Остатки на складе изменились во время оформления. Попробуйте ещё раз.')
             return redirect('cart_add_item', cart_id=cart.id)
 
-    # Создаём продажу
-    sale = Sale.objects.create(owner=request.user)
+        # Создаём продажу
+        sale = Sale.objects.create(owner=request.user)
 
-    # Переносим товары из корзины в продажу
-    for product_id, data in product_quantities.items():
-        product = Product.objects.get(id=product_id)
-        total_quantity = data['quantity']
-        product.quantity -= total_quantity
-        product.save()
-        for item in data['items']:
-            SaleItem.objects.create(
+        # Переносим товары и комментарии из корзины в продажу
+        SaleItem.objects.bulk_create([
+            SaleItem(
                 sale=sale,
-                product=item.product,
+                product_id=item.product_id,
                 quantity=item.quantity,
                 base_price_total=item.base_price_total,
                 actual_price_total=item.actual_price_total
             )
-
-    # Переносим комментарии из корзины в продажу
-    comments = cart.comments.all()
-    for comment in comments:
-        SaleComment.objects.create(
-            sale=sale,
-            text=comment.text,
-            created_at=comment.created_at,
-            updated_at=comment.updated_at
-        )
-
-    create_log_entry(request.user, 'SALE', f'Продажа №{sale.number} на основе корзины №{cart.number} завершена пользователем {request.user.username}')
-    cart.delete()
+            for item in cart_items
+        ])
+        if comments:
+            SaleComment.objects.bulk_create([
+                SaleComment(sale=sale, text=comment.text, created_at=comment.created_at, updated_at=comment.updated_at)
+                for comment in comments
+            ])
+        sale.update_totals()
+
+    create_log_entry(request.user, 'SALE', 'sale.completed', sale, number=sale.number, cart_number=cart.number)
     messages.success(request, 'Продажа успешно завершена!')
     return redirect('sales_list')
 
@@ -849,8 +1059,9 @@ def cart_cancel(request, cart_id):
 def cart_delete(request, cart_id):
     cart = get_object_or_404(Cart, id=cart_id, owner=request.user)
     if request.method == 'POST':
+        deleted_id = cart.id
         cart.delete()
-        create_log_entry(request.user, 'DELETE', f'Корзина №{cart.number} удалена пользователем {request.user.username}')
+        create_log_entry(request.user, 'DELETE', 'cart.deleted', cart, object_id=deleted_id, number=cart.number)
         messages.success(request, 'Корзина удалена.')
         return redirect('cart_list')
     return redirect('cart_list')
@@ -862,7 +1073,7 @@ def cart_comment_add(request, cart_id):
         comment_text = request.POST.get('comment_text', '').strip()
         if comment_text:
             comment = CartComment.objects.create(cart=cart, text=comment_text)
-            create_log_entry(request.user, 'ADD', f'Комментарий к корзине №{cart.number} добавлен пользователем {request.user.username}')
+            create_log_entry(request.user, 'ADD', 'cart.comment_added', cart, number=cart.number)
             messages.success(request, 'Комментарий добавлен.')
         else:
             messages.error(request, 'Комментарий не может быть пустым.')
@@ -877,7 +1088,7 @@ def cart_comment_edit(request, cart_id, comment_id):
         if comment_text:
             comment.text = comment_text
             comment.save()
-            create_log_entry(request.user, 'UPDATE', f'Комментарий к корзине №{cart.number} обновлён пользователем {request.user.username}')
+            create_log_entry(request.user, 'UPDATE', 'cart.comment_updated', cart, number=cart.number)
             messages.success(request, 'Комментарий обновлён.')
         else:
             messages.error(request, 'Комментарий не может быть пустым.')
@@ -889,52 +1100,61 @@ def cart_comment_delete(request, cart_id, comment_id):
     comment = get_object_or_404(CartComment, id=comment_id, cart=cart)
     if request.method == 'POST':
         comment.delete()
-        create_log_entry(request.user, 'DELETE', f'Комментарий к корзине №{cart.number} удалён пользователем {request.user.username}')
+        create_log_entry(request.user, 'DELETE', 'cart.comment_deleted', cart, number=cart.number)
         messages.success(request, 'Комментарий удалён.')
     return redirect('cart_add_item', cart_id=cart.id)
 
 @login_required
-def get_product_by_uuid(request):
+async def get_product_by_uuid(request):
     if request.method == 'GET':
         unique_id = request.GET.get('unique_id')
+        user = await request.auser()
         try:
-            product = Product.objects.get(unique_id=unique_id, owner=request.user, is_archived=False)
-            return JsonResponse({
-                'id': product.id,
-                'name': product.name,
-                'category': product.category.name if product.category else '',
-                'subcategory': product.subcategory.name if product.subcategory else '',
-                'warehouse': product.warehouse.name if product.warehouse else '',
-                'quantity': product.quantity,
-                'selling_price': float(product.selling_price),
-                'photo': product.photo.url if product.photo else '',
-            })
+            product = await Product.objects.select_related('category', 'subcategory', 'warehouse').aget(unique_id=unique_id, owner=user, is_archived=False)
+            return JsonResponse(product_json(product))
         except Product.DoesNotExist:
             return JsonResponse({'error': 'Товар не найден'}, status=404)
     return JsonResponse({'error': 'Неверный метод запроса'}, status=400)
 
 @login_required
-def get_product_by_id(request):
+async def get_product_by_id(request):
     if request.method == 'GET':
         product_id = request.GET.get('product_id')
+        user = await request.auser()
         try:
-            product = Product.objects.get(id=product_id, owner=request.user, is_archived=False)
-            return JsonResponse({
-                'id': product.id,
-                'name': product.name,
-                'category': product.category.name if product.category else '',
-                'subcategory': product.subcategory.name if product.subcategory else '',
-                'warehouse': product.warehouse.name if product.warehouse else '',
-                'quantity': product.quantity,
-                'selling_price': float(product.selling_price),
-                'photo': product.photo.url if product.photo else '',
-            })
+            product = await Product.objects.select_related('category', 'subcategory', 'warehouse').aget(id=product_id, owner=user, is_archived=False)
+            return JsonResponse(product_json(product))
         except Product.DoesNotExist:
             return JsonResponse({'error': 'Товар не найден'}, status=404)
         except ValueError:
             return JsonResponse({'error': 'Неверный ID товара'}, status=400)
     return JsonResponse({'error': 'Неверный метод запроса'}, status=400)
 
+@login_required
+def product_search(request):
+    """Подсказки для выбора товара: сначала совпадения по началу названия, затем по подстроке."""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Неверный метод запроса'}, status=400)
+    query = search_key(request.GET.get('q', ''))
+    try:
+        limit = min(int(request.GET.get('limit', PRODUCT_SEARCH_LIMIT)), PRODUCT_SEARCH_LIMIT)
+    except ValueError:
+        limit = PRODUCT_SEARCH_LIMIT
+    if not query or limit <= 0:
+        return JsonResponse({'results': []})
+
+    products = Product.objects.filter(owner=request.user, is_archived=False).values('id', 'name', 'selling_price', 'quantity')
+    # Начало названия — диапазон по индексу (owner, search_name), без сканирования каталога
+    results = list(products.filter(
+        search_name__gte=query, search_name__lt=query + '\U0010ffff'
+    ).order_by('search_name')[:limit])
+    if len(results) < limit:
+        found_ids = [product['id'] for product in results]
+        results += products.filter(search_name__contains=query).exclude(id__in=found_ids).order_by('search_name')[:limit - len(results)]
+    return JsonResponse({'results': [
+        {**product, 'selling_price': str(product['selling_price'])} for product in results
+    ]})
+
 
 ############
 ### SCAN ###
@@ -975,7 +1195,7 @@ def scan_product_confirm(request):
             return redirect('products')
 
         cart = Cart.objects.create(owner=request.user)
-        create_log_entry(request.user, 'ADD', f'Новая корзина №{cart.number} создана пользователем {request.user.username} через сканирование')
+        create_log_entry(request.user, 'ADD', 'cart.created_by_scan', cart, number=cart.number)
 
         cart_item = CartItem(
             cart=cart,
@@ -986,7 +1206,7 @@ def scan_product_confirm(request):
         )
         cart_item.save()
 
-        create_log_entry(request.user, 'ADD', f'Товар "{product.name}" (кол-во: {quantity}) добавлен в корзину №{cart.number} пользователем {request.user.username} через сканирование UUID')
+        create_log_entry(request.user, 'ADD', 'cart.item_scanned', cart, product=product, product_name=product.name, quantity=quantity, number=cart.number)
         messages.success(request, f'Товар "{product.name}" добавлен в корзину №{cart.number}.')
         return redirect('cart_add_item', cart_id=cart.id)
 
@@ -997,6 +1217,7 @@ def scan_product_confirm(request):
 ##################
 
 @login_required
+@use_replica
 def stats(request):
     sales = Sale.objects.filter(owner=request.user).prefetch_related('items__product').order_by('-date')
     today = timezone.now()
@@ -1116,7 +1337,7 @@ def category_manage(request):
                 category = category_form.save(commit=False)
                 category.owner = request.user
                 category.save()
-                create_log_entry(request.user, 'ADD', f'Модель "{category.name}" добавлена пользователем {request.user.username}')
+                create_log_entry(request.user, 'ADD', 'category.added', category, name=category.name)
                 messages.success(request, 'Модель добавлена.')
                 return redirect('category_manage')
             else:
@@ -1127,7 +1348,7 @@ def category_manage(request):
                 subcategory = subcategory_form.save(commit=False)
                 subcategory.owner = request.user
                 subcategory.save()
-                create_log_entry(request.user, 'ADD', f'Цвет "{subcategory.name}" добавлен пользователем {request.user.username}')
+                create_log_entry(request.user, 'ADD', 'subcategory.added', subcategory, name=subcategory.name)
                 messages.success(request, 'Цвет добавлен.')
                 return redirect('category_manage')
             else:
@@ -1150,7 +1371,7 @@ def category_edit(request, category_id):
         if form.is_valid():
             old_name = category.name
             category = form.save()
-            create_log_entry(request.user, 'UPDATE', f'Модель "{old_name}" обновлена на "{category.name}" пользователем {request.user.username}')
+            create_log_entry(request.user, 'UPDATE', 'category.updated', category, old_name=old_name, name=category.name)
             messages.success(request, 'Модель обновлена.')
             return redirect('category_manage')
         else:
@@ -1168,9 +1389,9 @@ def category_delete(request, category_id):
             messages.error(request, f'Нельзя удалить модель "{category.name}", так как с ней связаны товары.')
             return redirect('category_manage')
 
-        category_name = category.name
+        category_name, deleted_id = category.name, category.id
         category.delete()
-        create_log_entry(request.user, 'DELETE', f'Модель "{category_name}" удалена пользователем {request.user.username}')
+        create_log_entry(request.user, 'DELETE', 'category.deleted', category, object_id=deleted_id, name=category_name)
         messages.success(request, f'Модель "{category_name}" удалена.')
     return redirect('category_manage')
 
@@ -1185,7 +1406,7 @@ def subcategory_edit(request, subcategory_id):
         form = SubcategoryForm(request.POST, instance=subcategory, user=request.user)
         if form.is_valid():
             form.save()
-            create_log_entry(request.user, 'UPDATE', f'Цвет "{subcategory.name}" обновлен пользователем {request.user.username}')
+            create_log_entry(request.user, 'UPDATE', 'subcategory.updated', subcategory, name=subcategory.name)
             messages.success(request, 'Цвет обновлен.')
             return redirect('category_manage')
     else:
@@ -1201,9 +1422,9 @@ def subcategory_delete(request, subcategory_id):
             messages.error(request, f'Нельзя удалить цвет "{subcategory.name}", так как с ним связаны товары.')
             return redirect('category_manage')
 
-        subcategory_name = subcategory.name
+        subcategory_name, deleted_id = subcategory.name, subcategory.id
         subcategory.delete()
-        create_log_entry(request.user, 'DELETE', f'Цвет "{subcategory_name}" удален пользователем {request.user.username}')
+        create_log_entry(request.user, 'DELETE', 'subcategory.deleted', subcategory, object_id=deleted_id, name=subcategory_name)
         messages.success(request, f'Цвет "{subcategory_name}" удален.')
     return redirect('category_manage')
 
@@ -1211,6 +1432,36 @@ def subcategory_delete(request, subcategory_id):
 ### ADMIN PANEL (manual) ###
 ############################
 
+@user_passes_test(lambda u: u.is_superuser)
+def prometheus_metrics(request):
+    # Метрики этого процесса (inventory.metrics) в текстовом формате Prometheus
+    return HttpResponse(metrics.get_registry().render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@user_passes_test(lambda u: u.is_superuser)
+def profile_download(request, name):
+    path = profiling.profile_file(name, '.prof')
+    if path is None:
+        raise Http404('Профиль не найден')
+    return FileResponse(path.open('rb'), as_attachment=True, filename=path.name)
+
+@user_passes_test(lambda u: u.is_superuser)
+def profile_summary(request, name):
+    path = profiling.profile_file(name, '.txt')
+    if path is None:
+        raise Http404('Профиль не найден')
+    return HttpResponse(path.read_text(encoding='utf-8'), content_type='text/plain; charset=utf-8')
+
+@user_passes_test(lambda u: u.is_superuser)
+def memory_diagnostics(request):
+    if request.method == 'POST':
+        memory.registry.reset()
+        messages.success(request, 'Статистика памяти сброшена.')
+        return redirect('memory_diagnostics')
+    return render(request, 'memory_diagnostics.html', {
+        'enabled': memory.memory_settings()['ENABLED'],
+        'rows': memory.registry.rows(),
+    })
+
 @user_passes_test(lambda u: u.is_superuser)
 def admin_panel(request):
     if request.method == 'POST':
@@ -1225,27 +1476,31 @@ def admin_panel(request):
                 user_settings.is_pending = False
                 user_settings.save()
                 user.save()
-                create_log_entry(request.user, 'APPROVE', f'Регистрация пользователя {user.username} подтверждена администратором {request.user.username}')
+                create_log_entry(request.user, 'APPROVE', 'user.approved', user, target=user.username)
                 messages.success(request, f'Регистрация пользователя {user.username} подтверждена.')
             elif action == 'reject' and user_settings.is_pending:
-                create_log_entry(request.user, 'REJECT', f'Регистрация пользователя {user.username} отклонена администратором {request.user.username}')
+                create_log_entry(request.user, 'REJECT', 'user.rejected', user, target=user.username)
                 user.delete()
                 messages.success(request, f'Запрос на регистрацию пользователя {user.username} отклонён.')
             elif action == 'block' and not user_settings.is_pending:
                 user.is_active = False
                 user.save()
-                create_log_entry(request.user, 'BLOCK', f'Пользователь {user.username} заблокирован администратором {request.user.username}')
+                create_log_entry(request.user, 'BLOCK', 'user.blocked', user, target=user.username)
                 messages.success(request, f'Пользователь {user.username} заблокирован.')
             elif action == 'unblock' and not user_settings.is_pending:
                 user.is_active = True
                 user.save()
-                create_log_entry(request.user, 'UNBLOCK', f'Пользователь {user.username} разблокирован администратором {request.user.username}')
+                create_log_entry(request.user, 'UNBLOCK', 'user.unblocked', user, target=user.username)
                 messages.success(request, f'Пользователь {user.username} разблокирован.')
             elif action == 'delete' and not user_settings.is_pending:
-                create_log_entry(request.user, 'DELETE', f'Пользователь {user.username} удалён администратором {request.user.username}')
+                create_log_entry(request.user, 'DELETE', 'user.deleted', user, target=user.username)
                 user.delete()
                 messages.success(request, f'Пользователь {user.username} удален.')
             return redirect('admin_panel')
+        if 'clear_slow_queries' in request.POST:
+            slowqueries.get_log().clear()
+            messages.success(request, 'Журнал медленных запросов очищен.')
+            return redirect('admin_panel')
 
     # Запросы на регистрацию (pending_users)
     pending_users = User.objects.filter(usersettings__is_pending=True)
@@ -1370,6 +1625,9 @@ def admin_panel(request):
         'categories': categories,
         'total_products': total_products,
         'total_warehouses': total_warehouses,
+        'slow_queries_enabled': slowqueries.slow_query_settings()['ENABLED'],
+        'slow_queries': slowqueries.get_log().snapshot(),
+        'profiles': profiling.list_profiles(),
     })
 
 ############
@@ -1377,15 +1635,16 @@ def admin_panel(request):
 ############
 
 @login_required
+@use_replica
 def logs(request):
     # Определяем, является ли пользователь админом
     is_admin = request.user.is_superuser
 
     # Фильтруем логи: админ видит все, обычный пользователь — только свои
     if is_admin:
-        logs = LogEntry.objects.all()
+        logs = LogEntry.objects.select_related('user')
     else:
-        logs = LogEntry.objects.filter(user=request.user)
+        logs = LogEntry.objects.filter(user=request.user).select_related('user')
 
     user_filter = request.GET.get('user', '')
     action_type = request.GET.get('action_type', '')
@@ -1424,20 +1683,21 @@ def logs(request):
         'user__username', '-user__username',
         'action_type', '-action_type',
     ]
-    if sort_by in allowed_sort_fields:
-        logs = logs.order_by(sort_by)
-    else:
-        logs = logs.order_by('-timestamp')  # Default ordering
+    ordering = (sort_by, '-id') if sort_by in allowed_sort_fields else ('-timestamp', '-id')  # Default ordering
 
-    # Пагинация
-    paginator = Paginator(logs, 20)  # 20 логов на страницу
-    page_number = request.GET.get('page', 1)
-    try:
-        logs_paginated = paginator.page(page_number)
-    except PageNotAnInteger:
-        logs_paginated = paginator.page(1)
-    except EmptyPage:
-        logs_paginated = paginator.page(paginator.num_pages)
+    # Пагинация: лента по времени — курсором «новее/старее» по индексам (timestamp, id) и (user, timestamp)
+    # без COUNT и OFFSET; по остальным полям — страницами с кэшированным количеством
+    if ordering[0].lstrip('-') == 'timestamp':
+        logs_paginated = cursor_paginate(logs, ordering, request.GET.get('cursor'), 20)  # 20 логов на страницу
+    else:
+        paginator = CachedCountPaginator(logs.order_by(*ordering), 20, count_cache_key('logs', request))
+        page_number = request.GET.get('page', 1)
+        try:
+            logs_paginated = paginator.page(page_number)
+        except PageNotAnInteger:
+            logs_paginated = paginator.page(1)
+        except EmptyPage:
+            logs_paginated = paginator.page(paginator.num_pages)
 
     # Передаём полный список кортежей ACTION_TYPES
     action_types = LogEntry.ACTION_TYPES
@@ -1455,6 +1715,25 @@ def logs(request):
         'sort_by': sort_by,
         'users': users,
         'is_admin': is_admin,
+        'query_string': navigation_query_string(request),
+    })
+
+@login_required
+def object_history(request, object_type, object_id):
+    # История объекта по индексам logentry_object_idx / logentry_product_idx вместо поиска по тексту сообщений
+    object_types = dict(LogEntry.OBJECT_TYPES)
+    if object_type not in object_types:
+        raise Http404('Неизвестный тип объекта')
+    logs = LogEntry.history(object_type, object_id)
+    if not request.user.is_superuser:
+        logs = logs.filter(user=request.user)
+    logs_paginated = cursor_paginate(logs, ('-timestamp', '-id'), request.GET.get('cursor'), 20)
+    return render(request, 'object_history.html', {
+        'logs': logs_paginated,
+        'object_type': object_type,
+        'object_type_label': object_types[object_type],
+        'object_id': object_id,
+        'is_admin': request.user.is_superuser,
     })
 
 @user_passes_test(lambda u: u.is_superuser)
@@ -0,0 +1,72 @@
+// Поле выбора товара с подсказками (ProductSearchWidget в inventory/forms.py)
+function initProductSearch(root = document) {
+    root.querySelectorAll('.product-search').forEach(container => {
+        if (container.dataset.ready) return;
+        container.dataset.ready = 'true';
+
+        const hiddenInput = container.querySelector('input[type="hidden"]');
+        const searchInput = container.querySelector('.product-search-input');
+        const results = container.querySelector('.product-search-results');
+        let timer = null;
+        let lastQuery = '';
+
+        function clearResults() {
+            results.innerHTML = '';
+        }
+
+        function choose(product) {
+            hiddenInput.value = product.id;
+            searchInput.value = product.name;
+            clearResults();
+            hiddenInput.dispatchEvent(new CustomEvent('product:selected', { detail: product, bubbles: true }));
+        }
+
+        async function search() {
+            const query = searchInput.value.trim();
+            lastQuery = query;
+            if (!query) {
+                clearResults();
+                return;
+            }
+            try {
+                const response = await fetch(`${container.dataset.url}?q=${encodeURIComponent(query)}`);
+                const data = await response.json();
+                // Ответ на устаревший запрос не перерисовывает подсказки
+                if (query !== lastQuery) return;
+                clearResults();
+                (data.results || []).forEach(product => {
+                    const option = document.createElement('button');
+                    option.type = 'button';
+                    option.className = 'list-group-item list-group-item-action';
+                    option.textContent = `${product.name} (остаток: ${product.quantity}, ${product.selling_price} сом)`;
+                    option.addEventListener('click', () => choose(product));
+                    results.appendChild(option);
+                });
+                if (!results.children.length) {
+                    const empty = document.createElement('div');
+                    empty.className = 'list-group-item text-muted';
+                    empty.textContent = 'Товары не найдены';
+                    results.appendChild(empty);
+                }
+            } catch (error) {
+                console.error('Ошибка поиска товара:', error);
+            }
+        }
+
+        searchInput.addEventListener('input', function() {
+            hiddenInput.value = '';
+            clearTimeout(timer);
+            timer = setTimeout(search, 250);
+        });
+
+        document.addEventListener('click', function(event) {
+            if (!container.contains(event.target)) clearResults();
+        });
+    });
+}
+
+if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', () => initProductSearch());
+} else {
+    initProductSearch();
+}